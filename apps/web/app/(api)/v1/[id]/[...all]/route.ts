@@ -6,6 +6,12 @@ import { after, type NextRequest, NextResponse } from "next/server";
 // Node
 import { Readable } from "node:stream";
 
+// The binary framing the Python services use when asked for it, passed through as-is
+const FRAME_TYPE = "application/x-inference-frame";
+// Endpoints like video-dl's /bulk stream one JSON event per line, passed through as they arrive
+const NDJSON_TYPE = "application/x-ndjson";
+const STREAMED_TYPES = [FRAME_TYPE, NDJSON_TYPE];
+
 const handleRequest = async (
 	request: NextRequest,
 	{
@@ -105,8 +111,6 @@ const handleRequest = async (
 			duplex: "half",
 		});
 
-		const responseBody = await response.json();
-
 		const success = response.ok;
 
 		// if we're a success, we need to charge the user the price of the API
@@ -118,6 +122,27 @@ const handleRequest = async (
 			});
 		}
 
+		// Frames and NDJSON streams are passed back as they arrive without parsing them
+		const contentType = response.headers.get("content-type") ?? "";
+		const streamedType = STREAMED_TYPES.find((type) => contentType.startsWith(type));
+		if (streamedType) {
+			return new NextResponse(response.body, {
+				status: response.status,
+				headers: { "content-type": streamedType },
+			});
+		}
+
+		// Services shed requests with a 503 when they're overloaded, keep it and when to retry so callers back off
+		if (response.status === 503) {
+			const retryAfter = response.headers.get("retry-after");
+			return NextResponse.json(await response.json(), {
+				status: 503,
+				headers: retryAfter ? { "retry-after": retryAfter } : undefined,
+			});
+		}
+
+		const responseBody = await response.json();
+
 		// Try to parse the response as JSON, fallback to text if it fails
 		let parsedResponse: Record<string, unknown>;
 		try {
@@ -0,0 +1,10 @@
+from .controller import MAX_RETRY_AFTER, PRIORITIES, AdmissionController, AdmissionMetrics, Overloaded, Slot
+
+__all__ = [
+    'MAX_RETRY_AFTER',
+    'PRIORITIES',
+    'AdmissionController',
+    'AdmissionMetrics',
+    'Overloaded',
+    'Slot',
+]
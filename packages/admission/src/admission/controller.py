@@ -0,0 +1,210 @@
+import math
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+# Priority classes, highest first. Requests waiting for a slot are let in by priority, then in arrival order
+PRIORITIES = ('high', 'default', 'low')
+RANKS = {priority: rank for rank, priority in enumerate(PRIORITIES)}
+
+# Longest Retry-After sent back by default, in seconds
+MAX_RETRY_AFTER = 60
+
+
+class Overloaded(Exception):
+    """A request turned away because the service is busy, with the seconds to wait before retrying"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+class AdmissionMetrics:
+    """
+    Where the controller reports to, each service names its own: a gauge of the requests holding a slot,
+    a gauge and a histogram by priority for the queue's depth and the time waited, and a counter by
+    priority and reason for the requests shed. prometheus_client's metrics fit.
+    """
+
+    __slots__ = ('active', 'queue_depth', 'shed', 'wait_seconds')
+
+    def __init__(self, active, queue_depth, shed, wait_seconds):
+        self.active = active
+        self.queue_depth = queue_depth
+        self.shed = shed
+        self.wait_seconds = wait_seconds
+
+
+class _Waiter:
+    __slots__ = ('rank', 'sequence', 'priority', 'event', 'granted')
+
+    def __init__(self, rank, sequence, priority):
+        self.rank = rank
+        self.sequence = sequence
+        self.priority = priority
+        self.event = threading.Event()
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.rank, self.sequence) < (other.rank, other.sequence)
+
+
+class Slot:
+    """A request's place among the ones running, released once when the request is done"""
+
+    __slots__ = ('controller', 'started', 'released')
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.started = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(time.perf_counter() - self.started)
+
+
+class AdmissionController:
+    """
+    Bounds how many requests a service works on at once. Requests over the limit wait in a bounded queue,
+    higher priorities first, and are turned away with a 503 and a Retry-After when the queue is full or
+    they've waited longer than `queue_timeout`, so a burst is shed straight away instead of slowing every
+    request down until the proxy gives up. Lower priorities can only fill part of the queue, which keeps
+    room for the higher ones: `low` a third of it, `default` two thirds and `high` all of it.
+
+    Shed requests raise `overloaded(message, retry_after)`, Overloaded unless a service has its own error.
+    A concurrency of 0 admits everything, for running without limits.
+    """
+
+    def __init__(self, concurrency, queue_size, queue_timeout, metrics=None, overloaded=Overloaded,
+                 max_retry_after=MAX_RETRY_AFTER):
+        self.concurrency = max(0, concurrency)
+        self.queue_size = max(0, queue_size)
+        self.queue_timeout = queue_timeout
+        self.metrics = metrics
+        self.overloaded = overloaded
+        self.max_retry_after = max(1, max_retry_after)
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = []
+        self._depth = dict.fromkeys(PRIORITIES, 0)
+        self._sequence = itertools.count()
+        self._admitted = 0
+        self._shed = {priority: {'queue_full': 0, 'deadline': 0} for priority in PRIORITIES}
+
+        # A moving average of how long requests hold a slot, used to say when to retry
+        self._service_seconds = None
+
+    def queue_limit(self, priority):
+        """How many waiting requests a priority can join"""
+        return math.ceil(self.queue_size * (len(PRIORITIES) - RANKS[priority]) / len(PRIORITIES))
+
+    def retry_after(self):
+        """Seconds until a shed request is likely to get in, from the queue's length and how long requests take"""
+        if not self._service_seconds or not self.concurrency:
+            return 1
+        seconds = self._service_seconds * (len(self._waiting) + 1) / self.concurrency
+        return max(1, min(self.max_retry_after, math.ceil(seconds)))
+
+    def acquire(self, priority='default'):
+        """Wait for a slot, raising the overloaded error if the request is shed. Returns the slot to release"""
+        if priority not in RANKS:
+            raise ValueError(f"Unknown priority: {priority}")
+        if not self.concurrency:
+            return Slot(self)
+
+        started = time.perf_counter()
+        with self._lock:
+            if self._active < self.concurrency and not self._waiting:
+                self._active += 1
+                self._admitted += 1
+                self._set_active()
+                self._observe_wait(priority, 0)
+                return Slot(self)
+
+            if len(self._waiting) >= self.queue_limit(priority):
+                raise self._shed_request(priority, 'queue_full')
+
+            waiter = _Waiter(RANKS[priority], next(self._sequence), priority)
+            heapq.heappush(self._waiting, waiter)
+            self._set_depth(priority, 1)
+
+        waiter.event.wait(self.queue_timeout)
+
+        with self._lock:
+            if not waiter.granted:
+                # Past its deadline, it's dropped before any work is done for it
+                self._waiting.remove(waiter)
+                heapq.heapify(self._waiting)
+                self._set_depth(priority, -1)
+                raise self._shed_request(priority, 'deadline')
+
+        self._observe_wait(priority, time.perf_counter() - started)
+        return Slot(self)
+
+    @contextmanager
+    def admit(self, priority='default'):
+        """Hold a slot while the code inside a with block runs"""
+        slot = self.acquire(priority)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def _release(self, seconds):
+        if not self.concurrency:
+            return
+
+        with self._lock:
+            self._service_seconds = seconds if self._service_seconds is None \
+                else self._service_seconds * 0.9 + seconds * 0.1
+
+            if self._waiting:
+                # The slot goes straight to the next request rather than back to the pool
+                waiter = heapq.heappop(self._waiting)
+                waiter.granted = True
+                self._admitted += 1
+                self._set_depth(waiter.priority, -1)
+                waiter.event.set()
+            else:
+                self._active -= 1
+                self._set_active()
+
+    def _set_active(self):
+        if self.metrics:
+            self.metrics.active.set(self._active)
+
+    def _observe_wait(self, priority, seconds):
+        if self.metrics:
+            self.metrics.wait_seconds.labels(priority).observe(seconds)
+
+    def _set_depth(self, priority, change):
+        self._depth[priority] += change
+        if self.metrics:
+            self.metrics.queue_depth.labels(priority).set(self._depth[priority])
+
+    def _shed_request(self, priority, reason):
+        self._shed[priority][reason] += 1
+        if self.metrics:
+            self.metrics.shed.labels(priority, reason).inc()
+        message = "The service is busy, please try again shortly." if reason == 'queue_full' \
+            else "The request waited too long for the service to be free, please try again shortly."
+        return self.overloaded(message, self.retry_after())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'concurrency': self.concurrency,
+                'queue_size': self.queue_size,
+                'queue_timeout': self.queue_timeout,
+                'active': self._active,
+                'waiting': dict(self._depth),
+                'admitted': self._admitted,
+                'shed': {priority: dict(counts) for priority, counts in self._shed.items()},
+                'avg_service_ms': round(self._service_seconds * 1000, 2) if self._service_seconds else None,
+            }
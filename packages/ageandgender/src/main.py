@@ -1,90 +1,69 @@
 import os
-import cv2
-import base64
-import numpy as np
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from inference_core import (
+    AGES, GENDERS, MODEL_MEAN_VALUES, ModelPool, Pipeline, Settings, configure_threads, create_app,
+    create_batcher, decode_image, detect_faces, encode_image, face_crop, lazy_import, serve, stage
+)
 load_dotenv()
 
-DEBUG_MODE = os.getenv('AGEANDGENDER_DEBUG', 'false').lower() == 'true'
-DIR = os.path.dirname(__file__)
-FACE_PADDING = 20
-AGES = ['(0-2)', '(4-6)', '(8-12)', '(15-20)',
-        '(25-32)', '(38-43)', '(48-53)', '(60-100)']
-GENDERS = ['Male', 'Female']
-
-app = Flask(__name__)
-
-
-def highlight_face(net, frame, conf_threshold=0.7):
-    frame = frame.copy()
-    height = frame.shape[0]
-    width = frame.shape[1]
-    blob = cv2.dnn.blobFromImage(frame, 1.0, (300, 300), [
-                                 104, 117, 123], True, False)
-
-    net.setInput(blob)
-    detections = net.forward()
-    faces = []
-    for i in range(detections.shape[2]):
-        confidence = detections[0, 0, i, 2]
-        if confidence > conf_threshold:
-            x1 = int(detections[0, 0, i, 3]*width)
-            y1 = int(detections[0, 0, i, 4]*height)
-            x2 = int(detections[0, 0, i, 5]*width)
-            y2 = int(detections[0, 0, i, 6]*height)
-            faces.append([x1, y1, x2, y2])
-            cv2.rectangle(frame, (x1, y1), (x2, y2),
-                          (0, 255, 0), 2)
-    return frame, faces
-
-
-def detect_age_gender(image):
-    face_proto = f"{DIR}/models/opencv_face_detector.pbtxt"
-    face_model = f"{DIR}/models/opencv_face_detector_uint8.pb"
-    age_proto = f"{DIR}/models/age_deploy.prototxt"
-    age_model = f"{DIR}/models/age_net.caffemodel"
-    gender_proto = f"{DIR}/models/gender_deploy.prototxt"
-    gender_model = f"{DIR}/models/gender_net.caffemodel"
-
-    MODEL_MEAN_VALUES = (78.4263377603, 87.7689143744, 114.895847746)
+# Imported when the nets load, so the app can answer /health straight away
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
 
-    face_net = cv2.dnn.readNet(face_model, face_proto)
-    age_net = cv2.dnn.readNet(age_model, age_proto)
-    gender_net = cv2.dnn.readNet(gender_model, gender_proto)
-
-    file_bytes = np.frombuffer(image.read(), np.uint8)
-    frame = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-    frame, faces = highlight_face(face_net, frame)
+settings = Settings('AGEANDGENDER', 7003)
+DIR = os.path.dirname(__file__)
 
-    result = []
 
-    for face in faces:
+def load_nets():
+    configure_threads(settings)
+    return {
+        "face": cv2.dnn.readNet(f"{DIR}/models/opencv_face_detector_uint8.pb",
+                                f"{DIR}/models/opencv_face_detector.pbtxt"),
+        "age": cv2.dnn.readNet(f"{DIR}/models/age_net.caffemodel",
+                               f"{DIR}/models/age_deploy.prototxt"),
+        "gender": cv2.dnn.readNet(f"{DIR}/models/gender_net.caffemodel",
+                                  f"{DIR}/models/gender_deploy.prototxt"),
+    }
+
+
+def warmup(nets):
+    """Run a blank image through every net so the first request doesn't pay for it"""
+    detect_age_gender(nets, [np.zeros((300, 300, 3), np.uint8)])
+    blob = cv2.dnn.blobFromImage(
+        np.zeros((227, 227, 3), np.uint8), 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False)
+    for name in ('age', 'gender'):
+        nets[name].setInput(blob)
+        nets[name].forward()
+
+
+def detect_age_gender(nets, frames):
+    """Detect the faces in a batch of frames, then the age and gender of every face at once"""
+    # The SSD face detector only takes one frame at a time, the age and gender nets take any number of faces
+    faces = [detect_faces(nets["face"], frame) for frame in frames]
+
+    crops = []
+    owners = []
+    for index, (frame, frame_faces) in enumerate(zip(frames, faces)):
+        for face in frame_faces:
+            crops.append(face_crop(frame, face["box"]))
+            owners.append((index, face["box"]))
+
+    results = [[] for _ in frames]
+    if not crops:
+        return results
+
+    blob = cv2.dnn.blobFromImages(
+        crops, 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False)
+    nets["gender"].setInput(blob)
+    gender_preds = nets["gender"].forward()
+    nets["age"].setInput(blob)
+    age_preds = nets["age"].forward()
+
+    for (index, face), gender_pred, age_pred in zip(owners, gender_preds, age_preds):
         x1, y1, x2, y2 = face
-        face_img = frame[max(0, y1-FACE_PADDING):
-                         min(y2+FACE_PADDING, frame.shape[0]-1),
-                         max(0, x1-FACE_PADDING):
-                         min(x2+FACE_PADDING, frame.shape[1]-1)]
-
-        blob = cv2.dnn.blobFromImage(
-            face_img, 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False)
-        gender_net.setInput(blob)
-        gender_preds = gender_net.forward()
-        # print(gender_preds[0]) # [0.18877535 0.81122464]
-        gender = GENDERS[int(gender_preds[0].argmax())]
-
-        age_net.setInput(blob)
-        age_preds = age_net.forward()
-        # print(age_preds[0]) # [3.5946396e-05 2.8284523e-04 7.9400726e-02 6.2793056e-03 9.1232586e-01 3.0149089e-04 1.2374012e-03 1.3641208e-04]
-        age = AGES[int(age_preds[0].argmax())]
-
-        cv2.putText(frame, f'{gender}, {age}', (x1, y1 - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-        result.append({
-            "gender": gender,
-            "age": age,
+        results[index].append({
+            "gender": GENDERS[int(gender_pred.argmax())],
+            "age": AGES[int(age_pred.argmax())],
             "bounds": {
                 "x1": x1,
                 "y1": y1,
@@ -93,49 +72,40 @@ def detect_age_gender(image):
             }
         })
 
-    image_bytes = cv2.imencode('.jpg', frame)[1].tobytes()
-    image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+    return results
 
-    return jsonify({
-        "success": True,
-        "faces": result,
-        "image": image_base64
-    }), 200
 
+def preprocess(upload):
+    return decode_image(upload.data, cv2.IMREAD_COLOR)
 
-@app.route('/infer', methods=['POST'])
-def infer():
-    if 'image' not in request.files:
-        return jsonify({
-            "error": "You haven’t included an image in the `image` parameter.",
-            "success": False
-        }), 400
 
-    image = request.files['image']
-
-    if image.filename == '':
-        return jsonify({
-            "error": "The file you have uploaded is invalid.",
-            "success": False
-        }), 400
+def postprocess(frame, faces):
+    """Outline each face and label it with its age and gender"""
+    with stage('draw'):
+        frame = frame.copy()
+        for face in faces:
+            bounds = face["bounds"]
+            x1, y1 = bounds["x1"], bounds["y1"]
+            cv2.rectangle(frame, (x1, y1), (bounds["x2"], bounds["y2"]),
+                          (0, 255, 0), 2)
+            cv2.putText(frame, f'{face["gender"]}, {face["age"]}', (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
 
-    try:
-        return detect_age_gender(image)
-    except Exception as e:
-        return jsonify({
-            "error": str(e),
-            "success": False
-        }), 500
+    return {
+        "faces": faces,
+        "image": encode_image(frame)
+    }
 
 
-@app.route('/health', methods=['GET'])
-def health():
-    return jsonify({
-        "success": True,
-        "message": "OK"
-    }), 200
+pipeline = Pipeline(
+    ModelPool(load_nets, settings.pool_size, warmup, name='ageandgender'),
+    detect_age_gender,
+    preprocess=preprocess,
+    postprocess=postprocess,
+    batcher=create_batcher(settings)
+)
+app = create_app(__name__, pipeline, settings)
 
 
 if __name__ == '__main__':
-    port = int(os.getenv('AGEANDGENDER_PORT', 7003))
-    app.run(host='0.0.0.0', port=port, debug=DEBUG_MODE)
+    serve(app, settings)
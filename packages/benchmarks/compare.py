@@ -0,0 +1,90 @@
+"""
+Compare two benchmark results and flag regressions.
+
+Exits with a non-zero status if anything got worse by more than the threshold,
+so it can gate a CI job:
+
+    python compare.py baseline.json results.json --threshold 0.1
+"""
+import sys
+import json
+import argparse
+
+# Latency percentiles that are compared for each concurrency level
+PERCENTILES = ('p50', 'p95', 'p99')
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def change(before, after):
+    """Relative change from before to after, None if it can't be worked out"""
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before
+
+
+def compare(baseline, current, threshold):
+    """Returns a row per metric and whether it regressed"""
+    rows = []
+
+    def add(name, before, after, higher_is_better=False):
+        delta = change(before, after)
+        regressed = delta is not None and (-delta if higher_is_better else delta) > threshold
+        rows.append({'metric': name, 'before': before, 'after': after,
+                     'change': delta, 'regressed': regressed})
+
+    levels = {level['concurrency']: level for level in baseline['levels']}
+    for level in current['levels']:
+        before = levels.get(level['concurrency'])
+        if before is None:
+            continue
+        prefix = f"c{level['concurrency']}"
+        for percentile in PERCENTILES:
+            add(f"{prefix} {percentile} ms", before['latency_ms'][percentile], level['latency_ms'][percentile])
+        add(f"{prefix} throughput", before['throughput'], level['throughput'], higher_is_better=True)
+        add(f"{prefix} errors", before['errors'], level['errors'])
+        # Any new errors count, even when there were none before
+        rows[-1]['regressed'] = level['errors'] > before['errors']
+
+    if baseline.get('cold_start') and current.get('cold_start'):
+        add('cold start s', baseline['cold_start']['seconds'], current['cold_start']['seconds'])
+        add('ready s', baseline['cold_start'].get('ready_seconds'), current['cold_start'].get('ready_seconds'))
+        add('cold start RSS MB', baseline['cold_start']['peak_rss_mb'], current['cold_start']['peak_rss_mb'])
+    add('peak RSS MB', baseline.get('peak_rss_mb'), current.get('peak_rss_mb'))
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative change that counts as a regression (default: 0.1)')
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    if baseline['target'] != current['target']:
+        sys.exit(f"Can't compare {baseline['target']} with {current['target']}")
+    if baseline['environment'].get('machine') != current['environment'].get('machine'):
+        print("warning: the results are from different machines", file=sys.stderr)
+
+    rows = compare(baseline, current, args.threshold)
+
+    print(f"{'METRIC':<22} {'BEFORE':>10} {'AFTER':>10} {'CHANGE':>8}")
+    for row in rows:
+        delta = f"{row['change'] * 100:+.1f}%" if row['change'] is not None else '-'
+        flag = '  REGRESSION' if row['regressed'] else ''
+        print(f"{row['metric']:<22} {row['before']!s:>10} {row['after']!s:>10} {delta:>8}{flag}")
+
+    regressions = [row for row in rows if row['regressed']]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold * 100:.0f}%")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+The image corpus for the model APIs.
+
+It's built from the example images in `.github` so it's the same on every
+machine: faces and NSFW images at several resolutions, a 2x2 tile for several
+faces in one image, and seeded gradients and noise for SFW images with no faces.
+"""
+import os
+import cv2
+import numpy as np
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '.github')
+
+FACE_IMAGE = os.path.join(EXAMPLES, 'ageandgender', 'example_input.jpg')
+NSFW_IMAGE = os.path.join(EXAMPLES, 'nudenet', 'example_input.jpg')
+
+FACE_WIDTHS = (320, 640, 1280, 1920)
+NSFW_WIDTHS = (320, 640, 1280)
+SFW_SIZES = ((640, 480), (1920, 1080))
+
+
+class Sample:
+    """An encoded image and what's in it"""
+
+    def __init__(self, name, kind, image, faces=0, nsfw=False):
+        self.name = name
+        self.kind = kind
+        self.height, self.width = image.shape[:2]
+        self.faces = faces
+        self.nsfw = nsfw
+        self.data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'width': self.width,
+            'height': self.height,
+            'faces': self.faces,
+            'nsfw': self.nsfw,
+            'bytes': len(self.data),
+        }
+
+
+def _read(path):
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise FileNotFoundError(f"Couldn't read the example image at {path}")
+    return image
+
+
+def _resize(image, width):
+    height = round(image.shape[0] * width / image.shape[1])
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def _sfw(width, height, seed):
+    """A gradient with some noise on top, which has no faces or nudity in it"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.stack([np.broadcast_to(x, (height, width)),
+                      np.broadcast_to(y, (height, width)),
+                      np.full((height, width), 128, np.float32)], axis=2)
+    image += rng.normal(0, 24, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def build_corpus(kinds=None, seed=0):
+    """Build the corpus, optionally only the given kinds (face, faces, nsfw and sfw)"""
+    kinds = set(kinds or ('face', 'faces', 'nsfw', 'sfw'))
+    samples = []
+
+    if kinds & {'face', 'faces'}:
+        face = _read(FACE_IMAGE)
+        if 'face' in kinds:
+            samples += [Sample(f'face-{width}', 'face', _resize(face, width), faces=1)
+                        for width in FACE_WIDTHS]
+        if 'faces' in kinds:
+            tile = _resize(face, 640)
+            samples.append(Sample('faces-4', 'faces', np.vstack([np.hstack([tile, tile])] * 2), faces=4))
+
+    if 'nsfw' in kinds:
+        nsfw = _read(NSFW_IMAGE)
+        samples += [Sample(f'nsfw-{width}', 'nsfw', _resize(nsfw, width), nsfw=True)
+                    for width in NSFW_WIDTHS]
+
+    if 'sfw' in kinds:
+        samples += [Sample(f'sfw-{width}x{height}', 'sfw', _sfw(width, height, seed + i))
+                    for i, (width, height) in enumerate(SFW_SIZES)]
+
+    return samples
@@ -0,0 +1,128 @@
+"""
+Load generation and statistics shared by every benchmark target.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, q):
+    """The q-th percentile of some values, interpolating between the closest ranks"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(seconds):
+    """Latency percentiles in milliseconds"""
+    milliseconds = [value * 1000 for value in seconds]
+    return {
+        'p50': _round(percentile(milliseconds, 50)),
+        'p95': _round(percentile(milliseconds, 95)),
+        'p99': _round(percentile(milliseconds, 99)),
+        'mean': _round(sum(milliseconds) / len(milliseconds)) if milliseconds else None,
+        'max': _round(max(milliseconds, default=None)),
+    }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident memory of this process, ru_maxrss is in bytes on macOS and KB elsewhere"""
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def is_error(status):
+    """Client errors such as "no face found" are expected answers, failures and 5xx aren't"""
+    return not status.isdigit() or int(status) >= 500
+
+
+def timed(call):
+    """Run a request, returns its status code and how long it took"""
+    started = time.perf_counter()
+    status = call()
+    return status, time.perf_counter() - started
+
+
+def run_level(requests, concurrency, count):
+    """
+    Send `count` requests from `concurrency` threads, cycling through the
+    target's requests, and summarize the latencies and throughput.
+    """
+    jobs = [requests[i % len(requests)] for i in range(count)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda job: timed(job['call']), jobs))
+    elapsed = time.perf_counter() - started
+
+    statuses = {}
+    by_kind = {}
+    for job, (status, seconds) in zip(jobs, results):
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        by_kind.setdefault(job['kind'], []).append(seconds)
+
+    return {
+        'concurrency': concurrency,
+        'requests': count,
+        'seconds': round(elapsed, 3),
+        'throughput': round(count / elapsed, 2),
+        'statuses': statuses,
+        'errors': sum(n for status, n in statuses.items() if is_error(status)),
+        'latency_ms': summarize([seconds for _, seconds in results]),
+        'kinds': {kind: summarize(values) for kind, values in sorted(by_kind.items())},
+    }
+
+
+def environment():
+    """Where the benchmark was run, so results from different machines aren't compared blindly"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'commit': commit,
+    }
+
+
+def write_results(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+
+
+def print_results(results):
+    cold = results.get('cold_start')
+    if cold:
+        print(f"cold start: {cold['seconds']:.2f}s (import {cold['import_seconds']:.2f}s, "
+              f"ready {cold['ready_seconds']:.2f}s, first request {cold['first_request_seconds']:.2f}s, "
+              f"peak RSS {cold['peak_rss_mb']} MB)")
+        for step, seconds in sorted(cold.get('steps', {}).items(), key=lambda item: -item[1]):
+            print(f"  {step:<30} {seconds:>8.3f}s")
+
+    print(f"{'CONCURRENCY':>11} {'REQUESTS':>8} {'REQ/S':>8} {'P50 MS':>9} {'P95 MS':>9} "
+          f"{'P99 MS':>9} {'ERRORS':>6}")
+    for level in results['levels']:
+        latency = level['latency_ms']
+        print(f"{level['concurrency']:>11} {level['requests']:>8} {level['throughput']:>8.2f} "
+              f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} "
+              f"{level['errors']:>6}")
+    print(f"peak RSS: {results['peak_rss_mb']} MB")
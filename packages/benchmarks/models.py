@@ -0,0 +1,157 @@
+"""
+Compare the accuracy and latency of NudeNet's model variants on the corpus.
+
+Every variant is loaded in one process and each image in the corpus is run
+through each variant's detector directly, without the HTTP layer around it.
+Detections are compared with the reference variant's (the first one unless
+another is given, so list the most accurate first): a detection matches when
+it has the same class and overlaps one of the reference's by the IoU. Whether
+each image is flagged is also compared with the corpus' own labels.
+
+    cd packages/nudenet-api
+    uv run --with onnx ../benchmarks/models.py \
+        --models 640m,640m-int8,320n,320n-int8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import environment, summarize  # noqa: E402
+from targets import TARGETS  # noqa: E402
+
+
+def iou(a, b):
+    """Intersection over union of two [x, y, w, h] boxes"""
+    width = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    height = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / (a[2] * a[3] + b[2] * b[3] - intersection)
+
+
+def match(reference, detections, threshold):
+    """Greedily match detections to the reference's, returns the true positives, false positives and misses"""
+    unmatched = list(reference)
+    matched = 0
+    for detection in sorted(detections, key=lambda d: -d['score']):
+        candidates = [(iou(detection['box'], other['box']), i) for i, other in enumerate(unmatched)
+                      if other['class'] == detection['class']]
+        best = max(candidates, default=(0, None))
+        if best[1] is not None and best[0] >= threshold:
+            unmatched.pop(best[1])
+            matched += 1
+    return matched, len(detections) - matched, len(unmatched)
+
+
+def ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--models', default='320n,320n-int8',
+                        help='Comma separated model variants to compare (default: 320n,320n-int8)')
+    parser.add_argument('--reference', help='The variant the others are compared with (default: the first)')
+    parser.add_argument('--repeat', type=int, default=5, help='Times each image is run to time it (default: 5)')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='Lowest score that counts as a detection and flags an image (default: 0.5)')
+    parser.add_argument('--iou', type=float, default=0.5, help='Overlap needed to match a detection (default: 0.5)')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    models = [model.strip() for model in args.models.split(',') if model.strip()]
+    reference = args.reference or models[0]
+    if reference not in models:
+        models.insert(0, reference)
+
+    # The service loads every variant it's given when it starts
+    os.environ['NUDENET_MODELS'] = ','.join(models)
+    os.environ['NUDENET_DEFAULT_MODEL'] = reference
+
+    target = TARGETS['nudenet']
+    target.setup(args)
+    app = target.load()
+    target.wait_ready(app)
+    service = target.module
+
+    import cv2
+    import numpy as np
+    images = [cv2.imdecode(np.frombuffer(sample.data, np.uint8), cv2.IMREAD_UNCHANGED) for sample in target.corpus]
+    censored = {label for label, censor in service.default_options_to_censor.items() if censor}
+
+    detections = {}
+    latencies = {}
+    with service.pipeline.pool.acquire() as detectors:
+        for model in models:
+            detector = detectors[model]
+            detector.detect(images[0])
+            detections[model] = []
+            latencies[model] = []
+            for image in images:
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    result = detector.detect(image)
+                    latencies[model].append(time.perf_counter() - started)
+                detections[model].append([d for d in result if d['score'] >= args.threshold])
+
+    def flagged(result):
+        return any(d['class'] in censored for d in result)
+
+    report = []
+    for model in models:
+        true_positives = false_positives = misses = 0
+        for expected, actual in zip(detections[reference], detections[model]):
+            tp, fp, fn = match(expected, actual, args.iou)
+            true_positives += tp
+            false_positives += fp
+            misses += fn
+
+        flags = [flagged(result) for result in detections[model]]
+        reference_flags = [flagged(result) for result in detections[reference]]
+        precision = ratio(true_positives, true_positives + false_positives)
+        recall = ratio(true_positives, true_positives + misses)
+        report.append({
+            'model': model,
+            'size_mb': round(os.path.getsize(service.model_path(model)) / 1024 / 1024, 2),
+            'latency_ms': summarize(latencies[model]),
+            'detections': sum(len(result) for result in detections[model]),
+            'precision': precision,
+            'recall': recall,
+            'f1': ratio(2 * precision * recall, precision + recall) if precision and recall else None,
+            'flag_agreement': ratio(sum(a == b for a, b in zip(flags, reference_flags)), len(flags)),
+            'label_accuracy': ratio(sum(flag == sample.nsfw for flag, sample in zip(flags, target.corpus)),
+                                    len(flags)),
+        })
+
+    print(f"{len(images)} images, compared with {reference}\n")
+    print(f"{'MODEL':<12} {'MB':>6} {'P50 MS':>8} {'P95 MS':>8} {'PREC':>6} {'RECALL':>6} {'F1':>6} "
+          f"{'FLAGS':>6} {'LABELS':>6}")
+
+    def cell(value):
+        return f'{value:>6.3f}' if value is not None else f"{'-':>6}"
+
+    for row in report:
+        print(f"{row['model']:<12} {row['size_mb']:>6.1f} {row['latency_ms']['p50']:>8.1f} "
+              f"{row['latency_ms']['p95']:>8.1f} {cell(row['precision'])} {cell(row['recall'])} "
+              f"{cell(row['f1'])} {cell(row['flag_agreement'])} {cell(row['label_accuracy'])}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'reference': reference,
+                'environment': environment(),
+                'settings': {key: value for key, value in os.environ.items() if key.startswith('NUDENET_')},
+                'threshold': args.threshold,
+                'iou': args.iou,
+                'corpus': [sample.describe() for sample in target.corpus],
+                'models': report,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark a service in-process: latency, throughput, peak memory and cold start.
+
+Run it from the service's package so its dependencies are installed:
+
+    cd packages/nudenet-api
+    uv run ../benchmarks/run.py nudenet --output results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import environment, peak_rss_mb, print_results, run_level, write_results  # noqa: E402
+from targets import TARGETS  # noqa: E402
+
+
+def cold_start_child(target, args):
+    """Load the service and send the first request, run in a fresh interpreter for each measurement"""
+    target.setup(args)
+    try:
+        started = time.perf_counter()
+        app = target.load()
+        imported = time.perf_counter()
+        target.wait_ready(app)
+        ready = time.perf_counter()
+        status = target.requests(app)[0]['call']()
+        finished = time.perf_counter()
+        steps = target.startup(app)
+    finally:
+        target.teardown()
+
+    print(json.dumps({
+        # Until the app can answer /health, then until the models are loaded and warmed up
+        'import_seconds': imported - started,
+        'ready_seconds': ready - started,
+        'first_request_seconds': finished - ready,
+        'status': str(status),
+        'peak_rss_mb': peak_rss_mb(),
+        'steps': steps,
+    }))
+
+
+def measure_cold_start(args, runs):
+    """Start the service in new processes, returns the median run including interpreter startup"""
+    command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], '--cold-start-child']
+    results = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = subprocess.run(command, capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+        if process.returncode != 0:
+            sys.exit(f"The service failed to start:\n{process.stderr}")
+
+        # Services may log to stdout, the measurement is always the last line
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        results.append({'seconds': round(elapsed, 3), **{
+            key: round(value, 3) if isinstance(value, float) else value for key, value in result.items()
+        }})
+
+    results.sort(key=lambda result: result['seconds'])
+    return {**results[len(results) // 2], 'runs': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('target', choices=sorted(TARGETS))
+    parser.add_argument('--concurrency', default='1,4,8',
+                        help='Comma separated concurrency levels (default: 1,4,8)')
+    parser.add_argument('--requests', type=int,
+                        help='Requests per concurrency level (default: 64, or 16 for video-dl)')
+    parser.add_argument('--warmup', type=int, default=4,
+                        help='Requests sent before measuring (default: 4)')
+    parser.add_argument('--cold-start-runs', type=int, default=3,
+                        help='Fresh processes to start for the cold start time, 0 skips it (default: 3)')
+    parser.add_argument('--bandwidth', type=float, default=32.0,
+                        help='video-dl: per-connection bandwidth limit in MB/s (default: 32)')
+    parser.add_argument('--file-size', type=int, default=8,
+                        help='video-dl: size of the progressive fixture in MB (default: 8)')
+    parser.add_argument('--segments', type=int, default=8,
+                        help='video-dl: number of 1MB HLS and DASH segments (default: 8)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--cold-start-child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    target = TARGETS[args.target]
+    if args.cold_start_child:
+        return cold_start_child(target, args)
+
+    concurrency = [int(level) for level in args.concurrency.split(',')]
+    count = args.requests or target.default_requests
+
+    cold_start = measure_cold_start(args, args.cold_start_runs) if args.cold_start_runs > 0 else None
+
+    target.setup(args)
+    try:
+        app = target.load()
+        target.wait_ready(app)
+        requests = target.requests(app)
+        for i in range(args.warmup):
+            requests[i % len(requests)]['call']()
+
+        levels = [run_level(requests, level, count) for level in concurrency]
+        details = target.describe()
+    finally:
+        target.teardown()
+
+    results = {
+        'target': args.target,
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'settings': {key: value for key, value in sorted(os.environ.items())
+                     if key.startswith(f'{target.prefix}_')},
+        'warmup': args.warmup,
+        'cold_start': cold_start,
+        'levels': levels,
+        'peak_rss_mb': peak_rss_mb(),
+        **details,
+    }
+
+    print_results(results)
+    if args.output:
+        write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Break down where a service spends its time importing modules at startup.
+
+Starts the service with `python -X importtime`, waits for its models to load
+(which imports the heavy modules in the background), and lists the top-level
+packages that took the longest to import. The loader thread imports alongside
+the service's own module, so time the service spends waiting on it for the GIL
+is counted as `main`.
+
+    cd packages/facelandmarks
+    uv run ../benchmarks/startup_profile.py facelandmarks
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from targets import TARGETS, VisionTarget  # noqa: E402
+
+VIDEO_ENV = {
+    'R2_ACCESS_KEY': 'benchmark',
+    'R2_SECRET_KEY': 'benchmark',
+    'R2_BUCKET_NAME': 'benchmark',
+    'R2_ENDPOINT': 'http://storage.invalid',
+    'R2_PUBLIC_URL': 'http://storage.invalid',
+}
+
+
+def startup_code(target):
+    """The code that starts the service, it returns once it's ready for requests"""
+    if isinstance(target, VisionTarget):
+        src = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', target.package, 'src'))
+        return f"import sys; sys.path.insert(0, {src!r}); import main; main.pipeline.pool.wait()"
+
+    src = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'video-dl', 'src'))
+    return f"import sys; sys.path.insert(0, {src!r}); import main"
+
+
+def parse_importtime(output):
+    """
+    Parse the `-X importtime` output, returns the microseconds spent importing
+    each top-level package, not counting the packages it imports.
+    """
+    packages = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        package = fields[2].strip().split('.', 1)[0]
+        packages[package] = packages.get(package, 0) + int(fields[0])
+
+    return sorted(packages.items(), key=lambda item: -item[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('target', choices=sorted(TARGETS))
+    parser.add_argument('--top', type=int, default=15, help='Number of packages to list (default: 15)')
+    parser.add_argument('--output', help='Write the breakdown as JSON to this file')
+    args = parser.parse_args()
+
+    target = TARGETS[args.target]
+    env = {**VIDEO_ENV, **os.environ} if args.target == 'video-dl' else os.environ
+
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', startup_code(target)],
+                             capture_output=True, text=True, env=env)
+    elapsed = time.perf_counter() - started
+    if process.returncode != 0:
+        sys.exit(f"The service failed to start:\n{process.stderr}")
+
+    packages = parse_importtime(process.stderr)
+    total = sum(us for _, us in packages)
+
+    print(f"started in {elapsed:.2f}s, {total / 1e6:.2f}s of it importing modules\n")
+    print(f"{'PACKAGE':<32} {'SECONDS':>8} {'SHARE':>6}")
+    for package, us in packages[:args.top]:
+        print(f"{package:<32} {us / 1e6:>8.3f} {us / total * 100 if total else 0:>5.1f}%")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'target': args.target,
+                'seconds': round(elapsed, 3),
+                'import_seconds': round(total / 1e6, 3),
+                'packages': {package: round(us / 1e6, 4) for package, us in packages},
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
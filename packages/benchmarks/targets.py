@@ -0,0 +1,151 @@
+"""
+The services that can be benchmarked.
+
+Each target loads a service's Flask app in this process and builds the requests
+to send through its test client, so nothing but the service itself is measured.
+"""
+import io
+import os
+import sys
+import shutil
+import tempfile
+import itertools
+import importlib.util
+
+PACKAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+class VisionTarget:
+    """One of the model APIs, benchmarked with the image corpus"""
+
+    def __init__(self, name, package, prefix, kinds, options=None):
+        self.name = name
+        self.package = package
+        self.prefix = prefix
+        self.kinds = kinds
+        self.options = options or {}
+        self.default_requests = 64
+        self.corpus = []
+        self.module = None
+
+    def setup(self, args):
+        from corpus import build_corpus
+        self.corpus = build_corpus(self.kinds)
+
+    def load(self):
+        """Import the service, which starts loading its models in the background"""
+        src = os.path.join(PACKAGES, self.package, 'src')
+        sys.path.insert(0, src)
+        spec = importlib.util.spec_from_file_location(f'{self.name}_main', os.path.join(src, 'main.py'))
+        self.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.module)
+        return self.module.app
+
+    def wait_ready(self, app):
+        """Wait until the models are loaded and warmed up"""
+        pool = self.module.pipeline.pool
+        if not pool.wait():
+            raise RuntimeError(f"The {self.name} models failed to load: {pool.error}")
+
+    def startup(self, app):
+        """How long each step of starting up took, such as importing torch"""
+        return app.test_client().get('/stats').get_json().get('startup', {})
+
+    def requests(self, app):
+        def post(sample):
+            data = {'image': (io.BytesIO(sample.data), f'{sample.name}.jpg'), **self.options}
+            return app.test_client().post('/infer', data=data, content_type='multipart/form-data').status_code
+
+        return [{'kind': sample.kind, 'call': lambda sample=sample: post(sample)}
+                for sample in self.corpus]
+
+    def describe(self):
+        return {'corpus': [sample.describe() for sample in self.corpus], 'options': self.options}
+
+    def teardown(self):
+        pass
+
+
+class VideoTarget:
+    """The video-dl API, downloading from local DASH, HLS and progressive fixtures into local storage"""
+
+    name = 'video-dl'
+    prefix = 'VIDEODL'
+    default_requests = 16
+
+    def __init__(self):
+        self.server = None
+        self.storage_root = None
+        self.fixture_options = {}
+
+    def setup(self, args):
+        package = os.path.join(PACKAGES, 'video-dl')
+        sys.path.insert(0, os.path.join(package, 'benchmarks'))
+        sys.path.insert(0, os.path.join(package, 'src'))
+
+        # The app checks these are set, nothing is sent to R2 since storage is replaced below
+        for var in ('R2_ACCESS_KEY', 'R2_SECRET_KEY', 'R2_BUCKET_NAME'):
+            os.environ.setdefault(var, 'benchmark')
+        for var in ('R2_ENDPOINT', 'R2_PUBLIC_URL'):
+            os.environ.setdefault(var, 'http://storage.invalid')
+
+        from fixtures import FixtureServer
+        self.fixture_options = {
+            'bandwidth_mb_per_second': args.bandwidth,
+            'file_size_mb': args.file_size,
+            'segments': args.segments,
+        }
+        self.server = FixtureServer(bytes_per_second=int(args.bandwidth * 1024 * 1024),
+                                    file_size=args.file_size * 1024 * 1024,
+                                    segment_count=args.segments,
+                                    segment_size=1024 * 1024).__enter__()
+        self.storage_root = tempfile.mkdtemp(prefix='videodl-bench-storage-')
+
+    def load(self):
+        import main
+        from fixtures import LocalStorage
+
+        storage = LocalStorage(self.storage_root)
+        main.storage = storage
+        main.video_service.storage = storage
+        return main.app
+
+    def wait_ready(self, app):
+        pass
+
+    def startup(self, app):
+        return {}
+
+    def requests(self, app):
+        runs = itertools.count()
+
+        def download(path, unique=True):
+            # A distinct query string gives each download its own ID, so it isn't served from storage
+            url = self.server.url(f'{path}?run={next(runs)}' if unique else path)
+            response = app.test_client().post('/download', json={'url': url, 'format': 'max'})
+            body = response.get_json(silent=True) or {}
+            return response.status_code if body.get('success') else 'failed'
+
+        return [
+            {'kind': 'progressive', 'call': lambda: download('video.mp4')},
+            {'kind': 'hls', 'call': lambda: download('hls/index.m3u8')},
+            {'kind': 'dash', 'call': lambda: download('dash/manifest.mpd')},
+            {'kind': 'stored', 'call': lambda: download('video.mp4?stored', unique=False)},
+        ]
+
+    def describe(self):
+        return {'fixtures': self.fixture_options}
+
+    def teardown(self):
+        if self.server:
+            self.server.__exit__(None, None, None)
+        if self.storage_root:
+            shutil.rmtree(self.storage_root, ignore_errors=True)
+
+
+TARGETS = {
+    'nudenet': VisionTarget('nudenet', 'nudenet-api', 'NUDENET', ('nsfw', 'sfw', 'face')),
+    'ageandgender': VisionTarget('ageandgender', 'ageandgender', 'AGEANDGENDER', ('face', 'faces', 'sfw')),
+    'facelandmarks': VisionTarget('facelandmarks', 'facelandmarks', 'FACELANDMARKS', ('face', 'faces', 'sfw')),
+    'video-dl': VideoTarget(),
+}
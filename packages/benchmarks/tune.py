@@ -0,0 +1,90 @@
+"""
+Compare a service's concurrency settings by benchmarking every combination.
+
+Each combination runs in its own process with the settings set in the
+environment, then the throughput and p95 latency at each concurrency level are
+listed side by side:
+
+    cd packages/nudenet-api
+    uv run ../benchmarks/tune.py nudenet \
+        --set MODEL_POOL_SIZE=1,2 --set INTRA_OP_THREADS=1,2,4
+"""
+import os
+import sys
+import json
+import argparse
+import itertools
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import environment  # noqa: E402
+from targets import TARGETS  # noqa: E402
+
+RUN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run.py')
+
+
+def parse_settings(values):
+    """Turn `NAME=1,2` options into a list of values per setting"""
+    settings = {}
+    for value in values:
+        name, _, options = value.partition('=')
+        if not options:
+            raise argparse.ArgumentTypeError(f"Expected NAME=value,value, got {value}")
+        settings[name.upper()] = options.split(',')
+    return settings
+
+
+def run_combination(target, combination, args):
+    env = {**os.environ, **{f'{TARGETS[target].prefix}_{name}': value for name, value in combination.items()}}
+    with tempfile.NamedTemporaryFile(suffix='.json') as output:
+        command = [sys.executable, RUN, target, '--concurrency', args.concurrency,
+                   '--cold-start-runs', '0', '--output', output.name]
+        if args.requests:
+            command += ['--requests', str(args.requests)]
+        process = subprocess.run(command, capture_output=True, text=True, env=env)
+        if process.returncode != 0:
+            sys.exit(f"The benchmark failed with {combination}:\n{process.stderr}")
+        with open(output.name, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('target', choices=sorted(TARGETS))
+    parser.add_argument('--set', action='append', default=[], dest='settings',
+                        help="A setting without the service's prefix and the values to try, e.g. BATCH_SIZE=1,4")
+    parser.add_argument('--concurrency', default='1,4,8',
+                        help='Comma separated concurrency levels (default: 1,4,8)')
+    parser.add_argument('--requests', type=int, help='Requests per concurrency level')
+    parser.add_argument('--output', help='Write every result as JSON to this file')
+    args = parser.parse_args()
+
+    settings = parse_settings(args.settings)
+    names = list(settings)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*settings.values())]
+
+    results = []
+    for combination in combinations:
+        print(f"running {' '.join(f'{name}={value}' for name, value in combination.items()) or 'defaults'}",
+              file=sys.stderr)
+        results.append({'settings': combination, 'result': run_combination(args.target, combination, args)})
+
+    levels = [level['concurrency'] for level in results[0]['result']['levels']]
+    header = ' '.join(f'{name:>18}' for name in names)
+    columns = ' '.join(f"{f'c{level} req/s':>10} {f'c{level} p95':>9}" for level in levels)
+    print(f"{header} {columns}")
+    for entry in results:
+        values = ' '.join(f'{entry["settings"][name]:>18}' for name in names)
+        cells = ' '.join(f"{level['throughput']:>10.2f} {level['latency_ms']['p95']:>9.1f}"
+                         for level in entry['result']['levels'])
+        print(f"{values} {cells}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'target': args.target, 'environment': environment(), 'runs': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
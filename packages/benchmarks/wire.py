@@ -0,0 +1,122 @@
+"""
+Compare the bytes on the wire and CPU per request of JSON and binary frames.
+
+Each image in the corpus is sent to a model API both ways: as a multipart
+upload answered with JSON and base64 images, and as a frame answered with a
+frame (see inference-core's framing.py). The client's side includes getting
+the response images back as bytes, as the gateway or a caller would have to.
+
+    cd packages/nudenet-api
+    uv run ../benchmarks/wire.py nudenet
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+from werkzeug.test import EnvironBuilder
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import environment  # noqa: E402
+from targets import TARGETS, VisionTarget  # noqa: E402
+
+
+def multipart_body(sample):
+    """A multipart upload of the sample, encoded the way the test client would send it"""
+    builder = EnvironBuilder(method='POST', data={'image': (io.BytesIO(sample.data), f'{sample.name}.jpg')})
+    try:
+        environ = builder.get_environ()
+        return environ['wsgi.input'].read(), environ['CONTENT_TYPE']
+    finally:
+        builder.close()
+
+
+def json_request(client, body, content_type):
+    """Send a multipart upload, returns the response, its size and the CPU seconds to get the images from it"""
+    response = client.post('/infer', data=body, content_type=content_type)
+    started = time.process_time()
+    result = json.loads(response.data)
+    images = [base64.b64decode(value) for value in result.values() if isinstance(value, str) and len(value) > 256]
+    return response, len(body), len(response.data), time.process_time() - started, images
+
+
+def frame_request(client, sample, framing):
+    """Send a frame and ask for one back"""
+    body = framing.encode_frame({}, {'image': framing.Blob(sample.data, 'image/jpeg', f'{sample.name}.jpg')})
+    response = client.post('/infer', data=body, content_type=framing.FRAME_TYPE,
+                           headers={'Accept': framing.FRAME_TYPE})
+    started = time.process_time()
+    _, blobs = framing.decode_frame(response.data)
+    images = [bytes(blob.data) for blob in blobs.values()]
+    return response, len(body), len(response.data), time.process_time() - started, images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('target', choices=sorted(name for name, target in TARGETS.items()
+                                                 if isinstance(target, VisionTarget)))
+    parser.add_argument('--repeat', type=int, default=5, help='Times each image is sent each way (default: 5)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    target = TARGETS[args.target]
+    target.setup(args)
+    app = target.load()
+    target.wait_ready(app)
+    client = app.test_client()
+
+    import inference_core as framing
+
+    multipart = {sample.name: multipart_body(sample) for sample in target.corpus}
+    modes = {
+        'json': lambda sample: json_request(client, *multipart[sample.name]),
+        'frame': lambda sample: frame_request(client, sample, framing),
+    }
+
+    results = {}
+    for mode, send in modes.items():
+        send(target.corpus[0])
+        sent = received = requests = failed = 0
+        cpu = client_cpu = 0.0
+        for sample in target.corpus:
+            for _ in range(args.repeat):
+                started = time.process_time()
+                response, request_bytes, response_bytes, client_seconds, _ = send(sample)
+                cpu += time.process_time() - started
+                client_cpu += client_seconds
+                sent += request_bytes
+                received += response_bytes
+                requests += 1
+                failed += response.status_code != 200
+
+        results[mode] = {
+            'requests': requests,
+            'errors': failed,
+            'request_bytes': round(sent / requests),
+            'response_bytes': round(received / requests),
+            'cpu_ms': round(cpu / requests * 1000, 2),
+            'client_cpu_ms': round(client_cpu / requests * 1000, 3),
+        }
+
+    print(f"{'MODE':<6} {'SENT':>10} {'RECEIVED':>10} {'CPU MS':>8} {'CLIENT MS':>10} {'ERRORS':>6}")
+    for mode, row in results.items():
+        print(f"{mode:<6} {row['request_bytes']:>10} {row['response_bytes']:>10} {row['cpu_ms']:>8.2f} "
+              f"{row['client_cpu_ms']:>10.3f} {row['errors']:>6}")
+
+    json_row, frame_row = results['json'], results['frame']
+    if json_row['response_bytes']:
+        saved = 1 - frame_row['response_bytes'] / json_row['response_bytes']
+        print(f"\nframes send {saved * 100:.1f}% fewer bytes back, "
+              f"using {json_row['cpu_ms'] - frame_row['cpu_ms']:.2f}ms less CPU per request")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'target': args.target, 'environment': environment(),
+                       'corpus': [sample.describe() for sample in target.corpus], 'modes': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,157 +1,318 @@
-import io
 import os
-import cv2
-import torch
-import base64
-import numpy as np
-from PIL import Image
+import logging
 from dotenv import load_dotenv
-from torchvision import transforms
-from faceland import FaceLanndInference
-from hdface.hdface import hdface_detector
-from flask import Flask, request, jsonify
+from inference_core import (
+    AGES, GENDERS, MODEL_MEAN_VALUES, InferenceError, ModelPool, Pipeline, Settings, configure_threads,
+    create_app, create_batcher, decode_image, detect_faces, encode_image, face_crop, json_endpoint,
+    lazy_import, read_upload, serve, stage, wait_until_ready
+)
 
 load_dotenv()
 
-DEBUG_MODE = os.getenv('FACELANDMARKS_DEBUG', 'false').lower() == 'true'
+# torch and hdface take seconds to import, they're imported when the models load
+# so the app can answer /health straight away
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+torch = lazy_import('torch')
+transforms = lazy_import('torchvision.transforms')
+faceland = lazy_import('faceland')
+hdface = lazy_import('hdface.hdface')
+
+settings = Settings('FACELANDMARKS', 7002)
+logger = logging.getLogger(__name__)
+
+# /analyze finds faces with OpenCV's SSD detector, then runs the age and gender nets from `ageandgender`
+# and the landmark model on them, these are downloaded into the image
+ANALYZE_MODELS_DIR = settings.get('ANALYZE_MODELS_DIR', f'{os.path.dirname(__file__)}/models')
+ANALYZE_MODEL_FILES = {
+    "face": ("opencv_face_detector_uint8.pb", "opencv_face_detector.pbtxt"),
+    "age": ("age_net.caffemodel", "age_deploy.prototxt"),
+    "gender": ("gender_net.caffemodel", "gender_deploy.prototxt"),
+}
+HEADS = ('age', 'gender', 'landmarks')
+
+
+def load_analysis_nets():
+    """Load the nets for /analyze, or None if their files aren't there"""
+    paths = {name: [os.path.join(ANALYZE_MODELS_DIR, file) for file in files]
+             for name, files in ANALYZE_MODEL_FILES.items()}
+    missing = [path for files in paths.values() for path in files if not os.path.exists(path)]
+    if missing:
+        logger.warning(f"/analyze is disabled, its models are missing: {', '.join(missing)}")
+        return None
+    return {name: cv2.dnn.readNet(*files) for name, files in paths.items()}
+
+
+def load_models():
+    """Load the face detector and the landmark model, and the nets for /analyze"""
+    configure_threads(settings)
+    torch.set_num_threads(settings.intra_op_threads)
 
-app = Flask(__name__)
-
-
-def detect_landmarks(image):
-    """This function detects face landmarks on an image."""
-    det = hdface_detector(use_cuda=False)
     checkpoint = torch.load(f'{os.path.dirname(__file__)}/faceland.pth',
                             map_location=torch.device('cpu'), weights_only=True)
 
-    plfd_backbone = FaceLanndInference()
+    plfd_backbone = faceland.FaceLanndInference()
     plfd_backbone.load_state_dict(checkpoint)
     plfd_backbone.eval()
-    transform = transforms.Compose([transforms.ToTensor()])
 
-    image = Image.open(io.BytesIO(image.read()))
-    image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    return {
+        "detector": hdface.hdface_detector(use_cuda=False),
+        "landmarks": plfd_backbone,
+        "analysis": load_analysis_nets(),
+    }
+
+
+def warmup(models):
+    """Run a blank image through the models so the first request doesn't pay for it"""
+    models["detector"].detect_face(np.zeros((112, 112, 3), np.uint8))
+    with torch.inference_mode():
+        models["landmarks"](torch.zeros(1, 3, 112, 112))
+    if models["analysis"]:
+        analyze_faces(models, [{"image": np.zeros((300, 300, 3), np.uint8), "heads": HEADS}])
+
+
+def landmark_crop(image, box):
+    """The square crop around a face's box that the landmark model expects, and the model's input"""
+    height, width = image.shape[:2]
+    x1, y1, x2, y2 = box
+
+    w = x2 - x1 + 1
+    h = y2 - y1 + 1
+
+    size_w = int(max([w, h]) * 0.8)
+    size_h = int(max([w, h]) * 0.8)
+    cx = x1 + w // 2
+    cy = y1 + h // 2
+    x1 = cx - size_w // 2
+    x2 = x1 + size_w
+    y1 = cy - int(size_h * 0.4)
+    y2 = y1 + size_h
+
+    # Clip the coordinates to ensure they stay within the image boundaries
+    x1 = max(0, int(x1))
+    y1 = max(0, int(y1))
+    x2 = min(width, int(x2))
+    y2 = min(height, int(y2))
+
+    # Prepare the cropped version for landmark detection, but the landmarks will be mapped back to the full image
+    cropped = cv2.resize(image[y1:y2, x1:x2], (112, 112))
+    cropped = cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB)
+
+    return {
+        "crop": (x1, y1, x2, y2),
+        "size": (size_w, size_h),
+        "input": transforms.functional.to_tensor(cropped),
+    }
+
+
+def crop_face(image, face):
+    """Find the square crop around a face detected by hdface that the landmark model expects"""
+    box = face['box']
+    cls = face['cls']
+    pts = face['pts']
+
+    points = {
+        "left_eye": {"x": pts["leye"][0], "y": pts["leye"][1]},
+        "left_mouth": {"x": pts["lmouse"][0], "y": pts["lmouse"][1]},
+        "nose": {"x": pts["nose"][0], "y": pts["nose"][1]},
+        "right_eye": {"x": pts["reye"][0], "y": pts["reye"][1]},
+        "right_mouth": {"x": pts["rmouse"][0], "y": pts["rmouse"][1]}
+    }
+
+    bounds = {
+        "x1": box[0],
+        "y1": box[1],
+        "x2": box[2],
+        "y2": box[3]
+    }
 
-    if image is not None:
-        height, width = image.shape[:2]
-        img_det = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    try:
+        confidence = cls.tolist()[0] or "unknown"
+    except (IndexError, AttributeError):
+        confidence = "unknown"
+
+    return {
+        "bounds": bounds,
+        "confidence": confidence,
+        "face": points,
+        **landmark_crop(image, box),
+    }
+
+
+def detect_landmarks(models, images):
+    """Detect the first face in each image, then the landmarks of every face in one batch"""
+    faces = []
+    for image in images:
         # this takes EXTREMELY long on macOS, but roughly 4 seconds on Windows
         # if it’s like this in a Docker container, I‘ll probably fork and rewrite hdface
-        result = det.detect_face(img_det)
-        for i in range(len(result)):
-            box = result[i]['box']
-            cls = result[i]['cls']
-            pts = result[i]['pts']
-
-            points = {
-                "left_eye": {"x": pts["leye"][0], "y": pts["leye"][1]},
-                "left_mouth": {"x": pts["lmouse"][0], "y": pts["lmouse"][1]},
-                "nose": {"x": pts["nose"][0], "y": pts["nose"][1]},
-                "right_eye": {"x": pts["reye"][0], "y": pts["reye"][1]},
-                "right_mouth": {"x": pts["rmouse"][0], "y": pts["rmouse"][1]}
-            }
-
-            bounds = {
-                "x1": box[0],
-                "y1": box[1],
-                "x2": box[2],
-                "y2": box[3]
-            }
-
-            try:
-                confidence = cls.tolist()[0] or "unknown"
-            except (IndexError, AttributeError):
-                confidence = "unknown"
-
-            # Calculate the box dimensions and center as before
-            x1, y1, x2, y2 = box
-
-            w = x2 - x1 + 1
-            h = y2 - y1 + 1
-
-            size_w = int(max([w, h]) * 0.8)
-            size_h = int(max([w, h]) * 0.8)
-            cx = x1 + w // 2
-            cy = y1 + h // 2
-            x1 = cx - size_w // 2
-            x2 = x1 + size_w
-            y1 = cy - int(size_h * 0.4)
-            y2 = y1 + size_h
-
-            # Clip the coordinates to ensure they stay within the image boundaries
-            x1 = max(0, int(x1))
-            y1 = max(0, int(y1))
-            x2 = min(width, int(x2))
-            y2 = min(height, int(y2))
-
-            # Create the bounding box on the original image
-            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0))
-
-            # Prepare the cropped version for landmark detection, but the landmarks will be mapped back to the full image
-            cropped = image[y1:y2, x1:x2]
-            cropped = cv2.resize(cropped, (112, 112))
-
-            image_input = cv2.resize(cropped, (112, 112))
-            image_input = cv2.cvtColor(image_input, cv2.COLOR_BGR2RGB)
-            image_input = transform(image_input).unsqueeze(0)
-            landmarks = plfd_backbone(image_input)
-
-            # Get the landmark positions in the cropped space
-            pre_landmark = landmarks[0]
-            pre_landmark = pre_landmark.cpu().detach(
-            ).numpy().reshape(-1, 2) * [size_w, size_h]
-
-            # Map the landmarks back to the original image coordinates
-            for (x, y) in pre_landmark.astype(np.int32):
-                absolute_x = x1 + x  # Adjust x relative to the whole image
-                absolute_y = y1 + y  # Adjust y relative to the whole image
-                cv2.circle(image, (absolute_x, absolute_y),
-                           2, (255, 0, 255), 2)
-
-            # Return the original image landmarks relative to the whole image
-            landmarks_full_image = [
-                {"x": int(x1 + x), "y": int(y1 + y)} for (x, y) in pre_landmark]
-
-            # Return the image with landmarks in base64
-            _, buffer = cv2.imencode('.jpg', image)
-            image_base64 = base64.b64encode(buffer).decode('utf-8')
-
-            return jsonify({
-                "bounds": bounds,
-                "confidence": confidence,
-                "face": points,
-                "landmarks": landmarks_full_image,
-                "image": image_base64,
-                "success": True
-            }), 200
-    else:
-        return jsonify({"error": "The file you have uploaded is invalid.", "success": False}), 400
-
-
-@app.route('/infer', methods=['POST'])
-def infer():
-    if 'image' not in request.files:
-        return jsonify({"error": "You haven’t included an image in the `image` parameter.", "success": False}), 400
-
-    image = request.files['image']
-
-    if image.filename == '':
-        return jsonify({"error": "The file you have uploaded is invalid.", "success": False}), 400
-
-    try:
-        return detect_landmarks(image)
-    except Exception as e:
-        return jsonify({"error": str(e), "success": False}), 500
-
+        result = models["detector"].detect_face(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        faces.append(crop_face(image, result[0]) if len(result) else None)
+
+    predict_landmarks(models, [face for face in faces if face is not None])
+    return faces
+
+
+def predict_landmarks(models, faces):
+    """Run the landmark model on every face at once, adding their landmarks in the cropped space"""
+    if not faces:
+        return
+
+    with torch.inference_mode():
+        landmarks = models["landmarks"](torch.stack([face["input"] for face in faces]))
+
+    for face, pre_landmark in zip(faces, landmarks):
+        # Get the landmark positions in the cropped space
+        face["landmarks"] = pre_landmark.cpu().numpy().reshape(-1, 2) * face["size"]
+
+
+def analyze_faces(models, items):
+    """
+    Detect the faces in a batch of images once, then run each requested head
+    on every face that asked for it in one batch. The age and gender nets take
+    the padded face crop, the landmark model a square crop of the same face.
+    """
+    nets = models["analysis"]
+    if not nets:
+        raise InferenceError("Face analysis isn't available, its models aren't installed.", 503)
+
+    # The SSD face detector only takes one image at a time
+    results = []
+    for item in items:
+        image = item["image"]
+        results.append([{"bounds": dict(zip(("x1", "y1", "x2", "y2"), face["box"])), **face}
+                        for face in detect_faces(nets["face"], image)])
+
+    demographics = []
+    landmark_faces = []
+    for item, faces in zip(items, results):
+        image = item["image"]
+        for face in faces:
+            if 'age' in item["heads"] or 'gender' in item["heads"]:
+                demographics.append((item, face, face_crop(image, face["box"])))
+            if 'landmarks' in item["heads"]:
+                face.update(landmark_crop(image, face["box"]))
+                landmark_faces.append(face)
+
+    for head, labels in (('gender', GENDERS), ('age', AGES)):
+        wanted = [(face, crop) for item, face, crop in demographics if head in item["heads"]]
+        if not wanted:
+            continue
+        with stage(head):
+            nets[head].setInput(cv2.dnn.blobFromImages(
+                [crop for _, crop in wanted], 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False))
+            predictions = nets[head].forward()
+        for (face, _), prediction in zip(wanted, predictions):
+            face[head] = labels[int(prediction.argmax())]
+
+    with stage('landmarks'):
+        predict_landmarks(models, landmark_faces)
+    return results
+
+
+def preprocess(upload):
+    return decode_image(upload.data, cv2.IMREAD_COLOR)
+
+
+def postprocess(image, face):
+    if face is None:
+        raise InferenceError("No face was found in the image.")
+
+    x1, y1, x2, y2 = face["crop"]
+    pre_landmark = face["landmarks"]
+
+    with stage('draw'):
+        image = image.copy()
+
+        # Create the bounding box on the original image
+        cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0))
+
+        # Map the landmarks back to the original image coordinates
+        for (x, y) in pre_landmark.astype(np.int32):
+            cv2.circle(image, (int(x1 + x), int(y1 + y)), 2, (255, 0, 255), 2)
+
+    return {
+        "bounds": face["bounds"],
+        "confidence": face["confidence"],
+        "face": face["face"],
+        # Return the original image landmarks relative to the whole image
+        "landmarks": [{"x": int(x1 + x), "y": int(y1 + y)} for (x, y) in pre_landmark],
+        "image": encode_image(image)
+    }
+
+
+def analyze_preprocess(upload):
+    heads = [head.strip() for head in upload.options.get('heads', ','.join(HEADS)).split(',') if head.strip()]
+    invalid = [head for head in heads if head not in HEADS]
+    if invalid or not heads:
+        raise InferenceError(f"Invalid heads: {', '.join(invalid) or 'none'}. Valid options are: {', '.join(HEADS)}")
+
+    return {
+        "image": decode_image(upload.data, cv2.IMREAD_COLOR),
+        "heads": heads,
+    }
+
+
+def analyze_postprocess(item, faces):
+    """Outline each face, label it with its age and gender and mark its landmarks"""
+    results = []
+    with stage('draw'):
+        image = item["image"].copy()
+        for face in faces:
+            x1, y1, x2, y2 = face["box"]
+            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+            labels = [face[head] for head in ('gender', 'age') if head in face]
+            if labels:
+                cv2.putText(image, ', '.join(labels), (x1, y1 - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+            result = {"bounds": face["bounds"], "confidence": face["confidence"]}
+            for head in ('age', 'gender'):
+                if head in face:
+                    result[head] = face[head]
+
+            if "landmarks" in face:
+                cx, cy = face["crop"][:2]
+                result["landmarks"] = [{"x": int(cx + x), "y": int(cy + y)} for (x, y) in face["landmarks"]]
+                for point in result["landmarks"]:
+                    cv2.circle(image, (point["x"], point["y"]), 2, (255, 0, 255), 2)
+
+            results.append(result)
+
+    return {
+        "faces": results,
+        "image": encode_image(image)
+    }
+
+
+pool = ModelPool(load_models, settings.pool_size, warmup, name='facelandmarks')
+pipeline = Pipeline(
+    pool,
+    detect_landmarks,
+    preprocess=preprocess,
+    postprocess=postprocess,
+    batcher=create_batcher(settings)
+)
+app = create_app(__name__, pipeline, settings)
+
+# Shares the model instances with /infer, but batches its own requests
+analysis = Pipeline(
+    pool,
+    analyze_faces,
+    preprocess=analyze_preprocess,
+    postprocess=analyze_postprocess,
+    batcher=create_batcher(settings)
+)
 
-@app.route('/health', methods=['GET'])
-def health():
-    return jsonify({
-        "success": True,
-        "message": "OK"
-    }), 200
+
+@app.route('/analyze', methods=['POST'])
+@json_endpoint(analysis.metrics, app.extensions['admission'])
+def analyze():
+    wait_until_ready(pipeline, settings)
+    with analysis.metrics.stage('parse'):
+        upload = read_upload()
+    return analysis.run(upload)
 
 
 if __name__ == '__main__':
-    port = int(os.getenv('FACELANDMARKS_PORT', 7002))
-    app.run(host='0.0.0.0', port=port, debug=DEBUG_MODE)
+    serve(app, settings)
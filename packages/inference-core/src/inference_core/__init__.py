@@ -0,0 +1,77 @@
+from .admission import PRIORITIES, AdmissionController, Slot
+from .app import (
+    Upload, create_app, json_endpoint, overloaded_response, read_upload, request_file, serve, wait_until_ready
+)
+from .batching import DirectBatcher, MicroBatcher, create_batcher
+from .config import Settings, env_bool, env_float, env_int
+from .encoding import decode_image, encode_image, encode_images, encode_jpeg
+from .errors import InferenceError, Overloaded
+from .executors import StageExecutors, configure_threads, executors
+from .faces import AGES, FACE_CONFIDENCE, FACE_PADDING, GENDERS, MODEL_MEAN_VALUES, detect_faces, face_crop
+from .framing import FRAME_TYPE, Blob, decode_frame, encode_frame, wants_frame
+from .metrics import Metrics, metrics, stage
+from .model import ModelPool
+from .pipeline import Pipeline
+from .probe import ImageLimits, image_size, limits
+from .startup import LazyModule, lazy_import, onnx_quantize, onnx_snapshot
+from .uploads import BufferPool, UploadRequest, buffers
+from .video import SampledFrame, SceneSampler
+
+__all__ = [
+    'AGES',
+    'FACE_CONFIDENCE',
+    'FACE_PADDING',
+    'FRAME_TYPE',
+    'GENDERS',
+    'MODEL_MEAN_VALUES',
+    'PRIORITIES',
+    'AdmissionController',
+    'Blob',
+    'BufferPool',
+    'DirectBatcher',
+    'ImageLimits',
+    'InferenceError',
+    'LazyModule',
+    'Metrics',
+    'MicroBatcher',
+    'ModelPool',
+    'Overloaded',
+    'Pipeline',
+    'SampledFrame',
+    'SceneSampler',
+    'Slot',
+    'Settings',
+    'StageExecutors',
+    'Upload',
+    'UploadRequest',
+    'buffers',
+    'configure_threads',
+    'create_app',
+    'create_batcher',
+    'decode_frame',
+    'decode_image',
+    'detect_faces',
+    'encode_frame',
+    'encode_image',
+    'encode_images',
+    'encode_jpeg',
+    'env_bool',
+    'env_float',
+    'env_int',
+    'executors',
+    'face_crop',
+    'image_size',
+    'json_endpoint',
+    'lazy_import',
+    'limits',
+    'metrics',
+    'onnx_quantize',
+    'onnx_snapshot',
+    'overloaded_response',
+    'read_upload',
+    'request_file',
+    'serve',
+    'stage',
+    'wait_until_ready',
+    'wants_frame',
+]
@@ -0,0 +1,14 @@
+"""
+The admission controller from the `admission` package, reporting to the inference metrics and shedding
+requests with Overloaded so they get the usual 503 response.
+"""
+import admission
+from admission import PRIORITIES, Slot
+from .errors import Overloaded
+from .metrics import ADMISSION_METRICS
+
+
+class AdmissionController(admission.AdmissionController):
+    def __init__(self, concurrency, queue_size, queue_timeout, max_retry_after=admission.MAX_RETRY_AFTER):
+        super().__init__(concurrency, queue_size, queue_timeout, metrics=ADMISSION_METRICS,
+                         overloaded=Overloaded, max_retry_after=max_retry_after)
@@ -0,0 +1,210 @@
+import os
+import time
+import logging
+from contextlib import nullcontext
+from functools import wraps
+from flask import Flask, Response, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from .admission import AdmissionController
+from .errors import InferenceError, Overloaded
+from .executors import executors
+from .framing import FRAME_TYPE, decode_frame, frame_response, wants_frame
+from .metrics import export, metrics as default_metrics
+from .probe import limits
+from .uploads import UploadRequest, buffers, read_body, read_file, release_buffers
+
+logger = logging.getLogger(__name__)
+
+
+class Upload:
+    """An uploaded image and the form fields sent with it"""
+
+    def __init__(self, data, filename, options):
+        self.data = data
+        self.filename = filename
+        self.options = options
+
+
+def too_large():
+    max_mb = (request.max_content_length or 0) / 1024 / 1024
+    return InferenceError(f"The file you have uploaded is too large, it can be at most {max_mb:g}MB.", 413)
+
+
+def read_frame_upload(field):
+    """Read the image and fields from a binary frame request, see framing.py"""
+    if request.max_content_length and (request.content_length or 0) > request.max_content_length:
+        raise too_large()
+
+    fields, blobs = decode_frame(read_body())
+    if field not in blobs:
+        raise InferenceError(f"You haven’t included an image in the `{field}` blob.")
+
+    image = blobs[field]
+    return Upload(image.data, image.filename, {name: str(value) for name, value in fields.items()})
+
+
+def request_file(field='image', kind='an image'):
+    """Validate and get an uploaded file from a multipart request, without reading it"""
+    try:
+        files = request.files
+    except RequestEntityTooLarge:
+        raise too_large()
+
+    if field not in files:
+        raise InferenceError(f"You haven’t included {kind} in the `{field}` parameter.")
+
+    file = files[field]
+    if file.filename == '':
+        raise InferenceError("The file you have uploaded is invalid.")
+    return file
+
+
+def read_upload(field='image'):
+    """
+    Validate and read the uploaded image from a multipart or frame request. The
+    data is a view of a buffer that's reused once the request ends.
+    """
+    if request.mimetype == FRAME_TYPE:
+        return read_frame_upload(field)
+
+    image = request_file(field)
+    return Upload(read_file(image), image.filename, request.form.to_dict())
+
+
+def wait_until_ready(pipeline, settings):
+    """Wait for the models to load, raising a 503 if they don't in time"""
+    if not pipeline.pool.wait(settings.ready_timeout):
+        if pipeline.pool.error:
+            raise InferenceError("The model failed to load.", 503)
+        raise InferenceError("The model is still loading, please try again shortly.", 503)
+
+
+def json_endpoint(metrics=None, admission=None, priority='default'):
+    """
+    Return a view's result as a successful JSON response and errors in the usual
+    format. Results are sent as a frame instead when the request asks for one.
+    With an admission controller the view only runs once it has a slot, requests
+    that are shed get a 503 with a Retry-After header.
+    """
+    metrics = metrics or default_metrics
+
+    def decorator(view):
+        endpoint = view.__name__
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            with metrics.in_flight(endpoint):
+                try:
+                    with admission.admit(priority) if admission else nullcontext():
+                        result = view(*args, **kwargs)
+                        with metrics.stage('serialize'):
+                            if wants_frame():
+                                response = frame_response({"success": True, **result})
+                            else:
+                                response = jsonify({"success": True, **result})
+                    metrics.request(endpoint, 'success', time.perf_counter() - started)
+                    return response, 200
+                except Overloaded as e:
+                    metrics.request(endpoint, 'shed', time.perf_counter() - started)
+                    return overloaded_response(e)
+                except InferenceError as e:
+                    metrics.request(endpoint, 'rejected', time.perf_counter() - started)
+                    return jsonify({"error": e.message, "success": False}), e.status
+                except Exception as e:
+                    metrics.request(endpoint, 'error', time.perf_counter() - started)
+                    logger.error(f"Error handling {request.path}: {str(e)}", exc_info=True)
+                    return jsonify({"error": str(e), "success": False}), 500
+        return wrapper
+    return decorator
+
+
+def overloaded_response(error):
+    """The 503 sent back for a request that was shed, telling the caller when to retry"""
+    return jsonify({"error": error.message, "success": False}), 503, {'Retry-After': str(error.retry_after)}
+
+
+def create_app(name, pipeline, settings):
+    """
+    Create the Flask app for a service, with /infer, /health, /ready, /stats and /metrics.
+    Its admission controller is `app.extensions['admission']`, for the service's own endpoints.
+    """
+    logging.basicConfig(
+        level=logging.DEBUG if settings.debug else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    # OpenCV's own limit catches formats whose size isn't checked from the header, it's read when cv2 is imported
+    os.environ.setdefault('OPENCV_IO_MAX_IMAGE_PIXELS', str(settings.max_pixels))
+
+    app = Flask(name)
+    app.extensions['inference'] = pipeline
+
+    # Bodies over the limit are rejected before they're read, uploads are parsed into reused buffers
+    app.request_class = UploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = settings.max_upload_mb * 1024 * 1024
+    app.config['MAX_FORM_PARTS'] = settings.max_form_parts
+    app.teardown_request(release_buffers)
+    buffers.configure(max(2, settings.decode_threads), app.config['MAX_CONTENT_LENGTH'])
+    limits.configure(settings.max_pixels, settings.max_dimension)
+
+    # Inference is limited to one batch per model instance by the pool, decoding and encoding get their own threads
+    executors.configure({'decode': settings.decode_threads, 'encode': settings.encode_threads})
+
+    # Load the models in the background so /health answers straight away, /ready says when they're loaded
+    pipeline.pool.start()
+
+    # Bursts past what the models can keep up with are queued briefly, then shed
+    admission = app.extensions['admission'] = AdmissionController(
+        settings.max_concurrency, settings.max_queue, settings.queue_timeout, settings.max_retry_after)
+
+    @app.route('/infer', methods=['POST'])
+    @json_endpoint(pipeline.metrics, admission)
+    def infer():
+        wait_until_ready(pipeline, settings)
+
+        # Flask parses the multipart body when the files are first read
+        with pipeline.metrics.stage('parse'):
+            upload = read_upload()
+        return pipeline.run(upload)
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify({
+            "success": True,
+            "message": "OK"
+        }), 200
+
+    @app.route('/ready', methods=['GET'])
+    def ready():
+        if pipeline.pool.loaded:
+            return jsonify({
+                "success": True,
+                "message": "Ready"
+            }), 200
+        return jsonify({
+            "success": False,
+            "error": "The model failed to load." if pipeline.pool.error else "The model is still loading."
+        }), 503
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        return jsonify({
+            "success": True,
+            "model": pipeline.pool.stats(),
+            "threads": {**executors.stats(), 'intra_op': settings.intra_op_threads},
+            "upload_buffers": buffers.stats(),
+            "admission": admission.stats(),
+            **pipeline.metrics.snapshot()
+        }), 200
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        body, content_type = export()
+        return Response(body, content_type=content_type)
+
+    return app
+
+
+def serve(app, settings):
+    app.run(host='0.0.0.0', port=settings.port, debug=settings.debug, threaded=True)
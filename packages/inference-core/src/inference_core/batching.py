@@ -0,0 +1,103 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class DirectBatcher:
+    """Runs each item as a batch of one on the calling thread"""
+
+    def start(self, handler):
+        self.handler = handler
+
+    def submit(self, item):
+        return self.handler([item])[0]
+
+    def stop(self):
+        pass
+
+
+class MicroBatcher:
+    """
+    Groups items submitted from concurrent requests into batches.
+    A batch is run as soon as it's full or the oldest item has waited max_wait
+    seconds, with one batch running at a time per worker.
+    """
+
+    def __init__(self, max_batch_size=8, max_wait=0.005, workers=1):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.workers = max(1, workers)
+        self.handler = None
+
+        self._queue = queue.Queue()
+        self._threads = []
+        self._stopping = False
+
+    def start(self, handler):
+        self.handler = handler
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'micro-batcher-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, item):
+        """Queue an item and wait for its result"""
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def stop(self):
+        self._stopping = True
+        for _ in self._threads:
+            self._queue.put(None)
+
+    def _collect(self):
+        """Wait for the first item, then gather more until the batch is full or the wait is over"""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                # Let another worker see the stop signal once this batch is done
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while not self._stopping:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            items = [item for item, _ in batch]
+            try:
+                outputs = self.handler(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
+
+
+def create_batcher(settings):
+    """Create the batcher for a service's settings"""
+    if settings.batch_size <= 1:
+        return DirectBatcher()
+    return MicroBatcher(settings.batch_size, settings.batch_wait, workers=settings.pool_size)
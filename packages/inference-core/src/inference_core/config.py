@@ -0,0 +1,66 @@
+import os
+
+
+def env_bool(name, default=False):
+    value = os.getenv(name)
+    return value.lower() == 'true' if value else default
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+class Settings:
+    """Settings shared by every service, read from environment variables with the service's prefix"""
+
+    def __init__(self, prefix, default_port):
+        self.prefix = prefix
+        self.debug = env_bool(f'{prefix}_DEBUG')
+        self.port = env_int(f'{prefix}_PORT', default_port)
+
+        # Number of model instances, each one handles one batch at a time
+        self.pool_size = max(1, env_int(f'{prefix}_MODEL_POOL_SIZE', 1))
+
+        # A batch size of 1 runs each request on its own thread without batching
+        self.batch_size = max(1, env_int(f'{prefix}_BATCH_SIZE', 1))
+        self.batch_wait = env_float(f'{prefix}_BATCH_WAIT_MS', 5) / 1000
+
+        # Threads for decoding and encoding images, by default one per CPU, 0 runs them on the request thread
+        cpus = os.cpu_count() or 1
+        self.decode_threads = max(0, env_int(f'{prefix}_DECODE_THREADS', cpus))
+        self.encode_threads = max(0, env_int(f'{prefix}_ENCODE_THREADS', cpus))
+
+        # Threads each model instance uses for one forward pass, the CPUs are split between the instances
+        self.intra_op_threads = max(1, env_int(f'{prefix}_INTRA_OP_THREADS', max(1, cpus // self.pool_size)))
+
+        # Models load in the background, requests that arrive first wait this long for them
+        self.ready_timeout = env_float(f'{prefix}_READY_TIMEOUT', 30)
+
+        # Requests with larger bodies are rejected before they're read, images are checked from their header
+        self.max_upload_mb = max(1, env_int(f'{prefix}_MAX_UPLOAD_MB', 20))
+        # Multipart fields and files in a request, the endpoints take an image and a few options
+        self.max_form_parts = max(1, env_int(f'{prefix}_MAX_FORM_PARTS', 16))
+        self.max_pixels = max(1, env_int(f'{prefix}_MAX_PIXELS', 50_000_000))
+        self.max_dimension = max(1, env_int(f'{prefix}_MAX_DIMENSION', 16384))
+
+        # Requests worked on at once, enough to keep every model instance's batches full while the next ones
+        # are decoded. Others wait in a queue of `max_queue` for up to `queue_timeout` seconds before they're
+        # turned away with a 503, a concurrency of 0 admits everything
+        self.max_concurrency = max(0, env_int(f'{prefix}_MAX_CONCURRENCY', 2 * self.pool_size * self.batch_size))
+        self.max_queue = max(0, env_int(f'{prefix}_MAX_QUEUE', 4 * self.max_concurrency))
+        self.queue_timeout = env_float(f'{prefix}_QUEUE_TIMEOUT', 10)
+        # Longest Retry-After a shed request is told to wait, in seconds
+        self.max_retry_after = max(1, env_int(f'{prefix}_MAX_RETRY_AFTER', 60))
+
+        # Where optimized copies of the models are cached between starts, empty disables it
+        self.snapshot_dir = os.getenv(f'{prefix}_SNAPSHOT_DIR', '')
+
+    def get(self, name, default=None):
+        """Get a service-specific environment variable"""
+        return os.getenv(f'{self.prefix}_{name}', default)
@@ -0,0 +1,64 @@
+import base64
+from .errors import InferenceError
+from .executors import executors
+from .framing import Blob, wants_frame
+from .metrics import stage
+from .probe import limits
+from .startup import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+DEFAULT_JPEG_QUALITY = 95
+
+
+def decode_image(data, flags=None):
+    """
+    Decode uploaded image bytes into a BGR array, in color unless other imread
+    flags are given. Images larger than the limits are rejected from their header.
+    """
+    limits.check(data)
+    if flags is None:
+        flags = cv2.IMREAD_COLOR
+    with stage('decode'):
+        image = executors.run('decode', cv2.imdecode, np.frombuffer(data, np.uint8), flags)
+    if image is None:
+        raise InferenceError("The file you have uploaded is invalid.")
+    return image
+
+
+def encode_jpeg(image, quality=DEFAULT_JPEG_QUALITY):
+    """Encode an image as JPEG bytes"""
+    with stage('encode'):
+        ok, buffer = executors.run('encode', cv2.imencode, '.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Failed to encode the image.")
+    return buffer.tobytes()
+
+
+def encode_image(image, quality=DEFAULT_JPEG_QUALITY):
+    """Encode an image as a base64 JPEG string for a JSON response, or raw JPEG bytes for a frame"""
+    data = encode_jpeg(image, quality)
+    if wants_frame():
+        return Blob(data, 'image/jpeg')
+    with stage('base64'):
+        return base64.b64encode(data).decode('utf-8')
+
+
+def encode_images(images, quality=DEFAULT_JPEG_QUALITY):
+    """Encode several images like encode_image, the encode pool runs them at the same time"""
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    with stage('encode'):
+        results = executors.map('encode', lambda image: cv2.imencode('.jpg', image, params), images)
+
+    frame = wants_frame()
+    encoded = []
+    for ok, buffer in results:
+        if not ok:
+            raise RuntimeError("Failed to encode the image.")
+        if frame:
+            encoded.append(Blob(buffer.tobytes(), 'image/jpeg'))
+            continue
+        with stage('base64'):
+            encoded.append(base64.b64encode(buffer.tobytes()).decode('utf-8'))
+    return encoded
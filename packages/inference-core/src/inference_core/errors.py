@@ -0,0 +1,15 @@
+class InferenceError(Exception):
+    """An error caused by the request, returned to the caller with a status code"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class Overloaded(InferenceError):
+    """A request turned away because the service is busy, with the seconds to wait before retrying"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message, 503)
+        self.retry_after = retry_after
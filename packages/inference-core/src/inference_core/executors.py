@@ -0,0 +1,65 @@
+"""
+Sized thread pools for the stages that release the GIL.
+
+Flask runs every request on its own thread, so without a limit a burst of
+requests decodes and encodes as many images at once as there are requests,
+each on top of the model's own threads. Running those stages in fixed pools
+caps how many run at once, while the Python work around them (parsing,
+drawing, building responses) carries on on the request threads.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from .startup import lazy_import
+
+cv2 = lazy_import('cv2')
+
+logger = logging.getLogger(__name__)
+
+
+class StageExecutors:
+    """A thread pool per stage, stages without a pool run on the calling thread"""
+
+    def __init__(self):
+        self._pools = {}
+        self._sizes = {}
+
+    def configure(self, sizes):
+        """Set the number of threads for each stage, 0 runs the stage on the calling thread"""
+        for name, size in sizes.items():
+            previous = self._pools.pop(name, None)
+            if size > 0:
+                self._pools[name] = ThreadPoolExecutor(size, thread_name_prefix=f'{name}-stage')
+            self._sizes[name] = size
+            if previous:
+                previous.shutdown(wait=False)
+
+    def run(self, name, fn, *args):
+        """Run a function in a stage's pool and wait for its result"""
+        pool = self._pools.get(name)
+        if pool is None:
+            return fn(*args)
+        return pool.submit(fn, *args).result()
+
+    def map(self, name, fn, items):
+        """Run a function over several items at once in a stage's pool, returns the results in order"""
+        pool = self._pools.get(name)
+        if pool is None or len(items) < 2:
+            return [fn(item) for item in items]
+        return list(pool.map(fn, items))
+
+    def stats(self):
+        return dict(self._sizes)
+
+
+# Shared by everything in the process, create_app sizes the pools from the service's settings
+executors = StageExecutors()
+
+
+def configure_threads(settings):
+    """
+    Limit OpenCV's own thread pool to the service's intra-op threads.
+    Called from a model loader, services using torch or onnxruntime set the
+    same limit on those as well.
+    """
+    cv2.setNumThreads(settings.intra_op_threads)
+    logger.info(f"Using {settings.intra_op_threads} intra-op thread(s) per model instance")
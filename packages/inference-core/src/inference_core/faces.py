@@ -0,0 +1,48 @@
+"""
+OpenCV's SSD face detector and the labels of the age and gender nets from
+https://github.com/smahesh29/Gender-and-Age-Detection, which `ageandgender`
+and `facelandmarks` both run.
+"""
+from .startup import lazy_import
+
+cv2 = lazy_import('cv2')
+
+FACE_CONFIDENCE = 0.7
+# Pixels kept around a face when it's cropped for the age and gender nets
+FACE_PADDING = 20
+AGES = ['(0-2)', '(4-6)', '(8-12)', '(15-20)',
+        '(25-32)', '(38-43)', '(48-53)', '(60-100)']
+GENDERS = ['Male', 'Female']
+MODEL_MEAN_VALUES = (78.4263377603, 87.7689143744, 114.895847746)
+
+
+def detect_faces(net, frame, conf_threshold=FACE_CONFIDENCE):
+    """
+    Detect the faces in a frame, returns their boxes clamped to the frame and
+    their confidence. The detector only takes one frame at a time.
+    """
+    height = frame.shape[0]
+    width = frame.shape[1]
+    blob = cv2.dnn.blobFromImage(frame, 1.0, (300, 300), [
+                                 104, 117, 123], True, False)
+
+    net.setInput(blob)
+    detections = net.forward()
+    faces = []
+    for i in range(detections.shape[2]):
+        confidence = detections[0, 0, i, 2]
+        if confidence > conf_threshold:
+            x1 = max(0, int(detections[0, 0, i, 3]*width))
+            y1 = max(0, int(detections[0, 0, i, 4]*height))
+            x2 = min(width - 1, int(detections[0, 0, i, 5]*width))
+            y2 = min(height - 1, int(detections[0, 0, i, 6]*height))
+            if x2 > x1 and y2 > y1:
+                faces.append({"box": (x1, y1, x2, y2), "confidence": float(confidence)})
+    return faces
+
+
+def face_crop(frame, box, padding=FACE_PADDING):
+    """The padded crop around a face's box that the age and gender nets take"""
+    x1, y1, x2, y2 = box
+    return frame[max(0, y1-padding):min(y2+padding, frame.shape[0]-1),
+                 max(0, x1-padding):min(x2+padding, frame.shape[1]-1)]
@@ -0,0 +1,163 @@
+import time
+import threading
+from admission import AdmissionMetrics
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+)
+
+# Buckets from 1ms to 30s, stages range from base64 encoding to a full model forward
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+STAGE_SECONDS = Histogram(
+    'inference_stage_seconds', 'Time spent in each stage of handling a request',
+    ['stage'], buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    'inference_request_seconds', 'Time taken to handle a request, by endpoint',
+    ['endpoint'], buckets=LATENCY_BUCKETS)
+REQUESTS = Counter(
+    'inference_requests_total', 'Requests handled, by endpoint and outcome',
+    ['endpoint', 'outcome'])
+IN_FLIGHT = Gauge(
+    'inference_in_flight_requests', 'Requests currently being handled', ['endpoint'])
+BATCH_SIZE = Histogram(
+    'inference_batch_size', 'Number of items in each batch run by the model', buckets=BATCH_BUCKETS)
+MODEL_LOAD_SECONDS = Gauge(
+    'inference_model_load_seconds', 'Time taken to load and warm up the model pool', ['model'])
+STARTUP_SECONDS = Gauge(
+    'inference_startup_seconds', 'Time taken by each step of starting up, such as imports and loading the model',
+    ['step'])
+MODEL_POOL_AVAILABLE = Gauge(
+    'inference_model_pool_available', 'Model instances that are free to take a batch', ['model'])
+
+ADMISSION_METRICS = AdmissionMetrics(
+    active=Gauge(
+        'inference_admission_active', 'Requests holding a slot, running rather than queued'),
+    queue_depth=Gauge(
+        'inference_admission_queue_depth', 'Requests waiting for a slot, by priority', ['priority']),
+    shed=Counter(
+        'inference_admission_shed_total', 'Requests turned away with a 503, by priority and reason',
+        ['priority', 'reason']),
+    wait_seconds=Histogram(
+        'inference_admission_wait_seconds', 'Time requests waited for a slot, by priority',
+        ['priority'], buckets=LATENCY_BUCKETS),
+)
+
+
+class _Stage:
+    """Times a block with perf_counter and records it, cheap enough to wrap anything"""
+
+    __slots__ = ('metrics', 'name', 'histogram', 'started')
+
+    def __init__(self, metrics, name, histogram):
+        self.metrics = metrics
+        self.name = name
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        self.histogram.observe(elapsed)
+        self.metrics._record(self.name, elapsed)
+        return False
+
+
+class Metrics:
+    """Stage timings and counters, exported at /metrics for Prometheus and summarised at /stats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._stages = {}
+        self._histograms = {}
+        self._batches = {'count': 0, 'items': 0, 'max': 0}
+        self._startup = {}
+
+    def stage(self, name):
+        """Time the code inside a with block as a pipeline stage"""
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = STAGE_SECONDS.labels(name)
+        return _Stage(self, name, histogram)
+
+    def observe(self, name, seconds):
+        """Record how long a stage took"""
+        self.stage(name).histogram.observe(seconds)
+        self._record(name, seconds)
+
+    def _record(self, name, seconds):
+        with self._lock:
+            timing = self._stages.get(name)
+            if timing is None:
+                timing = self._stages[name] = {'count': 0, 'total': 0.0, 'max': 0.0}
+            timing['count'] += 1
+            timing['total'] += seconds
+            if seconds > timing['max']:
+                timing['max'] = seconds
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe_batch(self, size):
+        BATCH_SIZE.observe(size)
+        with self._lock:
+            self._batches['count'] += 1
+            self._batches['items'] += size
+            self._batches['max'] = max(self._batches['max'], size)
+
+    def request(self, endpoint, outcome, seconds):
+        """Record a finished request, the outcome is success, rejected, shed or error"""
+        REQUEST_SECONDS.labels(endpoint).observe(seconds)
+        REQUESTS.labels(endpoint, outcome).inc()
+        self.increment('requests')
+        self.increment(outcome)
+
+    def startup(self, step, seconds):
+        """Record how long a step of starting up took, such as importing a module"""
+        STARTUP_SECONDS.labels(step).set(seconds)
+        with self._lock:
+            self._startup[step] = seconds
+
+    def in_flight(self, endpoint):
+        """A gauge of the requests currently being handled by an endpoint, used as a context manager"""
+        return IN_FLIGHT.labels(endpoint).track_inprogress()
+
+    def snapshot(self):
+        with self._lock:
+            stages = {
+                name: {
+                    'count': timing['count'],
+                    'avg_ms': round(timing['total'] / timing['count'] * 1000, 2),
+                    'max_ms': round(timing['max'] * 1000, 2),
+                }
+                for name, timing in self._stages.items()
+            }
+            batches = self._batches
+            return {
+                'startup': {step: round(seconds, 3) for step, seconds in self._startup.items()},
+                'counters': dict(self._counters),
+                'stages': stages,
+                'batches': {
+                    'count': batches['count'],
+                    'avg_size': round(batches['items'] / batches['count'], 2) if batches['count'] else 0,
+                    'max_size': batches['max'],
+                },
+            }
+
+
+# Shared by everything in the process so helpers like decode_image can record their stage
+metrics = Metrics()
+
+
+def stage(name):
+    """Time a block as a stage with the process's metrics"""
+    return metrics.stage(name)
+
+
+def export():
+    """Render every metric in the Prometheus text format, returns the body and content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
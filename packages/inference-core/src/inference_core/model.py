@@ -0,0 +1,105 @@
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from .metrics import MODEL_LOAD_SECONDS, MODEL_POOL_AVAILABLE, metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ModelPool:
+    """
+    Loads a fixed number of model instances once and lends them out to one caller at a time.
+    Models such as OpenCV DNN nets aren't safe to share between threads, so each
+    batch borrows its own instance and returns it when it's done.
+    """
+
+    def __init__(self, loader, size=1, warmup=None, name='model'):
+        self.loader = loader
+        self.size = max(1, size)
+        self.warmup = warmup
+        self.name = name
+        self.load_seconds = None
+        self.error = None
+
+        self._models = queue.Queue()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def load(self):
+        """Load and warm up every instance, does nothing if they're already loaded"""
+        if self._loaded:
+            return
+
+        with self._lock:
+            if self._loaded:
+                return
+
+            started = time.perf_counter()
+            warmup_seconds = 0.0
+            for _ in range(self.size):
+                model = self.loader()
+                if self.warmup:
+                    warmup_started = time.perf_counter()
+                    self.warmup(model)
+                    warmup_seconds += time.perf_counter() - warmup_started
+                self._models.put(model)
+
+            self.load_seconds = time.perf_counter() - started
+            self._loaded = True
+            self._ready.set()
+            metrics.startup('load', self.load_seconds - warmup_seconds)
+            metrics.startup('warmup', warmup_seconds)
+            MODEL_LOAD_SECONDS.labels(self.name).set(self.load_seconds)
+            MODEL_POOL_AVAILABLE.labels(self.name).set(self.size)
+            logger.info(f"Loaded {self.size} {self.name} instance(s) in {self.load_seconds:.2f}s")
+
+    def start(self):
+        """Load and warm up the instances on a background thread, `wait` blocks until they're ready"""
+        if self._loaded or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._load_in_background, name=f'{self.name}-loader', daemon=True)
+        self._thread.start()
+
+    def _load_in_background(self):
+        try:
+            self.load()
+        except Exception as e:
+            self.error = e
+            logger.error(f"Failed to load {self.name}: {str(e)}", exc_info=True)
+            self._ready.set()
+
+    def wait(self, timeout=None):
+        """Wait for the instances to load, returns whether they're ready"""
+        self._ready.wait(timeout)
+        return self._loaded
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """Borrow a model instance, waiting until one is free"""
+        self.load()
+        model = self._models.get(timeout=timeout)
+        available = MODEL_POOL_AVAILABLE.labels(self.name)
+        available.dec()
+        try:
+            yield model
+        finally:
+            self._models.put(model)
+            available.inc()
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'size': self.size,
+            'loaded': self._loaded,
+            'error': str(self.error) if self.error else None,
+            'available': self._models.qsize(),
+            'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+        }
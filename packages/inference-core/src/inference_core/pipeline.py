@@ -0,0 +1,44 @@
+from .batching import DirectBatcher
+from .metrics import metrics as default_metrics
+
+
+class Pipeline:
+    """
+    Runs a request through preprocess, batch, infer and postprocess.
+
+    - preprocess(upload) turns the request into an item, such as a decoded image
+    - infer(model, items) runs a batch of items with a model from the pool and
+      returns one output per item
+    - postprocess(item, output) turns an item's output into the response
+    """
+
+    def __init__(self, pool, infer, preprocess=None, postprocess=None, batcher=None, metrics=None):
+        self.pool = pool
+        self.infer = infer
+        self.preprocess = preprocess or (lambda upload: upload)
+        self.postprocess = postprocess or (lambda item, output: output)
+        self.batcher = batcher or DirectBatcher()
+        self.metrics = metrics or default_metrics
+
+        self.batcher.start(self.infer_batch)
+
+    def infer_batch(self, items):
+        """Run a batch of preprocessed items with a free model, for endpoints that build their own batches"""
+        self.metrics.observe_batch(len(items))
+        with self.pool.acquire() as model, self.metrics.stage('infer'):
+            outputs = self.infer(model, items)
+
+        if len(outputs) != len(items):
+            raise RuntimeError(f"Expected {len(items)} outputs from the model, got {len(outputs)}")
+        return outputs
+
+    def run(self, upload):
+        with self.metrics.stage('preprocess'):
+            item = self.preprocess(upload)
+
+        # Includes the time spent waiting for the batch to fill and for a free model
+        with self.metrics.stage('batch'):
+            output = self.batcher.submit(item)
+
+        with self.metrics.stage('postprocess'):
+            return self.postprocess(item, output)
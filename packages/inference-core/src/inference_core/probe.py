@@ -0,0 +1,96 @@
+"""
+Read an image's dimensions from its header, so uploads that would take too
+much memory to decode are rejected before decoding them.
+"""
+import struct
+from .errors import InferenceError
+
+# JPEG start of frame markers, the others in C0-CF are DHT, JPG and DAC
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(data):
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in JPEG_SOF:
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            i += 2
+            continue
+        i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+
+def _webp_size(data):
+    chunk = bytes(data[12:16])
+    if chunk == b'VP8 ' and len(data) >= 30:
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    return None
+
+
+def _bmp_size(data):
+    header = struct.unpack('<I', data[14:18])[0]
+    if header == 12:
+        return struct.unpack('<HH', data[18:22])
+    if len(data) >= 26:
+        width, height = struct.unpack('<ii', data[18:26])
+        return abs(width), abs(height)
+    return None
+
+
+def image_size(data):
+    """The (width, height) from a PNG, JPEG, GIF, BMP or WebP header, or None for other formats"""
+    head = bytes(data[:32])
+    if head.startswith(b'\x89PNG\r\n\x1a\n') and len(head) >= 24:
+        return struct.unpack('>II', head[16:24])
+    if head.startswith(b'\xff\xd8'):
+        return _jpeg_size(data)
+    if head[:6] in (b'GIF87a', b'GIF89a') and len(head) >= 10:
+        return struct.unpack('<HH', head[6:10])
+    if head.startswith(b'BM') and len(head) >= 22:
+        return _bmp_size(head)
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return _webp_size(head)
+    return None
+
+
+class ImageLimits:
+    """The largest image the service will decode"""
+
+    def __init__(self, max_pixels=0, max_dimension=0):
+        self.max_pixels = max_pixels
+        self.max_dimension = max_dimension
+
+    def configure(self, max_pixels, max_dimension):
+        self.max_pixels = max_pixels
+        self.max_dimension = max_dimension
+
+    def check(self, data):
+        """Raise an InferenceError if the image's header says it's larger than the limits"""
+        size = image_size(data)
+        if size is not None:
+            self.check_size(*size)
+
+    def check_size(self, width, height):
+        """Raise an InferenceError if an image or video frame of this size is larger than the limits"""
+        if self.max_dimension and max(width, height) > self.max_dimension:
+            raise InferenceError(f"The image is too large, it can be at most {self.max_dimension} pixels wide or tall.", 413)
+        if self.max_pixels and width * height > self.max_pixels:
+            raise InferenceError(f"The image is too large, it can be at most {self.max_pixels / 1e6:g} megapixels.", 413)
+
+
+# Shared by everything in the process, create_app sets them from the service's settings
+limits = ImageLimits()
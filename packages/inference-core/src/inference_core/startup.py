@@ -0,0 +1,110 @@
+"""
+Helpers for starting quickly: modules such as torch and onnxruntime are only
+imported when they're first used, so the app can answer /health while the
+models load, and optimized ONNX models can be cached between starts.
+"""
+import os
+import time
+import hashlib
+import logging
+import importlib
+import threading
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """A module that's imported the first time one of its attributes is used"""
+
+    def __init__(self, name):
+        self._lazy_name = name
+        self._lazy_module = None
+        self._lazy_lock = threading.Lock()
+
+    def _load(self):
+        if self._lazy_module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._lazy_name)
+                    metrics.startup(f'import:{self._lazy_name}', time.perf_counter() - started)
+                    self._lazy_module = module
+        return self._lazy_module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        state = 'imported' if self._lazy_module is not None else 'not imported'
+        return f"<lazy module '{self._lazy_name}' ({state})>"
+
+
+def lazy_import(name):
+    """Import a module when it's first used, e.g. `torch = lazy_import('torch')`"""
+    return LazyModule(name)
+
+
+def _cached_model_path(model_path, cache_dir, kind=''):
+    """Where a derived copy of a model is cached, keyed on the model and the onnxruntime version"""
+    import onnxruntime
+
+    stat = os.stat(model_path)
+    fingerprint = f'{os.path.abspath(model_path)}:{stat.st_size}:{stat.st_mtime_ns}:{onnxruntime.__version__}'
+    name = os.path.splitext(os.path.basename(model_path))[0] + (f'-{kind}' if kind else '')
+    return os.path.join(cache_dir, f'{name}-{hashlib.sha256(fingerprint.encode()).hexdigest()[:16]}.onnx')
+
+
+def onnx_snapshot(model_path, cache_dir):
+    """
+    Get a copy of an ONNX model with onnxruntime's graph optimizations already
+    applied, creating it on first use. Sessions start faster from the snapshot
+    since there's less left to optimize. Returns the original path if it fails.
+    """
+    import onnxruntime
+
+    path = _cached_model_path(model_path, cache_dir)
+    if os.path.exists(path):
+        return path
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        partial = f'{path}.{os.getpid()}.tmp'
+
+        # The extended optimizations don't depend on the CPU, unlike the layout ones made when a session loads
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        options.optimized_model_filepath = partial
+
+        started = time.perf_counter()
+        onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        os.replace(partial, path)
+        logger.info(f"Saved an optimized snapshot of {model_path} in {time.perf_counter() - started:.2f}s")
+        return path
+    except Exception as e:
+        logger.warning(f"Couldn't create a snapshot of {model_path}: {str(e)}")
+        return model_path
+
+
+def onnx_quantize(model_path, cache_dir):
+    """
+    Get an INT8 copy of an ONNX model, with its weights quantized ahead of time
+    and its activations quantized as it runs, creating it on first use. This
+    needs the `onnx` package, so images should create it when they're built.
+    """
+    path = _cached_model_path(model_path, cache_dir, 'int8')
+    if os.path.exists(path):
+        return path
+
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise RuntimeError(f"Quantizing {model_path} needs the onnx package: {str(e)}") from e
+
+    os.makedirs(cache_dir, exist_ok=True)
+    partial = f'{path}.{os.getpid()}.tmp'
+    started = time.perf_counter()
+    quantize_dynamic(model_path, partial, weight_type=QuantType.QUInt8)
+    os.replace(partial, path)
+    logger.info(f"Saved an INT8 copy of {model_path} in {time.perf_counter() - started:.2f}s")
+    return path
@@ -0,0 +1,162 @@
+"""
+Read uploads straight into reusable buffers.
+
+By default Werkzeug spools each uploaded file into memory or a temporary file,
+and reading it copies it again into a new bytes object. Instead, a multipart
+file is written as it's parsed into a buffer borrowed from a pool, and the
+upload's data is a view of that buffer, so a request holds one copy of its
+image and the buffers are reused between requests.
+"""
+import io
+import threading
+from flask import Request, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Buffers are allocated in steps so one fits uploads of similar sizes
+BUFFER_STEP = 64 * 1024
+
+
+class BufferPool:
+    """
+    Byte buffers lent to one request at a time, a few of them are kept for later
+    requests. Bodies over max_size, such as videos on routes with a higher limit,
+    are spooled by Werkzeug as usual.
+    """
+
+    def __init__(self, keep=2, max_size=None):
+        self.keep = keep
+        self.max_size = max_size
+        self._free = []
+        self._lock = threading.Lock()
+
+    def configure(self, keep, max_size=None):
+        with self._lock:
+            self.keep = keep
+            self.max_size = max_size
+            del self._free[keep:]
+
+    def acquire(self, size):
+        """Borrow a buffer of at least `size` bytes"""
+        with self._lock:
+            for i, buffer in enumerate(self._free):
+                if len(buffer) >= size:
+                    return self._free.pop(i)
+        return bytearray(-(-size // BUFFER_STEP) * BUFFER_STEP)
+
+    def release(self, buffer):
+        """Give a buffer back, replacing the smallest kept one if the pool is full"""
+        with self._lock:
+            if len(self._free) < self.keep:
+                self._free.append(buffer)
+            elif self._free:
+                smallest = min(range(len(self._free)), key=lambda i: len(self._free[i]))
+                if len(self._free[smallest]) < len(buffer):
+                    self._free[smallest] = buffer
+
+    def stats(self):
+        with self._lock:
+            return {'kept': len(self._free), 'bytes': sum(len(buffer) for buffer in self._free)}
+
+
+# Shared by everything in the process, create_app sets how many are kept
+buffers = BufferPool()
+
+
+class BufferedFile(io.RawIOBase):
+    """A readable and writable file backed by a buffer of a fixed size"""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = buffer
+        self._view = memoryview(buffer)
+        self._position = 0
+        self._size = 0
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        end = self._position + len(data)
+        if end > len(self._view):
+            raise RequestEntityTooLarge()
+        self._view[self._position:end] = data
+        self._position = end
+        self._size = max(self._size, end)
+        return len(data)
+
+    def readinto(self, target):
+        end = min(self._position + len(target), self._size)
+        count = max(0, end - self._position)
+        target[:count] = self._view[self._position:end]
+        self._position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def getbuffer(self):
+        """A view of what's been written, without copying it"""
+        return self._view[:self._size]
+
+
+class UploadRequest(Request):
+    """
+    A request that writes its multipart file into a buffer from the pool, it's returned when the request
+    ends. Only the first file gets a buffer, the body's size, so a request never borrows more than its
+    size however many parts it has. Any others are spooled by Werkzeug as usual.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Without a total length, such as a chunked request, the file's size isn't known up front
+        if not total_content_length or (buffers.max_size and total_content_length > buffers.max_size) \
+                or self.__dict__.get('upload_buffers'):
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+        buffer = buffers.acquire(total_content_length)
+        self.__dict__.setdefault('upload_buffers', []).append(buffer)
+        return BufferedFile(buffer)
+
+
+def release_buffers(exception=None):
+    """Return the current request's buffers to the pool, registered to run when each request ends"""
+    for buffer in request.__dict__.pop('upload_buffers', []):
+        buffers.release(buffer)
+
+
+def read_file(file):
+    """The contents of an uploaded file, a view of its buffer when it was read into one"""
+    if isinstance(file.stream, BufferedFile):
+        return file.stream.getbuffer()
+    return file.read()
+
+
+def read_body():
+    """Read the whole request body into a buffer from the pool, returns a view of it"""
+    length = request.content_length
+    if length is None:
+        return memoryview(request.get_data())
+
+    buffer = buffers.acquire(length)
+    request.__dict__.setdefault('upload_buffers', []).append(buffer)
+    view = memoryview(buffer)[:length]
+    read = 0
+    while read < length:
+        count = request.stream.readinto(view[read:])
+        if not count:
+            break
+        read += count
+    return view[:read]
@@ -0,0 +1,131 @@
+"""
+Decode a video and pick out the frames worth running a model on.
+
+Rather than sampling at a fixed rate, frames are scanned a few times a second
+and compared with the last frame sampled by their grayscale histograms, which
+is cheap on a small thumbnail. A frame is only sampled when the scene has
+changed, or when max_interval has passed without a change, so a static shot
+costs one detection rather than one per second.
+"""
+import logging
+from .errors import InferenceError
+from .metrics import stage
+from .probe import limits
+from .startup import lazy_import
+
+cv2 = lazy_import('cv2')
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (64, 36)
+HISTOGRAM_BINS = 32
+
+
+class SampledFrame:
+    """A frame picked from a video, with how much it differs from the previous one (0 to 1)"""
+
+    def __init__(self, index, timestamp, image, change):
+        self.index = index
+        self.timestamp = timestamp
+        self.image = image
+        self.change = change
+
+
+def histogram(frame):
+    """A normalized grayscale histogram of a small thumbnail of the frame"""
+    thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    values = cv2.calcHist([thumbnail], [0], None, [HISTOGRAM_BINS], [0, 256]).ravel()
+    return values / values.sum()
+
+
+class SceneSampler:
+    """
+    Samples the frames of a video where the scene changes.
+
+    - scan_fps: How many frames a second are compared, the rest are skipped
+      without being converted
+    - threshold: How different a frame's histogram must be from the last sample
+      to count as a new scene, from 0 to 1
+    - min_interval and max_interval: The fewest and most seconds between samples
+    - max_frames: The most frames sampled, 0 for no limit
+
+    `open` checks the video before any frames are read, then `frames` yields them.
+    """
+
+    def __init__(self, scan_fps=4, threshold=0.25, min_interval=0.5, max_interval=5, max_frames=0):
+        self.scan_fps = scan_fps
+        self.threshold = threshold
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_frames = max_frames
+
+        self.scanned = 0
+        self.sampled = 0
+        self.duration = 0
+        self.truncated = False
+        self._capture = None
+        self._fps = None
+
+    def open(self, path):
+        """Open a video, raises an InferenceError if it can't be read or its frames are too large"""
+        capture = cv2.VideoCapture(path)
+        try:
+            if not capture.isOpened():
+                raise InferenceError("The video you have uploaded is invalid.")
+            limits.check_size(int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        except InferenceError:
+            capture.release()
+            raise
+
+        self._capture = capture
+        self._fps = capture.get(cv2.CAP_PROP_FPS) or 25
+
+    def close(self):
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+    def frames(self):
+        """Yield the sampled frames of the opened video, then close it"""
+        try:
+            yield from self._scan()
+        finally:
+            self.close()
+
+    def _scan(self):
+        capture, fps = self._capture, self._fps
+        step = max(1, round(fps / self.scan_fps)) if self.scan_fps > 0 else 1
+        reference = None
+        last_sampled = None
+        index = -1
+        while True:
+            index += 1
+            timestamp = index / fps
+
+            # Skipped frames are still decoded, but not converted or compared
+            with stage('decode'):
+                if index % step:
+                    if not capture.grab():
+                        break
+                    continue
+                ok, frame = capture.read()
+            if not ok:
+                break
+
+            self.scanned += 1
+            self.duration = timestamp
+            current = histogram(frame)
+            change = 1.0 if reference is None else float(abs(current - reference).sum()) / 2
+            elapsed = None if last_sampled is None else timestamp - last_sampled
+
+            if elapsed is None or (change >= self.threshold and elapsed >= self.min_interval) \
+                    or elapsed >= self.max_interval:
+                if self.max_frames and self.sampled >= self.max_frames:
+                    self.truncated = True
+                    logger.info(f"Stopped sampling at {timestamp:.2f}s after {self.sampled} frames")
+                    return
+
+                reference = current
+                last_sampled = timestamp
+                self.sampled += 1
+                yield SampledFrame(index, round(timestamp, 3), frame, round(change, 3))
@@ -1,18 +1,59 @@
 import os
-import cv2
-import base64
-import numpy as np
+import json
+import time
+import logging
+import tempfile
 from dotenv import load_dotenv
-from nudenet import NudeDetector
-from flask import Flask, request, jsonify
-
+from flask import Response, jsonify, request
+from inference_core import (
+    InferenceError, ModelPool, Overloaded, Pipeline, SceneSampler, Settings, configure_threads, create_app,
+    create_batcher, decode_image, encode_images, lazy_import, onnx_quantize, onnx_snapshot, overloaded_response,
+    request_file, serve, stage, wait_until_ready
+)
+
+# Imported when the model loads, so the app can answer /health straight away
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+nudenet = lazy_import('nudenet')
+onnxruntime = lazy_import('onnxruntime')
 
 load_dotenv()
 
-DEBUG_MODE = os.getenv('NUDENET_DEBUG', 'false').lower() == 'true'
-USE_640M_WEIGHTS = os.getenv('NUDENET_USE_640M', 'false').lower() == 'true'
+settings = Settings('NUDENET', 7001)
+
+# The model variants and their input resolution, each also has an INT8 version named like `320n-int8`
+MODEL_VARIANTS = {
+    '320n': 320,
+    '640m': 640,
+}
+INT8_SUFFIX = '-int8'
+
+# The default model and any in NUDENET_MODELS are loaded, requests pick one with the `model` option
+USE_640M_WEIGHTS = settings.get('USE_640M', 'false').lower() == 'true'
+DEFAULT_MODEL = settings.get('DEFAULT_MODEL', '640m' if USE_640M_WEIGHTS else '320n')
+MODELS = list(dict.fromkeys([DEFAULT_MODEL, *filter(None, settings.get('MODELS', '').replace(' ', '').split(','))]))
+QUANTIZED_DIR = settings.get('QUANTIZED_DIR', './quantized')
+
+# onnxruntime session options, the intra-op threads are the usual INTRA_OP_THREADS
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL',
+}
+ORT_GRAPH_OPTIMIZATION = settings.get('ORT_GRAPH_OPTIMIZATION', 'all').lower()
+ORT_INTER_OP_THREADS = int(settings.get('ORT_INTER_OP_THREADS', 1))
+ORT_PARALLEL_EXECUTION = settings.get('ORT_EXECUTION_MODE', 'sequential').lower() == 'parallel'
+ORT_MEMORY_ARENA = settings.get('ORT_MEMORY_ARENA', 'true').lower() == 'true'
+ORT_MEMORY_PATTERN = settings.get('ORT_MEMORY_PATTERN', 'true').lower() == 'true'
+
+# Videos can be larger than images, frames are sampled when the scene changes and detected in batches
+VIDEO_MAX_UPLOAD_MB = int(settings.get('VIDEO_MAX_UPLOAD_MB', 500))
+VIDEO_BATCH_SIZE = max(1, int(settings.get('VIDEO_BATCH_SIZE', 8)))
+VIDEO_SCAN_FPS = float(settings.get('VIDEO_SCAN_FPS', 4))
+VIDEO_MAX_FRAMES = int(settings.get('VIDEO_MAX_FRAMES', 300))
 
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
 default_options_to_censor = {
     "FEMALE_GENITALIA_COVERED": True,
@@ -51,82 +92,289 @@ def label_image(image, detections):
     return image
 
 
-def detect_nudity(image, options):
-    """This function detects nudity in an image and returns a censored version of the image."""
-    if USE_640M_WEIGHTS:
-        # print what's in the current directory
-        print(os.listdir())
+def session_options():
+    """The onnxruntime session options from the environment"""
+    if ORT_GRAPH_OPTIMIZATION not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Invalid NUDENET_ORT_GRAPH_OPTIMIZATION: {ORT_GRAPH_OPTIMIZATION}. "
+                         f"Valid options are: {', '.join(GRAPH_OPTIMIZATION_LEVELS)}")
 
-        detector = NudeDetector(model_path='./640m.onnx',
-                                inference_resolution=640)
-    else:
-        detector = NudeDetector()
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = getattr(
+        onnxruntime.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[ORT_GRAPH_OPTIMIZATION])
+    options.intra_op_num_threads = settings.intra_op_threads
+    options.inter_op_num_threads = ORT_INTER_OP_THREADS
+    options.execution_mode = (onnxruntime.ExecutionMode.ORT_PARALLEL if ORT_PARALLEL_EXECUTION
+                              else onnxruntime.ExecutionMode.ORT_SEQUENTIAL)
+    options.enable_cpu_mem_arena = ORT_MEMORY_ARENA
+    options.enable_mem_pattern = ORT_MEMORY_PATTERN
+    return options
 
-    image_bytes = image.read()
-    image_array = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), -1)
 
-    detections = detector.detect(image_array)
+_detector_class = None
 
-    # Censor & label the image based on options
-    labelled_image = label_image(image_array.copy(), detections)
-    censored_image = censor_image(image_array.copy(), detections, options)
 
-    # Convert images to base64 for response
-    labelled_image_bytes = cv2.imencode('.jpg', labelled_image)[1].tobytes()
-    censored_image_bytes = cv2.imencode('.jpg', censored_image)[1].tobytes()
+def detector_class():
+    """
+    A NudeDetector whose constructor creates its session with the service's options. NudeDetector's own
+    constructor always loads the model with default options, so calling it and swapping the session loads
+    and optimizes every model twice. The class is made on first use so nudenet is imported with the model.
+    """
+    global _detector_class
+    if _detector_class is None:
+        class Detector(nudenet.NudeDetector):
+            def __init__(self, model_path, resolution):
+                self.onnx_session = onnxruntime.InferenceSession(
+                    model_path, session_options(), providers=['CPUExecutionProvider'])
+                self.input_width = resolution
+                self.input_height = resolution
+                self.input_name = self.onnx_session.get_inputs()[0].name
 
-    labelled_image_base64 = base64.b64encode(
-        labelled_image_bytes).decode('utf-8')
-    censored_image_base64 = base64.b64encode(
-        censored_image_bytes).decode('utf-8')
+        _detector_class = Detector
+    return _detector_class
 
-    return jsonify({
-        "success": True,
-        "result": detections,
-        "labelled_image": labelled_image_base64,
-        "censored_image": censored_image_base64
-    }), 200
 
+def create_detector(model_path, resolution):
+    """Create a NudeDetector with its session limited to the service's intra-op threads"""
+    return detector_class()(model_path, resolution)
 
-@app.route('/infer', methods=['POST'])
-def infer():
-    if 'image' not in request.files:
-        return jsonify({
-            "error": "You haven’t included an image in the `image` parameter.",
-            "success": False
-        }), 400
 
-    image = request.files['image']
+def model_path(name):
+    """The path to a model variant's ONNX file, quantizing it the first time if it's an INT8 variant"""
+    base = name.removesuffix(INT8_SUFFIX)
+    if base not in MODEL_VARIANTS:
+        valid = [*MODEL_VARIANTS, *(f'{variant}{INT8_SUFFIX}' for variant in MODEL_VARIANTS)]
+        raise ValueError(f"Invalid model: {name}. Valid options are: {', '.join(valid)}")
 
-    if image.filename == '':
-        return jsonify({
-            "error": "The file you have uploaded is invalid.",
-            "success": False
-        }), 400
+    path = os.path.join(os.path.dirname(nudenet.__file__), '320n.onnx') if base == '320n' else f'./{base}.onnx'
+    if name.endswith(INT8_SUFFIX):
+        path = onnx_quantize(path, QUANTIZED_DIR)
+    if settings.snapshot_dir:
+        path = onnx_snapshot(path, settings.snapshot_dir)
+    return path
 
-    options = request.form.to_dict()
 
+def load_detectors():
+    """Load every model variant in NUDENET_MODELS, each instance in the pool has one of each"""
+    configure_threads(settings)
+    return {name: create_detector(model_path(name), MODEL_VARIANTS[name.removesuffix(INT8_SUFFIX)])
+            for name in MODELS}
+
+
+def warmup(detectors):
+    """Run a blank image through each detector so the first request doesn't pay for it"""
+    for detector in detectors.values():
+        detector.detect(np.zeros((64, 64, 3), np.uint8))
+
+
+def form_float(fields, name, default):
+    """Read a number from the form fields, with the usual error if it isn't one"""
+    try:
+        return float(fields.get(name, default))
+    except ValueError:
+        raise InferenceError(f"The `{name}` parameter must be a number.")
+
+
+def parse_options(fields):
+    """The classes to censor and the threshold from the form fields"""
+    options = dict(fields)
     for key in default_options_to_censor:
         options[key] = options.get(
             key, str(default_options_to_censor[key])).lower() == 'true'
+    options['threshold'] = form_float(fields, 'threshold', 0.5)
+    return options
+
+
+def parse_model(fields):
+    """The model variant a request asked for, one of the loaded ones"""
+    model = fields.get('model', DEFAULT_MODEL)
+    if model not in MODELS:
+        raise InferenceError(f"Invalid model: {model}. Valid options are: {', '.join(MODELS)}")
+    return model
+
+
+def preprocess(upload):
+    return {
+        "image": decode_image(upload.data, cv2.IMREAD_UNCHANGED),
+        "options": parse_options(upload.options),
+        "model": parse_model(upload.options),
+    }
+
+
+def detect_nudity(detectors, items):
+    """Detect nudity in a batch of images, running the images for each model variant together"""
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault(item['model'], []).append(i)
+
+    results = [None] * len(items)
+    for name, indexes in groups.items():
+        detector = detectors[name]
+        images = [items[i]['image'] for i in indexes]
+        if len(images) == 1:
+            outputs = [detector.detect(images[0])]
+        else:
+            outputs = detector.detect_batch(images, batch_size=len(images))
+        for i, output in zip(indexes, outputs):
+            results[i] = output
+        pipeline.metrics.increment(f'model:{name}', len(indexes))
+    return results
+
+
+def postprocess(item, detections):
+    """Censor & label the image based on options"""
+    image = item['image']
+    with stage('draw'):
+        labelled_image = label_image(image.copy(), detections)
+        censored_image = censor_image(image.copy(), detections, item['options'])
+
+    labelled, censored = encode_images([labelled_image, censored_image])
+    return {
+        "result": detections,
+        "labelled_image": labelled,
+        "censored_image": censored
+    }
+
+
+pipeline = Pipeline(
+    ModelPool(load_detectors, settings.pool_size, warmup, name='nudenet'),
+    detect_nudity,
+    preprocess=preprocess,
+    postprocess=postprocess,
+    batcher=create_batcher(settings)
+)
+app = create_app(__name__, pipeline, settings)
+
+
+def video_line(event, **fields):
+    return json.dumps({'event': event, **fields}) + '\n'
+
+
+def batches(frames, size):
+    """
+    Group the sampled frames into batches for the detector. The batches start
+    with one frame and double up to `size`, so the first results come back
+    quickly and an early exit doesn't wait for a full batch to be decoded.
+    """
+    batch = []
+    limit = 1
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == limit:
+            yield batch
+            batch = []
+            limit = min(limit * 2, size)
+    if batch:
+        yield batch
+
+
+def discard_video(sampler, path, slot):
+    """Close the video, remove its temporary file and give up its admission slot, if that hasn't been done already"""
+    sampler.close()
+    if os.path.exists(path):
+        os.remove(path)
+    slot.release()
+
+
+def moderate_video(sampler, path, slot, options, model, early_exit, outcome):
+    """
+    Generator yielding NDJSON lines with the detections for each sampled frame, then a summary. How it
+    went is set in `outcome`, which is recorded when the response closes.
+    """
+    outcome['status'] = 'success'
+    flagged = []
+    try:
+        with pipeline.metrics.in_flight('video'):
+            for batch in batches(sampler.frames(), VIDEO_BATCH_SIZE):
+                outputs = pipeline.infer_batch([{'image': frame.image, 'model': model} for frame in batch])
+
+                for frame, detections in zip(batch, outputs):
+                    hits = [detection for detection in detections
+                            if options.get(detection['class'], False) and detection['score'] >= options['threshold']]
+                    if hits:
+                        flagged.append(frame.timestamp)
+                    yield video_line('frame', timestamp=frame.timestamp, frame=frame.index,
+                                     scene_change=frame.change, flagged=bool(hits), result=detections)
+                    if hits and early_exit:
+                        break
+                if flagged and early_exit:
+                    break
+
+            yield video_line('done', success=True, flagged=bool(flagged), flagged_timestamps=flagged,
+                             stopped_early=bool(flagged and early_exit), truncated=sampler.truncated,
+                             scanned_frames=sampler.scanned, sampled_frames=sampler.sampled,
+                             duration=round(sampler.duration, 3))
+    except InferenceError as e:
+        outcome['status'] = 'rejected'
+        yield video_line('error', error=e.message, status=e.status, success=False)
+    except Exception as e:
+        outcome['status'] = 'error'
+        logger.error(f"Error moderating a video: {str(e)}", exc_info=True)
+        yield video_line('error', error=str(e), status=500, success=False)
+    finally:
+        discard_video(sampler, path, slot)
 
+
+@app.route('/video', methods=['POST'])
+def video():
+    started = time.perf_counter()
+    request.max_content_length = VIDEO_MAX_UPLOAD_MB * 1024 * 1024
+
+    # A video runs many batches, so it waits behind single images and is shed first, the slot is held
+    # until its results have streamed
     try:
-        return detect_nudity(image, options)
+        slot = app.extensions['admission'].acquire('low')
+    except Overloaded as e:
+        pipeline.metrics.request('video', 'shed', time.perf_counter() - started)
+        return overloaded_response(e)
+
+    try:
+        wait_until_ready(pipeline, settings)
+        with pipeline.metrics.stage('parse'):
+            file = request_file('video', 'a video')
+        fields = request.form
+        options = parse_options(fields)
+        model = parse_model(fields)
+        early_exit = fields.get('early_exit', 'false').lower() == 'true'
+        sampler = SceneSampler(
+            scan_fps=VIDEO_SCAN_FPS,
+            threshold=form_float(fields, 'scene_threshold', 0.25),
+            min_interval=form_float(fields, 'min_interval', 0.5),
+            max_interval=form_float(fields, 'max_interval', 5),
+            max_frames=VIDEO_MAX_FRAMES
+        )
+
+        # OpenCV reads videos from a path, so the upload is saved and opened before streaming the results
+        handle, path = tempfile.mkstemp(suffix=os.path.splitext(file.filename)[1])
+        with os.fdopen(handle, 'wb') as f:
+            file.save(f)
+        try:
+            sampler.open(path)
+        except Exception:
+            os.remove(path)
+            raise
+    except InferenceError as e:
+        slot.release()
+        pipeline.metrics.request('video', 'rejected', time.perf_counter() - started)
+        return jsonify({"error": e.message, "success": False}), e.status
     except Exception as e:
-        return jsonify({
-            "error": str(e),
-            "success": False
-        }), 500
+        slot.release()
+        pipeline.metrics.request('video', 'error', time.perf_counter() - started)
+        logger.error(f"Error handling {request.path}: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e), "success": False}), 500
+
+    # A client that goes away before the results start streaming is recorded as cancelled
+    outcome = {'status': 'cancelled'}
+    response = Response(moderate_video(sampler, path, slot, options, model, early_exit, outcome),
+                        mimetype='application/x-ndjson')
 
+    def close():
+        # The generator's own cleanup doesn't run if it never started
+        discard_video(sampler, path, slot)
+        pipeline.metrics.request('video', outcome['status'], time.perf_counter() - started)
 
-@app.route('/health', methods=['GET'])
-def health():
-    return jsonify({
-        "success": True,
-        "message": "OK"
-    }), 200
+    response.call_on_close(close)
+    return response
 
 
 if __name__ == '__main__':
-    port = int(os.getenv('NUDENET_PORT', 7001))
-    app.run(host='0.0.0.0', port=port, debug=DEBUG_MODE)
+    serve(app, settings)
@@ -0,0 +1,21 @@
+"""
+Create the INT8 copies of the models ahead of time, so containers don't need
+the onnx package or the time to quantize them when they start. Run when the
+image is built:
+
+    uv run --with onnx src/quantize.py
+"""
+import os
+import sys
+import logging
+import nudenet
+from inference_core import onnx_quantize
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+QUANTIZED_DIR = os.getenv('NUDENET_QUANTIZED_DIR', './quantized')
+MODEL_PATHS = [os.path.join(os.path.dirname(nudenet.__file__), '320n.onnx'), './640m.onnx']
+
+if __name__ == '__main__':
+    for path in sys.argv[1:] or MODEL_PATHS:
+        print(onnx_quantize(path, QUANTIZED_DIR))
@@ -0,0 +1,100 @@
+"""
+Benchmark download throughput for each quality's download profile.
+
+Runs yt-dlp against a local, throttled HTTP server serving a progressive file
+and an HLS playlist, then reports MB/s for every profile in
+`VideoService.download_profiles` alongside yt-dlp's defaults.
+
+    uv run benchmarks/download_profiles.py --output results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import yt_dlp  # noqa: E402
+from video_service import VideoService  # noqa: E402
+from fixtures import FixtureServer  # noqa: E402
+
+TARGETS = {
+    'http': 'video.mp4',
+    'hls': 'hls/index.m3u8',
+}
+
+
+def run_download(url, download_opts):
+    """Download a URL into a temporary directory, returns bytes and seconds taken"""
+    with tempfile.TemporaryDirectory(prefix='videodl-bench-') as tmp:
+        ydl_opts = {
+            'outtmpl': os.path.join(tmp, 'download.%(ext)s'),
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'fixup': 'never',
+            **download_opts,
+        }
+
+        started = time.perf_counter()
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ydl.download([url])
+        elapsed = time.perf_counter() - started
+
+        size = sum(os.path.getsize(os.path.join(tmp, name))
+                   for name in os.listdir(tmp))
+
+    return size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bandwidth', type=float, default=4.0,
+                        help='Per-connection bandwidth limit in MB/s (default: 4)')
+    parser.add_argument('--file-size', type=int, default=32,
+                        help='Size of the progressive fixture in MB (default: 32)')
+    parser.add_argument('--segments', type=int, default=32,
+                        help='Number of 1MB HLS segments (default: 32)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    video_service = VideoService(storage=None)
+    profiles = {'default': None, **video_service.download_profiles}
+
+    results = []
+    with FixtureServer(bytes_per_second=int(args.bandwidth * 1024 * 1024),
+                       file_size=args.file_size * 1024 * 1024,
+                       segment_count=args.segments) as server:
+        for name in profiles:
+            if name == 'default':
+                download_opts = {}
+            else:
+                download_opts = video_service._get_download_opts(name)
+
+            for target, path in TARGETS.items():
+                size, elapsed = run_download(server.url(path), download_opts)
+                results.append({
+                    'profile': name,
+                    'target': target,
+                    'bytes': size,
+                    'seconds': round(elapsed, 3),
+                    'mb_per_second': round(size / elapsed / 1024 / 1024, 2),
+                    'options': download_opts,
+                })
+
+    print(f"{'PROFILE':<10} {'TARGET':<6} {'MB':>8} {'SECONDS':>8} {'MB/S':>8}")
+    for result in results:
+        print(f"{result['profile']:<10} {result['target']:<6} "
+              f"{result['bytes'] / 1024 / 1024:>8.1f} {result['seconds']:>8.2f} "
+              f"{result['mb_per_second']:>8.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'bandwidth_mb_per_second': args.bandwidth,
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
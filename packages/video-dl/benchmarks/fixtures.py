@@ -0,0 +1,341 @@
+"""
+A local HTTP server for benchmarking downloads without touching the network.
+
+It serves a progressive file, an HLS playlist and a DASH manifest made of
+random segments, and throttles each connection so parallel fragments and
+streams make a difference the same way they do against a real CDN.
+
+It also serves video pages for `FixtureIE`, a stand-in for a site's extractor
+that fetches a player script and format manifests the way YouTube's does,
+unless it's given the same extractor arguments to skip them.
+
+`LocalStorage` stands in for R2 so the whole API can be run offline.
+"""
+import os
+import re
+import json
+import time
+import shutil
+import tempfile
+import threading
+from urllib.parse import urljoin
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from yt_dlp.extractor.common import InfoExtractor
+from yt_dlp.utils import ExtractorError
+from storage import R2Storage
+
+DASH_MANIFEST = """<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT{duration}S"
+     minBufferTime="PT2S" profiles="urn:mpeg:dash:profile:isoff-main:2011">
+  <Period>
+    <AdaptationSet mimeType="video/mp4" segmentAlignment="true">
+      <Representation id="720p" bandwidth="2000000" width="1280" height="720" codecs="avc1.64001f,mp4a.40.2">
+        <SegmentList duration="4" timescale="1">
+          <Initialization sourceURL="init.mp4"/>
+{segments}
+        </SegmentList>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+
+SUBTITLE = """WEBVTT
+
+00:00:00.000 --> 00:00:04.000
+A fixture subtitle
+"""
+
+# Languages with automatic captions on each page, YouTube offers over a hundred
+CAPTION_LANGUAGES = ['de', 'es', 'fr', 'hi', 'it', 'ja', 'ko', 'nl', 'pl', 'pt', 'ru', 'sv', 'tr', 'uk', 'zh']
+
+VIDEO_PAGES = {
+    'captioned': {'subtitles': ['en'], 'automatic_captions': ['en', *CAPTION_LANGUAGES]},
+    'auto-captioned': {'subtitles': [], 'automatic_captions': ['en', *CAPTION_LANGUAGES]},
+    'uncaptioned': {'subtitles': [], 'automatic_captions': CAPTION_LANGUAGES},
+    'private': {'error': 'This video is private'},
+}
+
+
+def create_page_fixtures(root, player_size=2 * 1024 * 1024):
+    """Write the video pages, their subtitles and thumbnails, and a player script of the given size"""
+    for directory in ('pages', 'subs'):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    with open(os.path.join(root, 'player.js'), 'wb') as f:
+        f.write(os.urandom(player_size))
+
+    for video_id, options in VIDEO_PAGES.items():
+        page = {'id': video_id, 'error': options.get('error')}
+        if not page['error']:
+            page.update({
+                'title': f'Fixture video {video_id}',
+                'description': f'A local fixture page for {video_id}.',
+                'thumbnails': [{'url': f'/thumbs/{video_id}-{width}.jpg', 'width': width}
+                               for width in (120, 480, 1280)],
+            })
+            for field in ('subtitles', 'automatic_captions'):
+                page[field] = {}
+                for language in options[field]:
+                    page[field][language] = [
+                        {'ext': ext, 'url': f'/subs/{video_id}.{field}.{language}.{ext}'} for ext in ('srv3', 'vtt')
+                    ]
+                    for ext in ('srv3', 'vtt'):
+                        with open(os.path.join(root, 'subs', f'{video_id}.{field}.{language}.{ext}'), 'w') as f:
+                            f.write(SUBTITLE)
+
+        with open(os.path.join(root, 'pages', f'{video_id}.json'), 'w') as f:
+            json.dump(page, f)
+
+
+class FixtureIE(InfoExtractor):
+    """
+    Extracts the fixture pages, fetching the player script and HLS and DASH manifests to list formats
+    unless YouTube's `player_skip` and `skip` extractor arguments say not to, like YouTube's extractor.
+    """
+
+    IE_NAME = 'fixture'
+    _VALID_URL = r'https?://127\.0\.0\.1:\d+/pages/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        page = self._download_json(f'{url}.json', video_id)
+        if page.get('error'):
+            raise ExtractorError(page['error'], expected=True, video_id=video_id)
+
+        formats = []
+        if 'js' not in self._configuration_arg('player_skip', ie_key='youtube'):
+            # Stands in for deciphering signatures, which needs the player script
+            self._request_webpage(urljoin(url, '/player.js'), video_id, note='Downloading player').read()
+            formats.append({'format_id': 'progressive', 'url': urljoin(url, '/video.mp4'), 'ext': 'mp4'})
+
+        skip = self._configuration_arg('skip', ie_key='youtube')
+        if 'hls' not in skip:
+            formats.extend(self._extract_m3u8_formats(urljoin(url, '/hls/index.m3u8'), video_id, 'mp4', fatal=False))
+        if 'dash' not in skip:
+            formats.extend(self._extract_mpd_formats(urljoin(url, '/dash/manifest.mpd'), video_id, fatal=False))
+
+        def tracks(field):
+            return {language: [{**track, 'url': urljoin(url, track['url'])} for track in entries]
+                    for language, entries in page[field].items()}
+
+        return {
+            'id': video_id,
+            'title': page['title'],
+            'description': page['description'],
+            'thumbnails': [{**thumbnail, 'url': urljoin(url, thumbnail['url'])} for thumbnail in page['thumbnails']],
+            'subtitles': tracks('subtitles'),
+            'automatic_captions': tracks('automatic_captions'),
+            'formats': formats,
+        }
+
+
+def create_fixtures(root, file_size=32 * 1024 * 1024, segment_count=32, segment_size=1024 * 1024):
+    """Write the progressive file, HLS and DASH fixtures to a directory"""
+    os.makedirs(os.path.join(root, 'hls'), exist_ok=True)
+    os.makedirs(os.path.join(root, 'dash'), exist_ok=True)
+
+    with open(os.path.join(root, 'video.mp4'), 'wb') as f:
+        f.write(os.urandom(file_size))
+
+    playlist = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        '#EXT-X-TARGETDURATION:4',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+    ]
+    for i in range(segment_count):
+        with open(os.path.join(root, 'hls', f'segment{i}.ts'), 'wb') as f:
+            f.write(os.urandom(segment_size))
+        playlist += ['#EXTINF:4.0,', f'segment{i}.ts']
+    playlist.append('#EXT-X-ENDLIST')
+
+    with open(os.path.join(root, 'hls', 'index.m3u8'), 'w') as f:
+        f.write('\n'.join(playlist) + '\n')
+
+    # A single muxed representation, so it downloads without needing ffmpeg to merge
+    with open(os.path.join(root, 'dash', 'init.mp4'), 'wb') as f:
+        f.write(os.urandom(1024))
+    segments = []
+    for i in range(segment_count):
+        with open(os.path.join(root, 'dash', f'segment{i}.m4s'), 'wb') as f:
+            f.write(os.urandom(segment_size))
+        segments.append(f'          <SegmentURL media="segment{i}.m4s"/>')
+
+    with open(os.path.join(root, 'dash', 'manifest.mpd'), 'w') as f:
+        f.write(DASH_MANIFEST.format(duration=segment_count * 4, segments='\n'.join(segments)))
+
+    create_page_fixtures(root)
+
+
+class ThrottledHandler(SimpleHTTPRequestHandler):
+    """Serves files with Range support and a per-connection bandwidth limit"""
+
+    bytes_per_second = 4 * 1024 * 1024
+    chunk_size = 64 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        self.server.requests.append(self.path)
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404, 'File not found')
+            return None
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2) or end), size - 1)
+            else:
+                start = max(0, size - int(match.group(2)))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+        f = open(path, 'rb')
+        f.seek(start)
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        started = time.monotonic()
+        sent = 0
+        while self._remaining > 0:
+            data = source.read(min(self.chunk_size, self._remaining))
+            if not data:
+                break
+            outputfile.write(data)
+            sent += len(data)
+            self._remaining -= len(data)
+
+            # Sleep until we're back under the bandwidth limit
+            ahead = sent / self.bytes_per_second - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+class FixtureServer:
+    """Runs the fixture server in a background thread, use as a context manager"""
+
+    def __init__(self, bytes_per_second=4 * 1024 * 1024, **fixture_options):
+        self.bytes_per_second = bytes_per_second
+        self.fixture_options = fixture_options
+        self.root = None
+        self.server = None
+
+    def __enter__(self):
+        self.root = tempfile.mkdtemp(prefix='videodl-fixtures-')
+        create_fixtures(self.root, **self.fixture_options)
+
+        root = self.root
+        bytes_per_second = self.bytes_per_second
+
+        class Handler(ThrottledHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=root, **kwargs)
+
+        Handler.bytes_per_second = bytes_per_second
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        # Paths requested, so callers can check what was fetched
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}/{path}'
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+
+class LocalBody:
+    """A stored file opened like the body of an S3 response"""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        return iter(lambda: self.file.read(chunk_size), b'')
+
+    def close(self):
+        self.file.close()
+
+
+class LocalStorage(R2Storage):
+    """Keeps files in a local directory instead of R2, for running the API offline"""
+
+    def __init__(self, root, public_url='http://storage.invalid'):
+        self.root = root
+        self.bucket = None
+        self.public_url = public_url
+        self.upload_concurrency = 1
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def get_presigned_url(self, key, expires_in=300):
+        return f"{self.get_public_url(key)}?expires_in={expires_in}"
+
+    def file_exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def exists_many(self, keys):
+        return {key for key in keys if self.file_exists(key)}
+
+    def get_json(self, key):
+        if not self.file_exists(key):
+            return None
+        with open(self._path(key), 'rb') as f:
+            return json.load(f)
+
+    def get_size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def get_object(self, key, byte_range=None, if_none_match=None):
+        if not self.file_exists(key):
+            return None
+        return {'Body': LocalBody(self._path(key)), 'ContentLength': self.get_size(key)}
+
+    def iter_objects(self, prefix=''):
+        for directory, _, names in os.walk(self.root):
+            for name in sorted(names):
+                key = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    yield key, os.path.getsize(os.path.join(directory, name))
+
+    def put_json(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+
+    def upload_file(self, local_file, key, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(str(local_file), path)
+        return self.get_public_url(key)
+
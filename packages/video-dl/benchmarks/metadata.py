@@ -0,0 +1,101 @@
+"""
+Benchmark getting metadata and subtitles without downloading the video.
+
+Runs `VideoService` against local fixture pages through `FixtureIE`, a
+stand-in extractor that fetches a player script and format manifests like
+YouTube's does. For each page it compares a full extraction processed by
+yt-dlp, as `/download` without a format used to do, with the metadata fast
+path, then repeats the fast path to show what's served from storage and the
+negative cache.
+
+    uv run benchmarks/metadata.py --output metadata.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from video_service import VideoService  # noqa: E402
+from fixtures import FixtureServer, FixtureIE, LocalStorage, VIDEO_PAGES  # noqa: E402
+
+
+def measure(server, call):
+    """Run a call, returns its result, the seconds taken and the fixture paths it requested"""
+    before = len(server.requests)
+    started = time.perf_counter()
+    try:
+        result = call()
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    elapsed = time.perf_counter() - started
+    return result, elapsed, server.requests[before:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bandwidth', type=float, default=4.0,
+                        help='Per-connection bandwidth limit in MB/s (default: 4)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    storage_root = tempfile.mkdtemp(prefix='videodl-bench-storage-')
+    results = []
+    try:
+        with FixtureServer(bytes_per_second=int(args.bandwidth * 1024 * 1024),
+                           file_size=1024 * 1024, segment_count=4, segment_size=64 * 1024) as server:
+            service = VideoService(LocalStorage(storage_root), extractors=[FixtureIE])
+
+            def full(url):
+                # A fresh service each time, so nothing is cached
+                baseline = VideoService(LocalStorage(storage_root), extractors=[FixtureIE])
+                provider = baseline._get_provider(url)
+                info = baseline._extract_info(url, provider, baseline._extract_video_id(url, provider))
+                job, output_path = baseline._reserve_scratch(0)
+                try:
+                    _, subtitle_file = baseline._write_subtitles_processed(info, output_path)
+                    return {'success': True, 'subtitle': bool(subtitle_file)}
+                finally:
+                    job.release()
+
+            for video_id in VIDEO_PAGES:
+                url = server.url(f'pages/{video_id}')
+                runs = {
+                    'full': lambda: full(url),
+                    'metadata': lambda: service.get_metadata_and_subtitles(url),
+                    'repeat': lambda: service.get_metadata_and_subtitles(url),
+                }
+                for mode, call in runs.items():
+                    result, elapsed, requests = measure(server, call)
+                    results.append({
+                        'page': video_id,
+                        'mode': mode,
+                        'success': result.get('success', False),
+                        'subtitle': bool(result.get('subtitle') or (result.get('urls') or {}).get('subtitle')),
+                        'seconds': round(elapsed, 3),
+                        'requests': len(requests),
+                        'paths': requests,
+                    })
+
+            negative_cache = service.negative_cache.stats()
+    finally:
+        shutil.rmtree(storage_root, ignore_errors=True)
+
+    print(f"{'PAGE':<16} {'MODE':<10} {'OK':>3} {'SUBS':>5} {'SECONDS':>8} {'REQUESTS':>9}")
+    for result in results:
+        print(f"{result['page']:<16} {result['mode']:<10} {'yes' if result['success'] else 'no':>3} "
+              f"{'yes' if result['subtitle'] else 'no':>5} {result['seconds']:>8.3f} {result['requests']:>9}")
+    print(f"\nnegative cache: {negative_cache['hits']} hits, {negative_cache['misses']} misses")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'bandwidth_mb_per_second': args.bandwidth, 'results': results,
+                       'negative_cache': negative_cache}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import yt_dlp
+from admission import Overloaded
+from config import BULK_WORKERS, BULK_PER_HOST_CONCURRENCY, BULK_PER_HOST_RATE, BULK_MAX_ITEMS
+from video_service import VideoService
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST_TYPES = ('playlist', 'multi_video')
+# Extractors whose results list videos rather than being one, such as a YouTube channel's tabs
+PLAYLIST_IE_SUFFIXES = ('Tab', 'Playlist')
+# How far playlists of playlists are followed, a channel's root is a playlist of its tab playlists
+MAX_EXPAND_DEPTH = 3
+
+
+class HostLimiter:
+    """Limits how many jobs run at once and how often they start for each host"""
+
+    def __init__(self, concurrency, rate):
+        self.concurrency = max(1, concurrency)
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._semaphores = {}
+        self._next_start = {}
+        self._lock = threading.Lock()
+
+    def _get_semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(
+                    self.concurrency)
+            return self._semaphores[host]
+
+    def _wait_for_turn(self, host):
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start_at + self.interval
+
+        delay = start_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    @contextmanager
+    def slot(self, host):
+        semaphore = self._get_semaphore(host)
+        with semaphore:
+            self._wait_for_turn(host)
+            yield
+
+
+class BulkIngestor:
+    """Expands playlists and downloads many videos in parallel, reporting progress as NDJSON"""
+
+    def __init__(self, video_service: VideoService, admission=None):
+        self.video_service = video_service
+        # Each download takes one of the service's slots, so bulk jobs count against its concurrency
+        self.admission = admission
+        self.storage = video_service.storage
+        self.workers = max(1, BULK_WORKERS)
+        self.max_items = BULK_MAX_ITEMS
+        self.limiter = HostLimiter(BULK_PER_HOST_CONCURRENCY, BULK_PER_HOST_RATE)
+
+    def _expand_url(self, url):
+        """Generator expanding a playlist or channel URL into its video URLs using flat extraction"""
+        provider = self.video_service._get_provider(url)
+        if self.video_service._match_video_id(url, provider):
+            yield url
+            return
+
+        ydl_opts = {
+            'extract_flat': 'in_playlist',
+            'skip_download': True,
+            'quiet': not logger.isEnabledFor(logging.DEBUG),
+            'no_warnings': not logger.isEnabledFor(logging.DEBUG),
+        }
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+
+            if info.get('_type') not in PLAYLIST_TYPES:
+                yield url
+                return
+
+            yield from self._entry_urls(ydl, info.get('entries'), {url}, 1)
+
+    def _entry_urls(self, ydl, entries, visited, depth):
+        """
+        Generator yielding the video URLs in a flat playlist's entries. A channel's root URL comes back as a
+        playlist of its tabs (Videos, Shorts, Live), either as nested playlists or as links to the tab
+        extractor, so both are followed until only videos are left.
+        """
+        for entry in entries or []:
+            if not entry:
+                continue
+
+            entry_url = entry.get('webpage_url') or entry.get('url')
+            nested = entry.get('_type') in PLAYLIST_TYPES
+            linked = entry.get('_type') in ('url', 'url_transparent') \
+                and (entry.get('ie_key') or '').endswith(PLAYLIST_IE_SUFFIXES)
+
+            if not nested and not linked:
+                if entry_url:
+                    yield entry_url
+                continue
+
+            if depth >= MAX_EXPAND_DEPTH or entry_url in visited:
+                logger.debug(f"Not expanding nested playlist: {entry_url}")
+                continue
+            if entry_url:
+                visited.add(entry_url)
+
+            if nested and entry.get('entries') is not None:
+                yield from self._entry_urls(ydl, entry['entries'], visited, depth + 1)
+                continue
+            if not entry_url:
+                continue
+
+            try:
+                info = ydl.extract_info(entry_url, download=False, ie_key=entry.get('ie_key'))
+            except yt_dlp.utils.DownloadError as e:
+                # A channel without a Shorts or Live tab shouldn't stop its other tabs being expanded
+                logger.warning(f"Error expanding {entry_url}: {str(e)}")
+                continue
+
+            if info.get('_type') in PLAYLIST_TYPES:
+                yield from self._entry_urls(ydl, info.get('entries'), visited, depth + 1)
+
+    def expand(self, urls):
+        """
+        Expand every input URL, dropping duplicates and keeping the original order. Returns the video URLs
+        and a list of `(url, error)` for inputs that couldn't be expanded, such as a private playlist.
+        """
+        expanded = []
+        failed = []
+        seen = set()
+        for url in urls:
+            try:
+                for entry_url in self._expand_url(url):
+                    if entry_url in seen:
+                        continue
+                    seen.add(entry_url)
+                    expanded.append(entry_url)
+                    if len(expanded) >= self.max_items:
+                        return expanded, failed
+            except Exception as e:
+                logger.error(f"Error expanding {url}: {str(e)}", exc_info=True)
+                failed.append((url, str(e)))
+        return expanded, failed
+
+    def _get_item(self, url, quality):
+        provider = self.video_service._get_provider(url)
+        video_id = self.video_service._extract_video_id(url, provider)
+        if quality is None:
+            key = self.storage.get_key(video_id, provider, "json")
+        else:
+            key = self.storage.get_key(video_id, provider, "mp4", quality)
+
+        return {
+            'url': url,
+            'provider': provider,
+            'video_id': video_id,
+            'key': key,
+            'host': self.video_service._get_host(url),
+        }
+
+    @contextmanager
+    def _admit(self, cancelled):
+        """
+        Hold a `low` slot from the admission controller while a video downloads. A shed download waits as
+        long as it's told to and tries again, until the job is cancelled.
+        """
+        if self.admission is None:
+            yield
+            return
+
+        while True:
+            try:
+                slot = self.admission.acquire('low')
+                break
+            except Overloaded as e:
+                if cancelled.wait(e.retry_after):
+                    raise
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def _process_item(self, item, quality, cancelled):
+        with self.limiter.slot(item['host']), self._admit(cancelled):
+            return self.video_service.process_video(item['url'], quality)
+
+    def _line(self, event, **fields):
+        return json.dumps({'event': event, **fields}, ensure_ascii=False) + '\n'
+
+    def run(self, urls, quality=None):
+        """Generator yielding NDJSON lines with progress and per-video results"""
+        expanded, failed = self.expand(urls)
+
+        items = [self._get_item(url, quality) for url in expanded]
+
+        try:
+            # Videos are stored as refs to their content, older ones directly under their key
+            existing = self.storage.exists_many(
+                key for item in items for key in (item['key'], self.storage.ref_key(item['key'])))
+        except Exception as e:
+            logger.warning(f"Error checking existing keys: {str(e)}")
+            existing = set()
+
+        stored = {item['key'] for item in items
+                  if item['key'] in existing or self.storage.ref_key(item['key']) in existing}
+        pending = [item for item in items if item['key'] not in stored]
+        progress = {
+            'total': len(items) + len(failed),
+            'skipped': len(items) - len(pending),
+            'completed': 0,
+            'failed': 0,
+        }
+
+        yield self._line('expanded', **progress)
+
+        for url, error in failed:
+            progress['completed'] += 1
+            progress['failed'] += 1
+            yield self._line('result', url=url, result={'success': False, 'error': error},
+                             progress=dict(progress))
+
+        for item in items:
+            if item['key'] in stored:
+                ref = self.storage.resolve(item['key'], existing) or {'key': item['key']}
+                yield self._line('skipped', url=item['url'], video_id=item['video_id'],
+                                 provider=item['provider'],
+                                 stored_url=self.storage.get_public_url(ref['key']))
+
+        if not pending:
+            yield self._line('done', success=progress['failed'] == 0, **progress)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(self.workers, len(pending)))
+        cancelled = threading.Event()
+        try:
+            futures = {
+                executor.submit(self._process_item, item, quality, cancelled): item
+                for item in pending
+            }
+
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(
+                        f"Error processing {item['url']}: {str(e)}", exc_info=True)
+                    result = {'success': False, 'error': str(e)}
+
+                progress['completed'] += 1
+                if not result.get('success'):
+                    progress['failed'] += 1
+
+                yield self._line('result', url=item['url'], result=result,
+                                 progress=dict(progress))
+
+            yield self._line('done', success=progress['failed'] == 0, **progress)
+        finally:
+            # If the client disconnects we stop queued jobs from starting and waiting ones from retrying
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,23 +12,154 @@ COOKIE_FILE = PROJECT_ROOT / 'cookies.txt'
 DEBUG_MODE = os.getenv('VIDEODL_DEBUG', 'false').lower() == 'true'
 PORT = int(os.getenv('VIDEODL_PORT', '7004'))
 
+# Worker processes run by server.py, they're replaced one at a time on SIGHUP
+WORKERS = int(os.getenv('VIDEODL_WORKERS', '2'))
+PID_FILE = os.getenv('VIDEODL_PID_FILE', '/tmp/video-dl.pid')
+WORKER_READY_TIMEOUT = int(os.getenv('VIDEODL_WORKER_READY_TIMEOUT', '60'))
+DRAIN_TIMEOUT = int(os.getenv('VIDEODL_DRAIN_TIMEOUT', '300'))
+
+# Where workers write their Prometheus metrics so /metrics can combine them
+METRICS_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR') or os.getenv('VIDEODL_METRICS_DIR', '/tmp/video-dl-metrics')
+
+# Requests each worker handles at once, others wait in a queue of VIDEODL_MAX_QUEUE for up to
+# VIDEODL_QUEUE_TIMEOUT seconds before they're turned away with a 503, a concurrency of 0 admits everything
+MAX_CONCURRENCY = int(os.getenv('VIDEODL_MAX_CONCURRENCY', '4'))
+MAX_QUEUE = int(os.getenv('VIDEODL_MAX_QUEUE', '16'))
+QUEUE_TIMEOUT = float(os.getenv('VIDEODL_QUEUE_TIMEOUT', '30'))
+# Longest Retry-After a shed request is told to wait, downloads hold their slot for minutes
+MAX_RETRY_AFTER = max(1, int(os.getenv('VIDEODL_MAX_RETRY_AFTER', '300')))
+
+# How long (in seconds) and how many yt-dlp extraction results are kept in memory
+INFO_CACHE_TTL = int(os.getenv('VIDEODL_INFO_CACHE_TTL', '300'))
+INFO_CACHE_SIZE = int(os.getenv('VIDEODL_INFO_CACHE_SIZE', '256'))
+
+# How long and how many results that found nothing are remembered, such as a video without English subtitles
+NEGATIVE_CACHE_TTL = int(os.getenv('VIDEODL_NEGATIVE_CACHE_TTL', '3600'))
+NEGATIVE_CACHE_SIZE = int(os.getenv('VIDEODL_NEGATIVE_CACHE_SIZE', '4096'))
+
+# Download tuning, these override the per-quality profiles in VideoService when set
+CONCURRENT_FRAGMENTS = int(os.getenv('VIDEODL_CONCURRENT_FRAGMENTS')) if os.getenv('VIDEODL_CONCURRENT_FRAGMENTS') else None
+HTTP_CHUNK_SIZE = int(os.getenv('VIDEODL_HTTP_CHUNK_SIZE')) if os.getenv('VIDEODL_HTTP_CHUNK_SIZE') else None
+PARALLEL_STREAMS = os.getenv('VIDEODL_PARALLEL_STREAMS').lower() == 'true' if os.getenv('VIDEODL_PARALLEL_STREAMS') else None
+EXTERNAL_DOWNLOADER = os.getenv('VIDEODL_EXTERNAL_DOWNLOADER', '')
+EXTERNAL_DOWNLOADER_ARGS = os.getenv('VIDEODL_EXTERNAL_DOWNLOADER_ARGS', '-x 8 -s 8 -k 1M')
+
+# Scratch space for downloads, sizes are in bytes and a quota of 0 means only free disk space is checked
+SCRATCH_QUOTA = int(os.getenv('VIDEODL_SCRATCH_QUOTA', '0'))
+SCRATCH_MIN_FREE = int(os.getenv('VIDEODL_SCRATCH_MIN_FREE', str(1024 * 1024 * 1024)))
+SCRATCH_WAIT_TIMEOUT = int(os.getenv('VIDEODL_SCRATCH_WAIT_TIMEOUT', '600'))
+SCRATCH_DEFAULT_ESTIMATE = int(os.getenv('VIDEODL_SCRATCH_DEFAULT_ESTIMATE', str(512 * 1024 * 1024)))
+SCRATCH_TMPFS_DIR = os.getenv('VIDEODL_SCRATCH_TMPFS_DIR', '')
+SCRATCH_TMPFS_QUOTA = int(os.getenv('VIDEODL_SCRATCH_TMPFS_QUOTA', str(512 * 1024 * 1024)))
+SCRATCH_TMPFS_MAX_JOB = int(os.getenv('VIDEODL_SCRATCH_TMPFS_MAX_JOB', str(64 * 1024 * 1024)))
+SCRATCH_SWEEP_INTERVAL = int(os.getenv('VIDEODL_SCRATCH_SWEEP_INTERVAL', '300'))
+SCRATCH_ORPHAN_AGE = int(os.getenv('VIDEODL_SCRATCH_ORPHAN_AGE', '3600'))
+
+# Post-download processing, videos are remuxed so their index is at the front and HLS ladders are built on request
+FASTSTART = os.getenv('VIDEODL_FASTSTART', 'true').lower() == 'true'
+TRANSCODE_PRESET = os.getenv('VIDEODL_TRANSCODE_PRESET', 'veryfast')
+HLS_DEFAULT = os.getenv('VIDEODL_HLS', 'false').lower() == 'true'
+HLS_SEGMENT_SECONDS = int(os.getenv('VIDEODL_HLS_SEGMENT_SECONDS', '6'))
+HLS_WORKERS = int(os.getenv('VIDEODL_HLS_WORKERS', '2'))
+
+# Limits for partial downloads
+MAX_CLIP_SECONDS = int(os.getenv('VIDEODL_MAX_CLIP_SECONDS', '600'))
+MAX_THUMBNAILS = int(os.getenv('VIDEODL_MAX_THUMBNAILS', '20'))
+
+# Bulk ingestion limits
+BULK_WORKERS = int(os.getenv('VIDEODL_BULK_WORKERS', '4'))
+BULK_PER_HOST_CONCURRENCY = int(os.getenv('VIDEODL_BULK_PER_HOST_CONCURRENCY', '2'))
+BULK_PER_HOST_RATE = float(os.getenv('VIDEODL_BULK_PER_HOST_RATE', '1.0'))
+BULK_MAX_ITEMS = int(os.getenv('VIDEODL_BULK_MAX_ITEMS', '500'))
+
+# Serving stored files
+FILE_CHUNK_SIZE = int(os.getenv('VIDEODL_FILE_CHUNK_SIZE', str(1024 * 1024)))
+PRESIGN_EXPIRES = int(os.getenv('VIDEODL_PRESIGN_EXPIRES', '300'))
+PRESIGN_MAX_EXPIRES = int(os.getenv('VIDEODL_PRESIGN_MAX_EXPIRES', '3600'))
+
 REQUIRED_ENV_VARS = ['R2_ENDPOINT', 'R2_ACCESS_KEY', 'R2_SECRET_KEY', 'R2_BUCKET_NAME', 'R2_PUBLIC_URL']
 
 URL_PATTERNS = {
     "youtube": {
-        "domains": ["youtube.com", "youtu.be", "m.youtube.com", "www.youtube.com"],
+        "domains": ["youtube.com", "youtu.be", "youtube-nocookie.com"],
         "patterns": [
             r'(?:v=|\/v\/|\/embed\/|youtu\.be\/)([a-zA-Z0-9_-]{11})',
             r'(?:watch\?|&)v=([a-zA-Z0-9_-]{11})',
-            r'(?:shorts\/)([a-zA-Z0-9_-]{11})',
+            r'(?:shorts\/|live\/)([a-zA-Z0-9_-]{11})',
         ]
     },
     "tiktok": {
-        "domains": ["tiktok.com", "vm.tiktok.com", "vt.tiktok.com", "www.tiktok.com", "m.tiktok.com"],
+        "domains": ["tiktok.com"],
         "patterns": [
             r'\/video\/(\d+)',
             r'vm\.tiktok\.com\/(\w+)',
             r'vt\.tiktok\.com\/(\w+)',
         ]
+    },
+    "vimeo": {
+        "domains": ["vimeo.com"],
+        "patterns": [
+            r'player\.vimeo\.com\/video\/(\d+)',
+            r'vimeo\.com\/(?:.*\/)?(\d+)',
+        ]
+    },
+    "twitter": {
+        "domains": ["twitter.com", "x.com"],
+        "patterns": [
+            r'\/status(?:es)?\/(\d+)',
+        ]
+    },
+    "instagram": {
+        "domains": ["instagram.com"],
+        "patterns": [
+            r'\/(?:p|reels?|tv)\/([\w-]+)',
+        ]
+    },
+    "dailymotion": {
+        "domains": ["dailymotion.com", "dai.ly"],
+        "patterns": [
+            r'\/video\/([a-zA-Z0-9]+)',
+            r'dai\.ly\/([a-zA-Z0-9]+)',
+        ]
+    },
+    "twitch": {
+        "domains": ["twitch.tv"],
+        "patterns": [
+            r'\/videos\/(\d+)',
+            r'clips\.twitch\.tv\/([\w-]+)',
+            r'\/clip\/([\w-]+)',
+        ]
+    },
+    "reddit": {
+        "domains": ["reddit.com", "redd.it"],
+        "patterns": [
+            r'\/comments\/(\w+)',
+            r'v\.redd\.it\/(\w+)',
+        ]
+    },
+    "facebook": {
+        "domains": ["facebook.com", "fb.watch"],
+        "patterns": [
+            r'\/videos\/(?:[^\/?#]+\/)?(\d+)',
+            r'\/reel\/(\d+)',
+            r'[?&]v=(\d+)',
+            r'fb\.watch\/([\w-]+)',
+        ]
     }
 }
+
+# Hostname to provider lookup, subdomains are resolved by walking up to a listed domain
+PROVIDER_DOMAINS = {
+    domain: provider
+    for provider, config in URL_PATTERNS.items()
+    for domain in config['domains']
+}
+
+# Each provider's patterns combined into one precompiled regex, every pattern has one group
+PROVIDER_PATTERNS = {
+    provider: re.compile('|'.join(f'(?:{pattern})' for pattern in config['patterns']))
+    for provider, config in URL_PATTERNS.items()
+}
+
+# Query parameters that don't change which video a URL points to
+TRACKING_PARAMS = {'fbclid', 'gclid', 'igshid', 'si', 'feature', 'ref', 'ref_src', 'share_id'}
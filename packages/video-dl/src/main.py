@@ -1,7 +1,15 @@
-from flask import Flask, request, jsonify
-from config import DEBUG_MODE, PORT, REQUIRED_ENV_VARS, DOWNLOAD_DIR
-from storage import R2Storage
+from flask import Flask, Response, request, jsonify
+from config import (
+    DEBUG_MODE, PORT, REQUIRED_ENV_VARS, DOWNLOAD_DIR, MAX_CLIP_SECONDS, MAX_THUMBNAILS,
+    SCRATCH_SWEEP_INTERVAL, SCRATCH_ORPHAN_AGE, FILE_CHUNK_SIZE, PRESIGN_EXPIRES,
+    PRESIGN_MAX_EXPIRES, HLS_DEFAULT, MAX_CONCURRENCY, MAX_QUEUE, QUEUE_TIMEOUT, MAX_RETRY_AFTER
+)
+from botocore.exceptions import ClientError
+from storage import R2Storage, error_code
 from video_service import VideoService
+from bulk import BulkIngestor
+from admission import AdmissionController, Overloaded
+from metrics import ADMISSION_METRICS, MetricsMiddleware, export as export_metrics
 import os
 import logging
 
@@ -22,17 +30,94 @@ if missing_vars:
 DOWNLOAD_DIR.mkdir(exist_ok=True)
 
 app = Flask(__name__)
+app.wsgi_app = MetricsMiddleware(app.wsgi_app)
 storage = R2Storage()
 video_service = VideoService(storage)
+video_service.scratch.start_sweeper(SCRATCH_SWEEP_INTERVAL, SCRATCH_ORPHAN_AGE)
 
+# Bounds the downloads each worker runs at once, bursts are queued briefly and then shed
+admission = AdmissionController(MAX_CONCURRENCY, MAX_QUEUE, QUEUE_TIMEOUT, metrics=ADMISSION_METRICS,
+                                max_retry_after=MAX_RETRY_AFTER)
+bulk_ingestor = BulkIngestor(video_service, admission)
 
-@app.route('/download', methods=['POST'])
-def download():
-    data = request.get_json()
-    if not data or 'url' not in data:
-        logger.warning("Request received without URL")
-        return jsonify({"error": "No URL provided.", "success": False}), 400
+VALID_FORMATS = ['low', 'medium', 'high', 'max']
+VALID_MODES = ['video', 'clip', 'audio', 'thumbnail']
+
+
+@app.errorhandler(Overloaded)
+def overloaded(error):
+    return jsonify({"error": error.message, "success": False}), 503, {'Retry-After': str(error.retry_after)}
+
+
+def _parse_seconds(value):
+    """Parse a non-negative number of seconds, returns None if it's invalid"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        return None
+    return seconds if seconds >= 0 else None
 
+
+def download_partial(data, mode):
+    """Handle the clip, audio and thumbnail download modes"""
+    url = data['url']
+    format_quality = data.get('format')
+
+    if format_quality is not None and format_quality not in VALID_FORMATS:
+        logger.warning(f"Invalid format requested: {format_quality}")
+        return jsonify({
+            "error": f"Invalid format: {format_quality}. Valid options are: {', '.join(VALID_FORMATS)}",
+            "success": False
+        }), 400
+
+    if mode == 'clip':
+        start = _parse_seconds(data.get('start'))
+        end = _parse_seconds(data.get('end'))
+        if start is None or end is None or end <= start:
+            return jsonify({
+                "error": "A clip needs a `start` and `end` in seconds, with `end` after `start`.",
+                "success": False
+            }), 400
+        if end - start > MAX_CLIP_SECONDS:
+            return jsonify({
+                "error": f"Clips can be at most {MAX_CLIP_SECONDS} seconds long.",
+                "success": False
+            }), 400
+
+        logger.info(f"Processing clip from URL: {url} ({start}-{end}s)")
+        result = video_service.process_clip(url, start, end, format_quality)
+
+    elif mode == 'audio':
+        logger.info(f"Processing audio from URL: {url}")
+        result = video_service.process_audio(url)
+
+    else:
+        timestamps = data.get('timestamps')
+        if not isinstance(timestamps, list) or not timestamps:
+            return jsonify({
+                "error": "Thumbnails need a list of `timestamps` in seconds.",
+                "success": False
+            }), 400
+
+        timestamps = [_parse_seconds(timestamp) for timestamp in timestamps]
+        if any(timestamp is None for timestamp in timestamps):
+            return jsonify({"error": "Invalid timestamp provided.", "success": False}), 400
+        if len(timestamps) > MAX_THUMBNAILS:
+            return jsonify({
+                "error": f"At most {MAX_THUMBNAILS} thumbnails can be requested at once.",
+                "success": False
+            }), 400
+
+        logger.info(f"Processing {len(timestamps)} thumbnail(s) from URL: {url}")
+        result = video_service.process_thumbnails(url, timestamps)
+
+    return jsonify(result)
+
+
+def download_video(data):
+    """Handle the video download mode, or only the metadata and subtitles without a format"""
     format_quality = data.get('format')
 
     # If format is not specified, we'll just get metadata and subtitles
@@ -47,19 +132,21 @@ def download():
             logger.error(f"Error processing metadata: {str(e)}", exc_info=True)
             return jsonify({"error": "Failed to process metadata.", "success": False}), 500
 
-    valid_formats = ['low', 'medium', 'high', 'max']
-
-    if format_quality not in valid_formats:
+    if format_quality not in VALID_FORMATS:
         logger.warning(f"Invalid format requested: {format_quality}")
         return jsonify({
-            "error": f"Invalid format: {format_quality}. Valid options are: {', '.join(valid_formats)}",
+            "error": f"Invalid format: {format_quality}. Valid options are: {', '.join(VALID_FORMATS)}",
             "success": False
         }), 400
 
+    hls = data.get('hls', HLS_DEFAULT)
+    if not isinstance(hls, bool):
+        return jsonify({"error": "hls must be true or false.", "success": False}), 400
+
     try:
         logger.info(
             f"Processing video from URL: {data['url']} with format: {format_quality}")
-        result = video_service.process_video(data['url'], format_quality)
+        result = video_service.process_video(data['url'], format_quality, hls=hls)
         logger.info(f"Successfully processed video: {result.get('video_id')}")
         return jsonify(result)
     except Exception as e:
@@ -67,6 +154,64 @@ def download():
         return jsonify({"error": "Failed to process the video.", "success": False}), 500
 
 
+@app.route('/download', methods=['POST'])
+def download():
+    data = request.get_json()
+    if not data or 'url' not in data:
+        logger.warning("Request received without URL")
+        return jsonify({"error": "No URL provided.", "success": False}), 400
+
+    mode = data.get('mode', 'video')
+    if mode not in VALID_MODES:
+        logger.warning(f"Invalid mode requested: {mode}")
+        return jsonify({
+            "error": f"Invalid mode: {mode}. Valid options are: {', '.join(VALID_MODES)}",
+            "success": False
+        }), 400
+
+    if mode == 'video':
+        # Metadata alone is a single request to the site, so it goes ahead of downloads
+        with admission.admit('high' if data.get('format') is None else 'default'):
+            return download_video(data)
+
+    with admission.admit('default'):
+        try:
+            return download_partial(data, mode)
+        except Exception as e:
+            logger.error(f"Error processing {mode}: {str(e)}", exc_info=True)
+            return jsonify({"error": f"Failed to process the {mode}.", "success": False}), 500
+
+
+@app.route('/bulk', methods=['POST'])
+def bulk():
+    data = request.get_json()
+    if not data or not (data.get('urls') or data.get('url')):
+        logger.warning("Bulk request received without URLs")
+        return jsonify({"error": "No URLs provided.", "success": False}), 400
+
+    urls = data.get('urls') or []
+    if isinstance(urls, str):
+        urls = [urls]
+    if data.get('url'):
+        urls = [data['url'], *urls]
+
+    if not all(isinstance(url, str) for url in urls):
+        return jsonify({"error": "URLs must be strings.", "success": False}), 400
+
+    format_quality = data.get('format')
+    if format_quality is not None and format_quality not in VALID_FORMATS:
+        logger.warning(f"Invalid format requested: {format_quality}")
+        return jsonify({
+            "error": f"Invalid format: {format_quality}. Valid options are: {', '.join(VALID_FORMATS)}",
+            "success": False
+        }), 400
+
+    # Each of the job's downloads takes a `low` slot of its own, so they wait behind single requests
+    logger.info(f"Bulk processing {len(urls)} URL(s) with format: {format_quality}")
+    return Response(bulk_ingestor.run(urls, format_quality),
+                    mimetype='application/x-ndjson')
+
+
 @app.route('/list', methods=['POST'])
 def list_formats():
     data = request.get_json()
@@ -74,13 +219,124 @@ def list_formats():
         logger.warning("Request received without URL")
         return jsonify({"error": "No URL provided.", "success": False}), 400
 
+    with admission.admit('high'):
+        try:
+            logger.info(f"Listing formats for URL: {data['url']}")
+            result = video_service.get_available_formats(data['url'])
+            return jsonify(result)
+        except Exception as e:
+            logger.error(f"Error listing formats: {str(e)}", exc_info=True)
+            return jsonify({"error": "Failed to list formats.", "success": False}), 500
+
+
+# Response headers passed through from storage when streaming a file
+FILE_HEADERS = {
+    'ContentType': 'Content-Type',
+    'ContentLength': 'Content-Length',
+    'ContentRange': 'Content-Range',
+    'ETag': 'ETag',
+    'CacheControl': 'Cache-Control',
+}
+
+
+def _stream_body(body):
+    """Stream a storage response body in chunks, closing it when the client is done"""
     try:
-        logger.info(f"Listing formats for URL: {data['url']}")
-        result = video_service.get_available_formats(data['url'])
-        return jsonify(result)
+        for chunk in body.iter_chunks(FILE_CHUNK_SIZE):
+            yield chunk
+    finally:
+        body.close()
+
+
+@app.route('/files/<path:key>', methods=['GET'])
+def get_file(key):
+    if not storage.is_artifact_key(key):
+        return jsonify({"error": "File not found.", "success": False}), 404
+
+    byte_range = request.headers.get('Range')
+    if_none_match = request.headers.get('If-None-Match')
+
+    try:
+        stored_key = storage.find(key)
+        stored = storage.get_object(stored_key, byte_range, if_none_match) if stored_key else None
+    except ClientError as e:
+        code = error_code(e)
+        if code in ('304', 'NotModified'):
+            # The stored file's ETag, the request's header can list several or be `*`
+            etag = e.response.get('ResponseMetadata', {}).get('HTTPHeaders', {}).get('etag')
+            return Response(status=304, headers={'ETag': etag} if etag else {})
+        if code in ('416', 'InvalidRange'):
+            return jsonify({"error": "Invalid range.", "success": False}), 416
+        logger.error(f"Error reading file {key}: {str(e)}", exc_info=True)
+        return jsonify({"error": "Failed to read the file.", "success": False}), 500
+
+    if stored is None:
+        return jsonify({"error": "File not found.", "success": False}), 404
+
+    headers = {'Accept-Ranges': 'bytes'}
+    for field, header in FILE_HEADERS.items():
+        if stored.get(field) is not None:
+            headers[header] = str(stored[field])
+    if stored.get('LastModified'):
+        headers['Last-Modified'] = stored['LastModified'].strftime('%a, %d %b %Y %H:%M:%S GMT')
+
+    status = 206 if stored.get('ContentRange') else 200
+    return Response(_stream_body(stored['Body']), status=status, headers=headers,
+                    direct_passthrough=True)
+
+
+@app.route('/presign', methods=['POST'])
+def presign():
+    data = request.get_json()
+    if not data or not (data.get('key') or data.get('url')):
+        return jsonify({"error": "No key or URL provided.", "success": False}), 400
+
+    key = data.get('key') or storage.key_from_url(data['url'])
+    if not isinstance(key, str) or not key:
+        return jsonify({"error": "The URL isn't a stored file.", "success": False}), 400
+
+    expires_in = data.get('expires', PRESIGN_EXPIRES)
+    if isinstance(expires_in, bool) or not isinstance(expires_in, int) \
+            or not 0 < expires_in <= PRESIGN_MAX_EXPIRES:
+        return jsonify({
+            "error": f"`expires` must be between 1 and {PRESIGN_MAX_EXPIRES} seconds.",
+            "success": False
+        }), 400
+
+    if not storage.is_artifact_key(key):
+        return jsonify({"error": "File not found.", "success": False}), 404
+
+    try:
+        stored_key = storage.find(key)
+        if stored_key is None:
+            return jsonify({"error": "File not found.", "success": False}), 404
+
+        return jsonify({
+            "success": True,
+            "key": key,
+            "url": storage.get_presigned_url(stored_key, expires_in),
+            "expires": expires_in
+        })
     except Exception as e:
-        logger.error(f"Error listing formats: {str(e)}", exc_info=True)
-        return jsonify({"error": "Failed to list formats.", "success": False}), 500
+        logger.error(f"Error presigning {key}: {str(e)}", exc_info=True)
+        return jsonify({"error": "Failed to presign the file.", "success": False}), 500
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "success": True,
+        "info_cache": video_service.info_cache.stats(),
+        "negative_cache": video_service.negative_cache.stats(),
+        "admission": admission.stats(),
+        "scratch": video_service.scratch.stats()
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = export_metrics()
+    return Response(body, content_type=content_type)
 
 
 @app.route('/health', methods=['GET'])
@@ -92,5 +348,12 @@ def health():
 
 
 if __name__ == '__main__':
-    logger.info(f"Starting Video-DL service on port {PORT}")
-    app.run(host='0.0.0.0', port=PORT, debug=DEBUG_MODE)
+    listen_fd = os.getenv('VIDEODL_LISTEN_FD')
+    if listen_fd:
+        # Started by the supervisor in server.py, serve on the shared socket
+        from server import run_worker
+        ready_fd = os.getenv('VIDEODL_READY_FD')
+        run_worker(app, int(listen_fd), int(ready_fd) if ready_fd else None)
+    else:
+        logger.info(f"Starting Video-DL service on port {PORT}")
+        app.run(host='0.0.0.0', port=PORT, debug=DEBUG_MODE)
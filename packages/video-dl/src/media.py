@@ -0,0 +1,246 @@
+import os
+import json
+import struct
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Codecs an MP4 can hold, anything else has to be re-encoded
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'}
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'opus', 'ac3', 'eac3', 'alac', 'flac'}
+
+# Codecs HLS players handle in fMP4 segments, so a rendition at the source's height can copy them
+HLS_VIDEO_CODECS = {'h264', 'hevc'}
+HLS_AUDIO_CODECS = {'aac', 'mp3', 'ac3', 'eac3'}
+
+# The HLS ladder, as (height, video kbps, audio kbps), one rendition per quality preset
+HLS_LADDER = [
+    (480, 1400, 128),
+    (720, 2800, 128),
+    (1080, 5000, 192),
+    (2160, 16000, 192),
+]
+
+ATOM_HEADER = struct.Struct('>I4s')
+ATOM_LARGE_SIZE = struct.Struct('>Q')
+
+
+def top_level_atoms(path):
+    """List the names of an MP4's top-level atoms in order, empty if it isn't an MP4"""
+    atoms = []
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset + ATOM_HEADER.size <= size:
+            f.seek(offset)
+            length, name = ATOM_HEADER.unpack(f.read(ATOM_HEADER.size))
+            if length == 1:
+                length = ATOM_LARGE_SIZE.unpack(f.read(ATOM_LARGE_SIZE.size))[0]
+            elif length == 0:
+                length = size - offset
+            if length < ATOM_HEADER.size:
+                break
+            atoms.append(name.decode('latin-1'))
+            offset += length
+    return atoms if atoms[:1] == ['ftyp'] else []
+
+
+def is_faststart(path):
+    """Whether a file is an MP4 with its index (moov) before the media data, so playback can start at once"""
+    atoms = top_level_atoms(path)
+    return 'moov' in atoms and 'mdat' in atoms and atoms.index('moov') < atoms.index('mdat')
+
+
+def probe(path):
+    """Read a file's streams and format with ffprobe"""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', str(path)
+    ], check=True, capture_output=True)
+    return json.loads(result.stdout)
+
+
+def first_stream(probed, codec_type):
+    return next((s for s in probed.get('streams', []) if s.get('codec_type') == codec_type), None)
+
+
+def remux_faststart(source, output, preset='veryfast'):
+    """
+    Rewrite a video as an MP4 with its index at the front, copying the streams when the MP4 can hold them
+    and re-encoding to H.264 and AAC when it can't. Returns the file to upload and how it was made: `none`
+    if the source was already faststart, `copy` or `transcode`.
+    """
+    if is_faststart(source):
+        return source, 'none'
+
+    probed = probe(source)
+    video, audio = first_stream(probed, 'video'), first_stream(probed, 'audio')
+    copy = (video is None or video.get('codec_name') in MP4_VIDEO_CODECS) and \
+        (audio is None or audio.get('codec_name') in MP4_AUDIO_CODECS)
+
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', str(source),
+               '-map', '0:v:0?', '-map', '0:a:0?']
+    if copy:
+        command += ['-c', 'copy']
+        if video is not None and video.get('codec_name') == 'hevc':
+            # Safari only plays HEVC in MP4 with this tag
+            command += ['-tag:v', 'hvc1']
+    else:
+        command += ['-c:v', 'libx264', '-preset', preset, '-crf', '20', '-pix_fmt', 'yuv420p', '-c:a', 'aac']
+    command += ['-movflags', '+faststart', str(output)]
+
+    with stage('remux'):
+        subprocess.run(command, check=True, capture_output=True)
+    return output, 'copy' if copy else 'transcode'
+
+
+class Rendition:
+    """One rung of an HLS ladder"""
+
+    def __init__(self, height, width, video_kbps, audio_kbps, copy=False):
+        self.height = height
+        self.width = width
+        self.video_kbps = video_kbps
+        self.audio_kbps = audio_kbps
+        self.copy = copy
+
+    @property
+    def name(self):
+        return f"{self.height}p"
+
+    @property
+    def bandwidth(self):
+        return (self.video_kbps + self.audio_kbps) * 1000
+
+
+def plan_ladder(probed, max_height):
+    """
+    The renditions to build for a source, every rung of the ladder up to `max_height` and the source's own
+    height. The rendition at the source's height copies its streams when HLS players can handle them.
+    """
+    video, audio = first_stream(probed, 'video'), first_stream(probed, 'audio')
+    if video is None:
+        return []
+
+    source_width, source_height = int(video['width']), int(video['height'])
+    top = min(source_height, max_height)
+    can_copy = video.get('codec_name') in HLS_VIDEO_CODECS and \
+        (audio is None or audio.get('codec_name') in HLS_AUDIO_CODECS)
+
+    def width_for(height):
+        # Keep the aspect ratio, rounded to an even number for the encoder
+        return max(2, round(source_width * height / source_height / 2) * 2)
+
+    renditions = [Rendition(height, width_for(height), video_kbps, audio_kbps)
+                  for height, video_kbps, audio_kbps in HLS_LADDER if height < top]
+
+    source_kbps = int(probed.get('format', {}).get('bit_rate') or 0) // 1000
+    if can_copy and top == source_height and source_kbps:
+        renditions.append(Rendition(top, source_width, source_kbps, 0, copy=True))
+    else:
+        video_kbps, audio_kbps = next(((v, a) for height, v, a in HLS_LADDER if height >= top), HLS_LADDER[-1][1:])
+        renditions.append(Rendition(top, width_for(top), video_kbps, audio_kbps))
+    return renditions
+
+
+def segment_rendition(source, rendition, output_dir, segment_seconds=6, preset='veryfast', has_audio=True):
+    """Cut one rendition into fMP4 segments with ffmpeg, returns its playlist and the files to upload"""
+    os.makedirs(output_dir, exist_ok=True)
+    playlist = os.path.join(output_dir, 'index.m3u8')
+
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', str(source), '-map', '0:v:0', '-map', '0:a:0?']
+    if rendition.copy:
+        command += ['-c', 'copy']
+    else:
+        # Keyframes on segment boundaries so every segment can be played on its own
+        command += [
+            '-vf', f'scale={rendition.width}:{rendition.height}',
+            '-c:v', 'libx264', '-preset', preset, '-pix_fmt', 'yuv420p',
+            '-b:v', f'{rendition.video_kbps}k', '-maxrate', f'{int(rendition.video_kbps * 1.07)}k',
+            '-bufsize', f'{rendition.video_kbps * 2}k',
+            '-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds})', '-sc_threshold', '0',
+        ]
+        if has_audio:
+            command += ['-c:a', 'aac', '-b:a', f'{rendition.audio_kbps}k', '-ac', '2']
+    command += [
+        '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4', '-hls_fmp4_init_filename', 'init.mp4',
+        '-hls_segment_filename', os.path.join(output_dir, 'segment%05d.m4s'),
+        playlist,
+    ]
+    subprocess.run(command, check=True, capture_output=True)
+
+    segments = sorted(name for name in os.listdir(output_dir) if name != 'index.m3u8')
+    return playlist, [os.path.join(output_dir, name) for name in segments]
+
+
+def master_playlist(renditions, uri):
+    """A master playlist listing the renditions, `uri(rendition)` gives each one's playlist URI"""
+    lines = ['#EXTM3U', '#EXT-X-VERSION:7', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for rendition in sorted(renditions, key=lambda r: r.bandwidth):
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={rendition.bandwidth},'
+                     f'RESOLUTION={rendition.width}x{rendition.height}')
+        lines.append(uri(rendition))
+    return '\n'.join(lines) + '\n'
+
+
+SEGMENT_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+}
+
+
+def build_hls(source, storage, rendition_prefix, master_key, max_height, output_dir,
+              segment_seconds=6, workers=2, preset='veryfast'):
+    """
+    Build and upload an HLS ladder for a video, returns the master playlist's URL.
+
+    Renditions already in storage, such as those built for a lower quality, are reused. The others are
+    segmented by `workers` ffmpeg processes at once, and each one's segments are uploaded while the rest
+    are still being encoded. A rendition's playlist is uploaded after its segments, so a stored playlist
+    means the whole rendition is there.
+    """
+    probed = probe(source)
+    renditions = plan_ladder(probed, max_height)
+    if not renditions:
+        raise ValueError("The video has no video stream to build an HLS ladder from")
+
+    playlist_keys = {rendition.name: f"{rendition_prefix(rendition.name)}/index.m3u8" for rendition in renditions}
+    stored = storage.exists_many(playlist_keys.values())
+    missing = [rendition for rendition in renditions if playlist_keys[rendition.name] not in stored]
+    logger.info(f"Building HLS renditions {[r.name for r in missing]}, "
+                f"reusing {[r.name for r in renditions if r not in missing]}")
+
+    has_audio = first_stream(probed, 'audio') is not None
+    uploads = ThreadPoolExecutor(max_workers=storage.upload_concurrency)
+
+    def upload(path, key):
+        return storage.upload_file(path, key, SEGMENT_CONTENT_TYPES.get(os.path.splitext(path)[1]))
+
+    def build(rendition):
+        with stage('hls_segment'):
+            playlist, files = segment_rendition(
+                source, rendition, os.path.join(output_dir, rendition.name),
+                segment_seconds=segment_seconds, preset=preset, has_audio=has_audio)
+
+        prefix = rendition_prefix(rendition.name)
+        for future in [uploads.submit(upload, path, f"{prefix}/{os.path.basename(path)}") for path in files]:
+            future.result()
+        upload(playlist, playlist_keys[rendition.name])
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as encoders:
+            for future in [encoders.submit(build, rendition) for rendition in missing]:
+                future.result()
+    finally:
+        uploads.shutdown(wait=True)
+
+    # The renditions are stored next to the master playlist, so it refers to them relatively
+    master_dir = os.path.dirname(master_key)
+    master_file = os.path.join(output_dir, 'master.m3u8')
+    with open(master_file, 'w', encoding='utf-8') as f:
+        f.write(master_playlist(renditions, lambda r: os.path.relpath(playlist_keys[r.name], master_dir)))
+    return upload(master_file, master_key)
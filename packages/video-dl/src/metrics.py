@@ -0,0 +1,140 @@
+"""
+Prometheus metrics for the API.
+
+Under the supervisor in server.py every worker is a separate process, so the
+supervisor points PROMETHEUS_MULTIPROC_DIR at a shared directory and /metrics
+combines the values from every worker when it's scraped.
+"""
+import os
+import time
+from admission import AdmissionMetrics
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from wsgi import ClosingIterator
+
+# Downloads and uploads can take minutes, so the buckets go well past the usual request latencies
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Requests to anything else are counted as "other" so unknown paths don't each get a series
+ENDPOINTS = {'download', 'bulk', 'list', 'files', 'presign', 'stats', 'health'}
+
+STAGE_SECONDS = Histogram(
+    'videodl_stage_seconds', 'Time spent in each stage of handling a video',
+    ['stage'], buckets=STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    'videodl_request_seconds', 'Time taken to handle a request, including streamed responses',
+    ['endpoint'], buckets=STAGE_BUCKETS)
+REQUESTS = Counter(
+    'videodl_requests_total', 'Requests handled, by endpoint and status code',
+    ['endpoint', 'status'])
+IN_FLIGHT = Gauge(
+    'videodl_in_flight_requests', 'Requests currently being handled',
+    ['endpoint'], multiprocess_mode='livesum')
+CACHE_LOOKUPS = Counter(
+    'videodl_cache_lookups_total', 'Lookups in the info cache and in storage, by result',
+    ['cache', 'result'])
+DOWNLOADED_BYTES = Counter(
+    'videodl_downloaded_bytes_total', 'Bytes downloaded by yt-dlp')
+UPLOADED_BYTES = Counter(
+    'videodl_uploaded_bytes_total', 'Bytes uploaded to storage')
+DEDUPED = Counter(
+    'videodl_dedupe_total', 'Artifacts already stored under another URL or key, by the work skipped',
+    ['skipped'])
+DEDUPED_BYTES = Counter(
+    'videodl_dedupe_bytes_total', 'Bytes not stored again because they already were, by the work skipped',
+    ['skipped'])
+
+ADMISSION_METRICS = AdmissionMetrics(
+    active=Gauge(
+        'videodl_admission_active', 'Requests holding a slot, running rather than queued',
+        multiprocess_mode='livesum'),
+    queue_depth=Gauge(
+        'videodl_admission_queue_depth', 'Requests waiting for a slot, by priority',
+        ['priority'], multiprocess_mode='livesum'),
+    shed=Counter(
+        'videodl_admission_shed_total', 'Requests turned away with a 503, by priority and reason',
+        ['priority', 'reason']),
+    wait_seconds=Histogram(
+        'videodl_admission_wait_seconds', 'Time requests waited for a slot, by priority',
+        ['priority'], buckets=STAGE_BUCKETS),
+)
+
+
+class stage:
+    """Time a block as a stage, cheap enough to wrap anything"""
+
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, name):
+        self.histogram = STAGE_SECONDS.labels(name)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def record_dedupe(skipped, size):
+    """Count an artifact that was already stored, `skipped` is `download` or just `upload`"""
+    DEDUPED.labels(skipped).inc()
+    DEDUPED_BYTES.labels(skipped).inc(size or 0)
+
+
+def record_download(progress):
+    """A yt-dlp progress hook that counts the bytes of each finished download"""
+    if progress.get('status') == 'finished':
+        DOWNLOADED_BYTES.inc(progress.get('downloaded_bytes') or progress.get('total_bytes') or 0)
+
+
+class MetricsMiddleware:
+    """Times every request and tracks the ones in flight, including streamed responses"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        # Only the first path segment is used so /files/<key> doesn't create a series per file
+        endpoint = environ.get('PATH_INFO', '/').strip('/').split('/', 1)[0]
+        if endpoint == 'metrics':
+            return self.app(environ, start_response)
+        if endpoint not in ENDPOINTS:
+            endpoint = 'other'
+
+        started = time.perf_counter()
+        status = []
+
+        def record_status(status_line, headers, exc_info=None):
+            status.append(status_line.split(' ', 1)[0])
+            return start_response(status_line, headers, exc_info)
+
+        in_flight = IN_FLIGHT.labels(endpoint)
+        in_flight.inc()
+
+        def finish():
+            in_flight.dec()
+            REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+            REQUESTS.labels(endpoint, status[0] if status else '500').inc()
+
+        try:
+            response = self.app(environ, record_status)
+        except Exception:
+            finish()
+            raise
+        return ClosingIterator(response, finish)
+
+
+def export():
+    """Render the metrics in the Prometheus text format, returns the body and content type"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
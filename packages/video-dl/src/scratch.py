@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Leftovers from interrupted downloads that are safe to remove once they're stale
+TEMP_SUFFIXES = ('.part', '.ytdl', '.temp', '.tmp', '.frag')
+
+# Written into each job's directory with the reserving process and size, so every worker sees every reservation
+RESERVATION_FILE = '.reservation'
+LOCK_FILE = '.scratch.lock'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_reservation(path):
+    """A job directory's reservation, or None if it has none or its process has exited"""
+    try:
+        reservation = json.loads((path / RESERVATION_FILE).read_text())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(reservation, dict) or not _pid_alive(reservation.get('pid', 0)):
+        return None
+    return reservation
+
+
+def _written(path):
+    """Bytes written to a job's directory so far"""
+    total = 0
+    for child in path.rglob('*'):
+        try:
+            if child.is_file() and child.name != RESERVATION_FILE:
+                total += child.stat().st_size
+        except OSError:
+            continue
+    return total
+
+
+class ScratchSpaceFull(Exception):
+    """Raised when a job can't reserve scratch space before the wait timeout"""
+
+
+class ScratchTier:
+    """
+    A directory that jobs can reserve space in, with an optional byte quota. Reservations are kept on disk
+    and made under a lock file, so the supervisor's worker processes share the quota and free space.
+    """
+
+    def __init__(self, name, root, quota=0, min_free=0):
+        self.name = name
+        self.root = Path(root)
+        self.quota = quota
+        self.min_free = min_free
+
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def locked(self):
+        """Hold the tier's lock, across every worker process"""
+        with open(self.root / LOCK_FILE, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def reservations(self):
+        """The job directories reserved by live processes, with their reserved sizes"""
+        reservations = {}
+        for path in self.root.glob('job-*'):
+            reservation = _read_reservation(path)
+            if reservation:
+                reservations[path] = reservation['size']
+        return reservations
+
+    def used(self):
+        return sum(self.reservations().values())
+
+    def fits(self, size):
+        """Check if a job of the given size fits right now, alongside every worker's active jobs"""
+        reservations = self.reservations()
+        # A job larger than the whole tier can still run on its own
+        if not reservations:
+            return True
+
+        if self.quota and sum(reservations.values()) + size > self.quota:
+            return False
+
+        # Free space already excludes what the active jobs have written, the rest of their reservations is to come
+        pending = sum(max(0, reserved - _written(path)) for path, reserved in reservations.items())
+        free = shutil.disk_usage(self.root).free - self.min_free - pending
+        return size <= free
+
+
+class ScratchJob:
+    """A reserved directory for a single job, removed with everything in it on release"""
+
+    def __init__(self, scratch, tier, size):
+        self.scratch = scratch
+        self.tier = tier
+        self.size = size
+        self.path = tier.root / f"job-{uuid.uuid4()}"
+        self.path.mkdir(parents=True)
+        (self.path / RESERVATION_FILE).write_text(json.dumps({'pid': os.getpid(), 'size': size}))
+        self.released = False
+
+    def written(self):
+        """Bytes written to the job's directory so far"""
+        return _written(self.path)
+
+    def release(self):
+        self.scratch._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ScratchSpace:
+    """
+    Manages the scratch space used while downloading.
+    Jobs reserve an estimated number of bytes up front and wait while the disk is full,
+    small jobs go to an optional RAM-backed tier and orphaned files are swept in the background.
+    """
+
+    def __init__(self, root, quota=0, min_free=0, wait_timeout=600,
+                 tmpfs_root=None, tmpfs_quota=0, tmpfs_max_job=0):
+        self.disk = ScratchTier('disk', root, quota, min_free)
+        self.tmpfs = None
+        if tmpfs_root and tmpfs_max_job > 0:
+            try:
+                self.tmpfs = ScratchTier('tmpfs', tmpfs_root, tmpfs_quota)
+            except OSError as e:
+                logger.warning(f"Scratch tmpfs tier unavailable: {str(e)}")
+        self.tmpfs_max_job = tmpfs_max_job
+        self.wait_timeout = wait_timeout
+
+        self._condition = threading.Condition()
+        self._active = set()
+        self._waiting = 0
+        self._sweeper = None
+
+    def reserve(self, size):
+        """Reserve space for a job, waiting for space to free up if needed"""
+        size = max(0, int(size))
+        deadline = time.monotonic() + self.wait_timeout
+
+        # Small jobs use the RAM-backed tier if there's room, they never wait for it
+        if self.tmpfs and size <= self.tmpfs_max_job:
+            with self.tmpfs.locked():
+                if self.tmpfs.fits(size):
+                    return self._claim(self.tmpfs, size)
+
+        with self._condition:
+            self._waiting += 1
+        try:
+            while True:
+                with self.disk.locked():
+                    if self.disk.fits(size):
+                        return self._claim(self.disk, size)
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ScratchSpaceFull(
+                        f"Timed out waiting for {size} bytes of scratch space.")
+                logger.info(f"Waiting for {size} bytes of scratch space")
+                # Releases in this process wake the wait, other workers' are seen when it times out
+                with self._condition:
+                    self._condition.wait(timeout=min(remaining, 1))
+        finally:
+            with self._condition:
+                self._waiting -= 1
+
+    def _claim(self, tier, size):
+        job = ScratchJob(self, tier, size)
+        with self._condition:
+            self._active.add(job)
+        return job
+
+    def _release(self, job):
+        with self._condition:
+            if job.released:
+                return
+            job.released = True
+            self._active.discard(job)
+
+        shutil.rmtree(job.path, ignore_errors=True)
+        with self._condition:
+            self._condition.notify_all()
+
+    def _last_modified(self, path):
+        """Get the most recent modification time of a file or anything in a directory"""
+        latest = path.stat().st_mtime
+        if path.is_dir():
+            for child in path.rglob('*'):
+                try:
+                    latest = max(latest, child.stat().st_mtime)
+                except OSError:
+                    continue
+        return latest
+
+    def sweep(self, max_age):
+        """
+        Remove job directories and temporary files that haven't been touched for max_age seconds. Job
+        directories reserved by a live process, this one or another worker, are never removed.
+        """
+        with self._condition:
+            active_paths = {job.path for job in self._active}
+
+        cutoff = time.time() - max_age
+        removed = 0
+
+        for tier in (self.disk, self.tmpfs):
+            if tier is None or not tier.root.exists():
+                continue
+
+            for path in tier.root.iterdir():
+                if path in active_paths:
+                    continue
+
+                is_job = path.is_dir() and path.name.startswith('job-')
+                is_temp = path.is_file() and path.name.endswith(TEMP_SUFFIXES)
+                if not (is_job or is_temp) or (is_job and _read_reservation(path)):
+                    continue
+
+                try:
+                    if self._last_modified(path) > cutoff:
+                        continue
+                    if is_job:
+                        shutil.rmtree(path)
+                    else:
+                        path.unlink()
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"Error sweeping {path}: {str(e)}")
+
+        if removed:
+            logger.info(f"Swept {removed} orphaned scratch file(s)")
+        return removed
+
+    def start_sweeper(self, interval=300, max_age=3600):
+        """Sweep orphaned files in a background thread"""
+        if self._sweeper:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.sweep(max_age)
+                except Exception as e:
+                    logger.error(f"Error sweeping scratch space: {str(e)}", exc_info=True)
+                time.sleep(interval)
+
+        self._sweeper = threading.Thread(target=run, name='scratch-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def stats(self):
+        with self._condition:
+            stats = {
+                'active_jobs': len(self._active),
+                'waiting_jobs': self._waiting,
+            }
+        for tier in (self.disk, self.tmpfs):
+            if tier:
+                stats[tier.name] = {
+                    'root': str(tier.root),
+                    # Every worker's reservations, the jobs above are this worker's
+                    'reserved_bytes': tier.used(),
+                    'quota_bytes': tier.quota,
+                    'free_bytes': shutil.disk_usage(tier.root).free,
+                }
+        return stats
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Runs the API as a pool of worker processes sharing one listening socket.
+
+Sending SIGHUP to the supervisor (as the yt-dlp updater does after an upgrade)
+replaces the workers one at a time: a new worker is started and has to report
+that it's ready before an old one is told to drain, so there's always a full
+set of workers accepting requests and each worker imports yt-dlp fresh.
+"""
+import os
+import sys
+import time
+import select
+import signal
+import shutil
+import socket
+import logging
+import threading
+import subprocess
+from config import (
+    PORT, DEBUG_MODE, WORKERS, PID_FILE, WORKER_READY_TIMEOUT, DRAIN_TIMEOUT, METRICS_DIR
+)
+from wsgi import ClosingIterator
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger('video-dl-supervisor')
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+class InFlightMiddleware:
+    """Counts requests that are still being handled, including streamed responses"""
+
+    def __init__(self, app):
+        self.app = app
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _finish(self):
+        with self._lock:
+            self.count -= 1
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.count += 1
+        try:
+            response = self.app(environ, start_response)
+        except Exception:
+            self._finish()
+            raise
+        return ClosingIterator(response, self._finish)
+
+
+def run_worker(app, listen_fd, ready_fd=None):
+    """Serve the app on an inherited socket until SIGTERM, then drain in-flight requests"""
+    from werkzeug.serving import make_server
+
+    middleware = InFlightMiddleware(app)
+    server = make_server('0.0.0.0', PORT, middleware, threaded=True, fd=listen_fd)
+
+    def drain(signum, frame):
+        # shutdown() blocks until serve_forever returns, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, drain)
+
+    if ready_fd is not None:
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+
+    server.serve_forever()
+
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while middleware.count > 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    if middleware.count > 0:
+        logger.warning(f"Worker exiting with {middleware.count} request(s) in flight")
+    server.server_close()
+
+
+class Worker:
+    def __init__(self, process):
+        self.process = process
+        self.draining = False
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+
+class Supervisor:
+    def __init__(self, workers=WORKERS):
+        self.size = max(1, workers)
+        self.workers = []
+        self.socket = None
+        self.reload_requested = False
+        self.stopping = False
+
+    def _bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('0.0.0.0', PORT))
+        sock.listen(128)
+        sock.set_inheritable(True)
+        return sock
+
+    def _spawn(self):
+        """Start a worker and wait for it to report that it's ready, returns None if it doesn't"""
+        ready_read, ready_write = os.pipe()
+        env = {
+            **os.environ,
+            'VIDEODL_LISTEN_FD': str(self.socket.fileno()),
+            'VIDEODL_READY_FD': str(ready_write),
+            'PROMETHEUS_MULTIPROC_DIR': METRICS_DIR,
+        }
+
+        process = subprocess.Popen(
+            [sys.executable, MAIN_SCRIPT],
+            env=env,
+            pass_fds=(self.socket.fileno(), ready_write)
+        )
+        os.close(ready_write)
+
+        deadline = time.monotonic() + WORKER_READY_TIMEOUT
+        try:
+            while time.monotonic() < deadline:
+                readable, _, _ = select.select([ready_read], [], [], 0.5)
+                if readable and os.read(ready_read, 1) == b'1':
+                    logger.info(f"Worker {process.pid} is ready")
+                    return Worker(process)
+                if process.poll() is not None:
+                    break
+        finally:
+            os.close(ready_read)
+
+        logger.error(f"Worker {process.pid} failed to start")
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        return None
+
+    def _drain(self, worker):
+        logger.info(f"Draining worker {worker.pid}")
+        worker.draining = True
+        try:
+            worker.process.send_signal(signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _reload(self):
+        """Replace the workers one at a time, keeping the old ones if a new one fails"""
+        logger.info("Replacing workers")
+        for old in [w for w in self.workers if not w.draining]:
+            new = self._spawn()
+            if new is None:
+                logger.error("Keeping the remaining workers, the new version failed to start")
+                return
+            self.workers.append(new)
+            self._drain(old)
+        logger.info("All workers replaced")
+
+    def _reap(self):
+        """Remove workers that have exited and replace any that crashed"""
+        for worker in list(self.workers):
+            if worker.process.poll() is None:
+                continue
+
+            self.workers.remove(worker)
+            self._mark_dead(worker)
+            if not worker.draining and not self.stopping:
+                logger.warning(
+                    f"Worker {worker.pid} exited with code {worker.process.returncode}, restarting")
+
+        missing = self.size - len([w for w in self.workers if not w.draining])
+        for _ in range(missing if not self.stopping else 0):
+            worker = self._spawn()
+            if worker is None:
+                break
+            self.workers.append(worker)
+
+    def _reset_metrics(self):
+        """Start with an empty metrics directory, the files are only valid for this run"""
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+        os.makedirs(METRICS_DIR, exist_ok=True)
+
+    def _mark_dead(self, worker):
+        """Stop counting a worker's in-flight requests once it has exited"""
+        from prometheus_client import multiprocess
+        try:
+            multiprocess.mark_process_dead(worker.pid, METRICS_DIR)
+        except OSError:
+            pass
+
+    def _handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        self.socket = self._bind()
+        self._reset_metrics()
+
+        with open(PID_FILE, 'w') as f:
+            f.write(str(os.getpid()))
+
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+
+        logger.info(f"Starting {self.size} Video-DL worker(s) on port {PORT}")
+        try:
+            while not self.stopping:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self._reload()
+                self._reap()
+                time.sleep(1)
+        finally:
+            for worker in self.workers:
+                if not worker.draining:
+                    self._drain(worker)
+            for worker in self.workers:
+                try:
+                    worker.process.wait(timeout=DRAIN_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+
+            self.socket.close()
+            try:
+                os.remove(PID_FILE)
+            except OSError:
+                pass
+
+
+if __name__ == '__main__':
+    if DEBUG_MODE:
+        logger.setLevel(logging.DEBUG)
+    Supervisor().run()
@@ -1,16 +1,91 @@
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
 import os
+import re
+import json
 import math
+import hashlib
+import mimetypes
 from concurrent.futures import ThreadPoolExecutor
+from metrics import stage, record_dedupe, UPLOADED_BYTES
+
+# Error codes that mean the object doesn't exist, anything else is a real failure
+NOT_FOUND_CODES = {'404', 'NoSuchKey', 'NotFound'}
+
+# Media is stored once under its SHA-256, a ref next to each artifact's key points at it
+CONTENT_PREFIX = 'content/'
+REF_SUFFIX = '.ref'
+
+# A flat key from `get_key`: the video ID, then optionally a quality or a clip or thumbnail variant, then the
+# file type and a ref's suffix. Video IDs can contain '-', so the ID is whatever comes before those
+KEY_PATTERN = re.compile(
+    r'(?P<video>.+?)(?:-(?:low|medium|high|max|clip-\d+-\d+-\w+|thumb-\d+))?\.\w+(?:' + re.escape(REF_SUFFIX) + r')?')
+
+# The keys files are handed out under, from `get_key` or in an HLS rendition's directory. Content objects,
+# refs and aliases are internal and only reached through an artifact's key
+ARTIFACT_KEY_PATTERN = re.compile(
+    r'(?!content/)[a-z0-9_]+/(?:[^/]+\.(?:mp4|m4a|jpg|json|vtt|m3u8)|[^/]+/hls/[^/]+/[^/]+\.(?:m3u8|m4s|mp4))')
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """
+    The SHA-256 and size of a file, read in one streaming pass into a reused buffer. Files are hashed once
+    they're finished rather than as they're downloaded, yt-dlp's merge and the faststart remux rewrite them
+    so the bytes that are stored only exist at the end, and they're read back while still in the page cache.
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    size = 0
+    with open(str(path), 'rb', buffering=0) as f:
+        while count := f.readinto(buffer):
+            digest.update(view[:count])
+            size += count
+    return digest.hexdigest(), size
+
+
+def video_prefix(key):
+    """
+    The part of a key shared by every file of its video: `provider/video_id/` for files in a video's
+    directory, such as HLS renditions, otherwise `provider/video_id` up to its variant or file type.
+    """
+    parts = key.split('/')
+    if len(parts) > 2:
+        return f"{parts[0]}/{parts[1]}/"
+    match = KEY_PATTERN.fullmatch(parts[-1])
+    video_id = match['video'] if match else parts[-1]
+    return key[:len(key) - len(parts[-1]) + len(video_id)]
+
+
+def error_code(error):
+    """Get the error code from a boto ClientError"""
+    return error.response.get('Error', {}).get('Code')
+
 
 class R2Storage:
     def __init__(self):
+        self.upload_concurrency = max(1, int(os.getenv('R2_UPLOAD_CONCURRENCY', '10')))
+
+        # Leave room for HEADs and other requests alongside a multipart upload
+        max_pool_connections = max(
+            int(os.getenv('R2_MAX_POOL_CONNECTIONS', '50')),
+            self.upload_concurrency + 10)
+
         self.s3 = boto3.client('s3',
             endpoint_url=os.getenv('R2_ENDPOINT'),
             aws_access_key_id=os.getenv('R2_ACCESS_KEY'),
             aws_secret_access_key=os.getenv('R2_SECRET_KEY'),
-            config=Config(signature_version='s3v4'),
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=max_pool_connections,
+                retries={
+                    'mode': 'adaptive',
+                    'max_attempts': int(os.getenv('R2_MAX_ATTEMPTS', '5')),
+                },
+                tcp_keepalive=True,
+                connect_timeout=int(os.getenv('R2_CONNECT_TIMEOUT', '5')),
+                read_timeout=int(os.getenv('R2_READ_TIMEOUT', '60'))),
             region_name='auto')
         self.bucket = os.getenv('R2_BUCKET_NAME')
         self.public_url = os.getenv('R2_PUBLIC_URL')
@@ -18,12 +93,50 @@ class R2Storage:
     def get_public_url(self, key):
         return f"{self.public_url}/{key}"
 
-    def get_key(self, video_id, provider="video", file_type="mp4", quality=None):
+    def key_from_url(self, url):
+        """Get the storage key from a public URL, returns None if it isn't one of ours"""
+        prefix = f"{self.public_url}/"
+        if not self.public_url or not url.startswith(prefix):
+            return None
+        return url[len(prefix):] or None
+
+    def get_presigned_url(self, key, expires_in=300):
+        """Generate a short-lived URL for downloading a file"""
+        return self.s3.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=expires_in)
+
+    def content_key(self, sha256, file_type):
+        """The key a file is stored under by its content, so identical files are only stored once"""
+        return f"{CONTENT_PREFIX}{sha256[:2]}/{sha256}.{file_type}"
+
+    def ref_key(self, key):
+        """The key of the ref pointing an artifact's key at its content"""
+        return f"{key}{REF_SUFFIX}"
+
+    def is_artifact_key(self, key):
+        """Whether a key is one the service hands out, rather than a content object, ref or alias"""
+        return bool(ARTIFACT_KEY_PATTERN.fullmatch(key))
+
+    def find(self, key):
+        """Where an artifact's bytes are, under its own key or the content its ref points at, or None"""
+        ref = self.resolve(key, self.exists_many([key, self.ref_key(key)]))
+        return ref['key'] if ref else None
+
+    def get_rendition_prefix(self, video_id, provider, rendition):
+        """The prefix an HLS rendition's playlist and segments are stored under, shared by every quality"""
+        return f"{provider}/{video_id}/hls/{rendition}"
+
+    def get_key(self, video_id, provider="video", file_type="mp4", quality=None, variant=None):
         """
         Generate a storage key for the video or associated files.
-        Includes quality in the key if specified.
+        Includes quality in the key if specified, partial artifacts such as
+        clips and thumbnails use a variant so they're cached separately.
         """
-        if quality and file_type == "mp4":
+        if variant:
+            return f"{provider}/{video_id}-{variant}.{file_type}"
+        elif quality and file_type == "mp4":
             return f"{provider}/{video_id}-{quality}.{file_type}"
         else:
             return f"{provider}/{video_id}.{file_type}"
@@ -32,18 +145,149 @@ class R2Storage:
         try:
             self.s3.head_object(Bucket=self.bucket, Key=key)
             return True
-        except self.s3.exceptions.ClientError:
-            return False
+        except ClientError as e:
+            # Throttling and other errors shouldn't look like a cache miss
+            if error_code(e) in NOT_FOUND_CODES:
+                return False
+            raise
+
+    def get_size(self, key):
+        """The size of a stored file in bytes"""
+        return self.s3.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+
+    def get_object(self, key, byte_range=None, if_none_match=None):
+        """
+        Open a file for streaming, returns the response or None if it doesn't exist.
+        Conditional and range failures are raised as a ClientError with codes
+        such as 304 and InvalidRange.
+        """
+        params = {'Bucket': self.bucket, 'Key': key}
+        if byte_range:
+            params['Range'] = byte_range
+        if if_none_match:
+            params['IfNoneMatch'] = if_none_match
+
+        try:
+            return self.s3.get_object(**params)
+        except ClientError as e:
+            if error_code(e) in NOT_FOUND_CODES:
+                return None
+            raise
+
+    def get_json(self, key):
+        """Read a JSON file from storage, returns None if it doesn't exist"""
+        response = self.get_object(key)
+        if response is None:
+            return None
+
+        body = response['Body']
+        try:
+            return json.loads(body.read())
+        finally:
+            body.close()
+
+    def iter_objects(self, prefix=''):
+        """List every stored file under a prefix, yields each one's key and size"""
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key'], obj['Size']
+
+    def exists_many(self, keys):
+        """
+        Check which of the given keys exist in storage.
+        Keys are grouped by the video they belong to and each group is checked with one listing bounded to
+        its keys, so a video's sibling files (variants, json, vtt) take one request however much else is
+        stored under the provider. Keys with no siblings are checked with concurrent HEADs.
+        """
+        groups = {}
+        for key in set(keys):
+            groups.setdefault(video_prefix(key), []).append(key)
+        if not groups:
+            return set()
+
+        found = set()
+        singles = [group[0] for group in groups.values() if len(group) == 1]
+        listings = [sorted(group) for group in groups.values() if len(group) > 1]
+
+        workers = min(len(singles) + len(listings), self.upload_concurrency)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            heads = pool.map(lambda key: (key, self.file_exists(key)), singles)
+            for group in pool.map(self._list_group, listings):
+                found.update(group)
+            found.update(key for key, exists in heads if exists)
+        return found
+
+    def _list_group(self, ordered):
+        """List the stored keys from the first to the last of a sorted group, returns the ones that are given"""
+        keys = set(ordered)
+        first_key, last_key = ordered[0], ordered[-1]
+        found = set()
+
+        # StartAfter is exclusive, so start just before the first key rather than at the top of the prefix
+        options = {'Prefix': os.path.commonprefix(ordered)}
+        if first_key[-1] > '\0':
+            options['StartAfter'] = first_key[:-1] + chr(ord(first_key[-1]) - 1)
+
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, **options):
+            for obj in page.get('Contents', []):
+                # Keys are listed in order, so nothing after the last one can match
+                if obj['Key'] > last_key:
+                    return found
+                if obj['Key'] in keys:
+                    found.add(obj['Key'])
 
-    def upload_file(self, local_file, key):
+        return found
+
+    def put_json(self, key, value):
+        """Write a small JSON file to storage"""
+        body = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType='application/json')
+        UPLOADED_BYTES.inc(len(body))
+
+    def store_content(self, local_file, key):
+        """
+        Store a file by its content and point `key` at it with a ref, the upload is skipped if the same
+        content is already stored. Returns the content's public URL.
+        """
+        with stage('hash'):
+            sha256, size = file_digest(local_file)
+
+        content_key = self.content_key(sha256, os.path.splitext(key)[1].lstrip('.') or 'bin')
+        if self.file_exists(content_key):
+            record_dedupe('upload', size)
+        else:
+            self.upload_file(local_file, content_key, mimetypes.guess_type(key)[0])
+
+        self.put_json(self.ref_key(key), {'key': content_key, 'sha256': sha256, 'size': size})
+        return self.get_public_url(content_key)
+
+    def resolve(self, key, existing):
+        """
+        Find where an artifact's bytes are, stored under its key or through a ref, given the keys that exist
+        from `exists_many` with both. Returns the ref (with the `key` and `size` of its content) or None.
+        """
+        if key in existing:
+            return {'key': key}
+        if self.ref_key(key) in existing:
+            return self.get_json(self.ref_key(key))
+        return None
+
+    def upload_file(self, local_file, key, content_type=None):
+        """Upload a file, its content type is guessed from the key unless it's given"""
         file_size = os.path.getsize(str(local_file))
-        return self._upload_multipart(local_file, key) if file_size >= 100 * 1024 * 1024 else self._upload_single(local_file, key)
+        content_type = content_type or mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        with stage('upload'):
+            url = self._upload_multipart(local_file, key, content_type) if file_size >= 100 * 1024 * 1024 else self._upload_single(local_file, key, content_type)
+        UPLOADED_BYTES.inc(file_size)
+        return url
 
-    def _upload_single(self, local_file, key):
-        self.s3.upload_file(local_file, self.bucket, key)
+    def _upload_single(self, local_file, key, content_type):
+        self.s3.upload_file(str(local_file), self.bucket, key, ExtraArgs={'ContentType': content_type})
         return self.get_public_url(key)
 
-    def _upload_multipart(self, local_file, key):
+    def _upload_multipart(self, local_file, key, content_type):
         file_size = os.path.getsize(str(local_file))
 
         chunk_size = min(
@@ -53,12 +297,13 @@ class R2Storage:
 
         multipart = self.s3.create_multipart_upload(
             Bucket=self.bucket,
-            Key=key
+            Key=key,
+            ContentType=content_type
         )
 
         parts = []
         threads = []
-        with ThreadPoolExecutor(max_workers=10) as executor:
+        with ThreadPoolExecutor(max_workers=self.upload_concurrency) as executor:
             with open(str(local_file), 'rb') as f:
                 part_number = 1
                 while True:
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Report how much storage content addressing saves.
+
+Lists the bucket and reads every ref, then compares the bytes the refs point
+at (what storing each artifact under its own key would take) with the bytes
+of the content objects actually stored.
+
+    uv run src/storage_report.py --output storage.json
+"""
+import sys
+import json
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from storage import R2Storage, CONTENT_PREFIX, REF_SUFFIX
+
+MEDIA_EXTENSIONS = ('.mp4', '.m4a', '.webm', '.mkv', '.mp3')
+
+
+def build_report(storage, workers=16, top=10):
+    """Summarise the stored refs, content objects, aliases and media stored without a ref"""
+    content = {}
+    refs = []
+    aliases = 0
+    unreferenced = Counter()
+
+    for key, size in storage.iter_objects():
+        if key.startswith(CONTENT_PREFIX):
+            content[key] = size
+        elif key.endswith(REF_SUFFIX):
+            refs.append(key)
+        elif key.endswith('.alias'):
+            aliases += 1
+        elif key.endswith(MEDIA_EXTENSIONS) and '/hls/' not in key:
+            # Stored before content addressing, or by a service that doesn't write refs
+            unreferenced['files'] += 1
+            unreferenced['bytes'] += size
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        targets = [ref for ref in pool.map(storage.get_json, refs) if ref]
+
+    referenced = Counter(ref['key'] for ref in targets)
+    logical_bytes = sum(ref.get('size') or content.get(ref['key'], 0) for ref in targets)
+    physical_bytes = sum(content.values())
+    shared = [key for key, count in referenced.items() if count > 1]
+
+    return {
+        'refs': len(refs),
+        'content_objects': len(content),
+        'shared_content_objects': len(shared),
+        'orphaned_content_objects': len(set(content) - set(referenced)),
+        'aliases': aliases,
+        'logical_bytes': logical_bytes,
+        'physical_bytes': physical_bytes,
+        'saved_bytes': max(0, logical_bytes - physical_bytes),
+        'unreferenced_media': dict(files=unreferenced['files'], bytes=unreferenced['bytes']),
+        'most_shared': [
+            {'key': key, 'refs': count, 'bytes': content.get(key, 0)}
+            for key, count in referenced.most_common(top) if count > 1
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=16, help='Refs read at once (default: 16)')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    report = build_report(R2Storage(), workers=args.workers)
+
+    mb = 1024 * 1024
+    print(f"refs:              {report['refs']}")
+    print(f"content objects:   {report['content_objects']} "
+          f"({report['shared_content_objects']} shared, {report['orphaned_content_objects']} orphaned)")
+    print(f"aliases:           {report['aliases']}")
+    print(f"logical:           {report['logical_bytes'] / mb:.1f}MB")
+    print(f"physical:          {report['physical_bytes'] / mb:.1f}MB")
+    print(f"saved:             {report['saved_bytes'] / mb:.1f}MB")
+    print(f"media without ref: {report['unreferenced_media']['files']} files, "
+          f"{report['unreferenced_media']['bytes'] / mb:.1f}MB")
+    for shared in report['most_shared']:
+        print(f"  {shared['refs']:>4} refs  {shared['bytes'] / mb:>8.1f}MB  {shared['key']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
-import subprocess
+import os
+import sys
 import time
+import signal
 import logging
-import sys
-import importlib
+import subprocess
 
 # Setup logging
 logging.basicConfig(
@@ -13,35 +14,97 @@ logging.basicConfig(
 )
 logger = logging.getLogger('yt-dlp-updater')
 
+PID_FILE = os.getenv('VIDEODL_PID_FILE', '/tmp/video-dl.pid')
+
+# Imports yt-dlp in a fresh interpreter and checks that its extractors load
+SMOKE_CHECK = """
+import yt_dlp
+from yt_dlp.extractor import gen_extractor_classes
+assert len(gen_extractor_classes()) > 100, 'extractors failed to load'
+yt_dlp.YoutubeDL({'quiet': True}).close()
+print(yt_dlp.version.__version__)
+"""
+
+
+def get_installed_version():
+    """Get the installed yt-dlp version from a fresh interpreter, or None if it can't be imported"""
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import importlib.metadata as m; print(m.version('yt-dlp'))"],
+        capture_output=True,
+        text=True,
+        check=False
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def smoke_check():
+    """Check that the installed yt-dlp can be imported and used"""
+    result = subprocess.run(
+        [sys.executable, "-c", SMOKE_CHECK],
+        capture_output=True,
+        text=True,
+        check=False,
+        timeout=120
+    )
+    if result.returncode != 0:
+        logger.error("yt-dlp smoke check failed: %s", result.stderr.strip())
+        return False
+    return True
+
+
+def install(spec):
+    result = subprocess.run(
+        ["uv", "pip", "install", "-U", "--pre", spec],
+        capture_output=True,
+        text=True,
+        check=False
+    )
+    if result.returncode != 0:
+        logger.error("Error installing %s: %s", spec, result.stderr.strip())
+    return result.returncode == 0
+
+
+def signal_server():
+    """Ask the server to replace its workers so they import the new version"""
+    try:
+        with open(PID_FILE) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, signal.SIGHUP)
+        logger.info("Asked server %s to replace its workers", pid)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not signal the server: {str(e)}")
+
+
 def check_for_updates():
     """Check for yt-dlp updates and install if available"""
     try:
         logger.info("Checking for yt-dlp updates...")
-        # Use subprocess to call pip/uv to check for updates
-        result = subprocess.run(
-            ["uv", "pip", "install", "-U", "--pre", "yt-dlp"],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        if result.returncode == 0:
-            if "already satisfied" in result.stdout:
-                logger.info("yt-dlp is already up-to-date")
+        previous_version = get_installed_version()
+
+        if not install("yt-dlp"):
+            return
+
+        current_version = get_installed_version()
+        if current_version == previous_version:
+            logger.info("yt-dlp is already up-to-date")
+            return
+
+        logger.info("yt-dlp has been updated from %s to %s",
+                    previous_version, current_version)
+
+        if smoke_check():
+            signal_server()
+            return
+
+        # Running workers still have the old version loaded, so rolling back is enough
+        if previous_version:
+            logger.warning("Rolling back yt-dlp to %s", previous_version)
+            if install(f"yt-dlp=={previous_version}") and smoke_check():
+                logger.info("yt-dlp rolled back to %s", previous_version)
             else:
-                logger.info("yt-dlp has been updated: %s", result.stdout.strip())
-                # Try to reload yt-dlp module if it's already imported
-                if 'yt_dlp' in sys.modules:
-                    try:
-                        logger.info("Reloading yt_dlp module...")
-                        importlib.reload(sys.modules['yt_dlp'])
-                        logger.info("yt_dlp module successfully reloaded")
-                    except Exception as e:
-                        logger.warning(f"Could not reload yt_dlp module: {str(e)}")
-                        logger.info("New instances will use the updated version")
-        else:
-            logger.error("Error updating yt-dlp: %s", result.stderr.strip())
-            
+                logger.error("Rolling back yt-dlp failed")
+
     except Exception as e:
         logger.error("Exception during update check: %s", str(e))
 
@@ -49,10 +112,10 @@ def check_for_updates():
 def main():
     """Main function to periodically check for updates"""
     logger.info("Starting yt-dlp update checker")
-    
+
     # Update interval in seconds (15 minutes = 900 seconds)
     update_interval = 900
-    
+
     while True:
         check_for_updates()
         logger.info(f"Next check in {update_interval//60} minutes")
@@ -60,4 +123,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,21 +1,73 @@
 import os
 import re
-import uuid
+import copy
 import json
+import shlex
+import hashlib
+import shutil
 import logging
-import requests
-from pathlib import Path
+import subprocess
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor
 import yt_dlp
-from config import DOWNLOAD_DIR, URL_PATTERNS
+from config import (
+    DOWNLOAD_DIR, URL_PATTERNS, PROVIDER_DOMAINS, PROVIDER_PATTERNS, TRACKING_PARAMS, INFO_CACHE_TTL, INFO_CACHE_SIZE,
+    NEGATIVE_CACHE_TTL, NEGATIVE_CACHE_SIZE,
+    FASTSTART, TRANSCODE_PRESET, HLS_SEGMENT_SECONDS, HLS_WORKERS,
+    CONCURRENT_FRAGMENTS, HTTP_CHUNK_SIZE, PARALLEL_STREAMS,
+    EXTERNAL_DOWNLOADER, EXTERNAL_DOWNLOADER_ARGS,
+    SCRATCH_QUOTA, SCRATCH_MIN_FREE, SCRATCH_WAIT_TIMEOUT, SCRATCH_DEFAULT_ESTIMATE,
+    SCRATCH_TMPFS_DIR, SCRATCH_TMPFS_QUOTA, SCRATCH_TMPFS_MAX_JOB
+)
 from storage import R2Storage
+from scratch import ScratchSpace
+from cache import InfoCache
+from media import remux_faststart, build_hls
+from metrics import stage, record_cache_lookup, record_dedupe, record_download
 
 logger = logging.getLogger(__name__)
 
+# Rough scratch space needed for files that don't have a size in the info dict
+SUBTITLE_ESTIMATE = 1024 * 1024
+THUMBNAIL_ESTIMATE = 2 * 1024 * 1024
+
+# Extractor arguments when only metadata and subtitles are needed. YouTube skips the player JS, and so
+# deciphering format signatures, and the DASH and HLS manifests it would otherwise fetch to list formats
+METADATA_EXTRACTOR_ARGS = {
+    'youtube': {'player_skip': ['js'], 'skip': ['dash', 'hls']},
+}
+SUBTITLE_LANGUAGE = 'en'
+
+# Errors the site gives for videos that are gone for good, and the ones it also flags as expected but that
+# clear up on their own, such as YouTube's bot check and rate limiting ("This content isn't available, try
+# again later"). Only the first kind are remembered
+UNAVAILABLE_ERROR = re.compile(
+    r'private|removed|deleted|unavailable|not available|does not exist|no longer|terminated', re.IGNORECASE)
+TRANSIENT_ERROR = re.compile(
+    r'sign in to confirm|not a bot|captcha|try again later|rate.?limit|too many requests|HTTP Error 429',
+    re.IGNORECASE)
+
+# Links followed to another extractor before giving up, such as a short link to the video's page
+MAX_URL_REDIRECTS = 5
+
 
 class VideoService:
-    def __init__(self, storage: R2Storage):
+    def __init__(self, storage: R2Storage, extractors=()):
         self.storage = storage
+        # yt-dlp extractor classes tried before the built-in ones, such as a stand-in for local fixtures
+        self.extractors = list(extractors)
         self.download_dir = DOWNLOAD_DIR
+        self.scratch = ScratchSpace(
+            DOWNLOAD_DIR,
+            quota=SCRATCH_QUOTA,
+            min_free=SCRATCH_MIN_FREE,
+            wait_timeout=SCRATCH_WAIT_TIMEOUT,
+            tmpfs_root=SCRATCH_TMPFS_DIR,
+            tmpfs_quota=SCRATCH_TMPFS_QUOTA,
+            tmpfs_max_job=SCRATCH_TMPFS_MAX_JOB,
+        )
+        self.info_cache = InfoCache(max_size=INFO_CACHE_SIZE, ttl=INFO_CACHE_TTL)
+        self.negative_cache = InfoCache(max_size=NEGATIVE_CACHE_SIZE, ttl=NEGATIVE_CACHE_TTL)
 
         # Define quality presets
         self.quality_presets = {
@@ -33,23 +85,409 @@ class VideoService:
             'max': 'bestvideo+bestaudio/best'
         }
 
+        # Download tuning for yt-dlp, larger videos get more parallelism
+        self.download_profiles = {
+            'low': {
+                'concurrent_fragment_downloads': 4,
+                'http_chunk_size': 5 * 1024 * 1024,
+                'parallel_streams': False,
+            },
+            'medium': {
+                'concurrent_fragment_downloads': 4,
+                'http_chunk_size': 10 * 1024 * 1024,
+                'parallel_streams': True,
+            },
+            'high': {
+                'concurrent_fragment_downloads': 8,
+                'http_chunk_size': 10 * 1024 * 1024,
+                'parallel_streams': True,
+            },
+            'max': {
+                'concurrent_fragment_downloads': 16,
+                'http_chunk_size': 20 * 1024 * 1024,
+                'parallel_streams': True,
+            }
+        }
+
+    def _get_host(self, url):
+        """Get the lowercased hostname of a URL, or an empty string if it has none"""
+        try:
+            return (urlsplit(url.strip()).hostname or '').lower()
+        except ValueError:
+            return ''
+
     def _get_provider(self, url):
-        """Determine the provider (youtube, tiktok, etc.) from the URL"""
-        for provider, config in URL_PATTERNS.items():
-            if any(domain in url for domain in config['domains']):
+        """Determine the provider (youtube, tiktok, etc.) from the URL's hostname"""
+        host = self._get_host(url)
+        while host:
+            provider = PROVIDER_DOMAINS.get(host)
+            if provider:
                 return provider
+            # Try the parent domain, e.g. m.youtube.com -> youtube.com
+            host = host.partition('.')[2]
         return "generic"
 
+    def _match_video_id(self, url, provider):
+        """Match the video ID in the URL, returns None if no pattern matches"""
+        pattern = PROVIDER_PATTERNS.get(provider)
+        if pattern:
+            match = pattern.search(url)
+            if match:
+                return next(group for group in match.groups() if group)
+        return None
+
+    def _normalize_url(self, url):
+        """
+        Normalize a URL so different spellings of the same address compare equal.
+        Drops the fragment, tracking parameters and `www.`, and sorts the query.
+        """
+        parts = urlsplit(url.strip())
+        host = (parts.hostname or '').lower().removeprefix('www.')
+        if parts.port and parts.port not in (80, 443):
+            host = f"{host}:{parts.port}"
+
+        path = parts.path.rstrip('/') or '/'
+        query = sorted(
+            (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if key not in TRACKING_PARAMS and not key.startswith('utm_')
+        )
+
+        return urlunsplit(('https', host, path, urlencode(query), ''))
+
     def _extract_video_id(self, url, provider):
         """Extract the video ID from the URL based on provider patterns"""
-        if provider in URL_PATTERNS:
-            for pattern in URL_PATTERNS[provider]['patterns']:
-                match = re.search(pattern, url)
-                if match:
-                    return match.group(1)
+        video_id = self._match_video_id(url, provider)
+        if video_id:
+            return video_id
+
+        # Fallback to a hash of the normalized URL so the same URL always maps to the same ID
+        return hashlib.sha256(self._normalize_url(url).encode('utf-8')).hexdigest()[:16]
+
+    def _canonical_identity(self, info, provider, video_id):
+        """
+        The provider and ID the site's extractor gives a video, so its short links, mirrors and other URLs
+        share one set of files. The generic extractor's IDs come from the URL's path and aren't unique, so
+        generic pages keep the URL's ID and rely on their content being deduplicated instead.
+        """
+        extractor = (info.get('extractor_key') or info.get('ie_key') or '').lower()
+        canonical_id = str(info.get('id') or '').replace('/', '_')
+        if not canonical_id or extractor in ('', 'generic'):
+            return provider, video_id
+
+        # Extractors are named after the site, such as TwitchVod for twitch
+        canonical_provider = next((name for name in URL_PATTERNS if extractor.startswith(name)), extractor)
+        return canonical_provider, canonical_id
+
+    def _find_stored(self, provider, video_id, keys_for):
+        """
+        Check which of a video's files are stored, stored directly or as refs to their content, following the
+        URL's ID to its canonical one if it has been aliased. `keys_for(provider, video_id)` lists the keys.
+        Returns the provider and ID the files are under and the keys that exist.
+        """
+        keys = keys_for(provider, video_id)
+        alias_key = self.storage.get_key(video_id, provider, "alias")
+        existing = self.storage.exists_many([*keys, *map(self.storage.ref_key, keys), alias_key])
+
+        alias = self.storage.get_json(alias_key) if alias_key in existing else None
+        if alias:
+            provider, video_id = alias['provider'], alias['video_id']
+            keys = keys_for(provider, video_id)
+            existing = self.storage.exists_many([*keys, *map(self.storage.ref_key, keys)])
+        return provider, video_id, existing
+
+    def _canonicalize(self, info, provider, video_id, keys_for):
+        """
+        Alias the URL's ID to the video's canonical ID once it's been extracted. Returns the canonical
+        provider and ID, and the keys that exist for it or None if the URL already used it.
+        """
+        canonical_provider, canonical_id = self._canonical_identity(info, provider, video_id)
+        if (canonical_provider, canonical_id) == (provider, video_id):
+            return provider, video_id, None
+
+        logger.info(f"Aliasing {provider}/{video_id} to {canonical_provider}/{canonical_id}")
+        self.storage.put_json(self.storage.get_key(video_id, provider, "alias"),
+                              {'provider': canonical_provider, 'video_id': canonical_id})
+        keys = keys_for(canonical_provider, canonical_id)
+        return canonical_provider, canonical_id, \
+            self.storage.exists_many([*keys, *map(self.storage.ref_key, keys)])
+
+    def _get_cache_key(self, provider, video_id):
+        """Build the info cache key for a video"""
+        return f"{provider}:{video_id}"
+
+    def _extract_info(self, url, provider, video_id):
+        """
+        Extract the unprocessed info dict for a URL, reusing a cached result if available.
+        The result can be passed to `YoutubeDL.process_ie_result` with any options.
+        """
+        cache_key = self._get_cache_key(provider, video_id)
+        info = self.info_cache.get(cache_key)
+        record_cache_lookup('info', info is not None)
+        if info is not None:
+            logger.info(f"Using cached info for: {cache_key}")
+            return info
+
+        with stage('extract_info'):
+            info = self._run_extractor(url, cache_key)
+
+        self.info_cache.set(cache_key, info)
+        return info
+
+    def _extract_metadata(self, url, provider, video_id):
+        """
+        Extract the unprocessed info dict without resolving formats, reusing a cached full or metadata result.
+        It has the metadata and subtitle tracks but can't be used to download the video.
+        """
+        cache_key = self._get_cache_key(provider, video_id)
+        metadata_key = f"{cache_key}:metadata"
+        info = self.info_cache.get(metadata_key) or self.info_cache.get(cache_key)
+        record_cache_lookup('info', info is not None)
+        if info is not None:
+            logger.info(f"Using cached info for: {cache_key}")
+            return info
+
+        with stage('extract_metadata'):
+            info = self._run_extractor(url, metadata_key, {
+                'extractor_args': METADATA_EXTRACTOR_ARGS,
+                'ignore_no_formats_error': True,
+            })
 
-        # Fallback to UUID if no pattern matches or provider not found
-        return str(uuid.uuid4())
+        self.info_cache.set(metadata_key, info)
+        return info
+
+    def _run_extractor(self, url, cache_key, opts=None):
+        """
+        Run yt-dlp's extractor for a URL without processing the result. Videos the site says are gone, such as
+        private or removed ones, are remembered under the result's cache key so they aren't scraped again until
+        the entry expires. The metadata path has its own key since it succeeds where a full extraction fails
+        for lack of formats.
+        """
+        unavailable = self.negative_cache.get(f"{cache_key}:unavailable")
+        record_cache_lookup('negative', unavailable is not None)
+        if unavailable is not None:
+            raise yt_dlp.utils.DownloadError(unavailable)
+
+        ydl_opts = {
+            'quiet': not logger.isEnabledFor(logging.DEBUG),
+            'no_warnings': not logger.isEnabledFor(logging.DEBUG),
+            **(opts or {}),
+        }
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ie_key = None
+            for extractor in self.extractors:
+                ydl.add_info_extractor(extractor())
+                if ie_key is None and extractor.suitable(url):
+                    ie_key = extractor.ie_key()
+
+            try:
+                info = ydl.extract_info(url, download=False, process=False, ie_key=ie_key)
+                return ydl.sanitize_info(self._resolve_url_results(ydl, info))
+            except yt_dlp.utils.DownloadError as e:
+                # Expected errors are the site's answer rather than a network or parsing problem
+                error = e.exc_info[1] if e.exc_info else None
+                if isinstance(error, yt_dlp.utils.ExtractorError) and error.expected \
+                        and self._is_unavailable(error.orig_msg or str(error)):
+                    self.negative_cache.set(f"{cache_key}:unavailable", str(e))
+                raise
+
+    def _is_unavailable(self, message):
+        """Whether an expected extractor error means the video is gone rather than temporarily blocked"""
+        return bool(UNAVAILABLE_ERROR.search(message)) and not TRANSIENT_ERROR.search(message)
+
+    def _resolve_url_results(self, ydl, info):
+        """
+        Follow results that only point at another URL, such as TikTok's vm. short links, to the extractor
+        that has the video, the way `process_ie_result` would, so its ID and extractor are the video's own.
+        """
+        for _ in range(MAX_URL_REDIRECTS):
+            result_type = info.get('_type')
+            if result_type not in ('url', 'url_transparent'):
+                return info
+
+            resolved = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+            if result_type == 'url_transparent':
+                # The embedding page's metadata wins, except for what identifies the video
+                exempted = {'_type', 'url', 'ie_key'}
+                if not info.get('section_end') and info.get('section_start') is None:
+                    exempted |= {'id', 'extractor', 'extractor_key'}
+                resolved = {**resolved, **{key: value for key, value in info.items()
+                                           if value is not None and key not in exempted}}
+                if resolved.get('_type') == 'url':
+                    resolved['_type'] = 'url_transparent'
+            elif info.get('original_url'):
+                resolved['original_url'] = info['original_url']
+            info = resolved
+        raise yt_dlp.utils.DownloadError(f"Too many redirects for {info.get('url')}")
+
+    def _get_download_profile(self, quality):
+        """Get the download profile for a quality with any environment overrides applied"""
+        profile = dict(self.download_profiles.get(
+            quality, self.download_profiles['medium']))
+
+        if CONCURRENT_FRAGMENTS is not None:
+            profile['concurrent_fragment_downloads'] = CONCURRENT_FRAGMENTS
+        if HTTP_CHUNK_SIZE is not None:
+            profile['http_chunk_size'] = HTTP_CHUNK_SIZE
+        if PARALLEL_STREAMS is not None:
+            profile['parallel_streams'] = PARALLEL_STREAMS
+        if EXTERNAL_DOWNLOADER:
+            profile['external_downloader'] = EXTERNAL_DOWNLOADER
+
+        return profile
+
+    def _get_download_opts(self, quality, profile=None):
+        """Build the yt-dlp download options for a quality's profile"""
+        if profile is None:
+            profile = self._get_download_profile(quality)
+
+        ydl_opts = {
+            'concurrent_fragment_downloads': profile['concurrent_fragment_downloads'],
+            'progress_hooks': [record_download],
+        }
+
+        if profile.get('http_chunk_size'):
+            ydl_opts['http_chunk_size'] = profile['http_chunk_size']
+
+        downloader = profile.get('external_downloader')
+        if downloader:
+            if shutil.which(downloader):
+                ydl_opts['external_downloader'] = {'default': downloader}
+                if EXTERNAL_DOWNLOADER_ARGS:
+                    ydl_opts['external_downloader_args'] = {
+                        downloader: shlex.split(EXTERNAL_DOWNLOADER_ARGS)}
+            else:
+                logger.warning(
+                    f"External downloader {downloader} not found, using the native downloader")
+
+        return ydl_opts
+
+    def _download(self, info, ydl_opts, quality, output_path, profile=None):
+        """Download a video from its info dict, returns the processed info and the downloaded file"""
+        if profile is None:
+            profile = self._get_download_profile(quality)
+
+        with stage('download'):
+            if profile.get('parallel_streams'):
+                result = self._download_streams_parallel(info, ydl_opts, output_path)
+                if result:
+                    return result
+
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.process_ie_result(info, download=True)
+                return info, ydl.prepare_filename(info)
+
+    def _download_streams_parallel(self, info, ydl_opts, output_path):
+        """
+        Download the video and audio streams at the same time and merge them.
+        Returns None if the selected format isn't a separate video and audio pair.
+        """
+        selection_opts = {
+            **ydl_opts,
+            'writesubtitles': False,
+            'writeautomaticsub': False,
+        }
+        with yt_dlp.YoutubeDL(selection_opts) as ydl:
+            selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+
+        requested_formats = selected.get('requested_formats') or []
+        if len(requested_formats) != 2:
+            return None
+
+        video_format = next(
+            (f for f in requested_formats if f.get('vcodec') != 'none'), requested_formats[0])
+        audio_format = next(
+            f for f in requested_formats if f is not video_format)
+
+        def download_stream(fmt, write_subtitles):
+            stream_opts = {
+                **ydl_opts,
+                'format': fmt['format_id'],
+                'outtmpl': {
+                    'default': f"{output_path}.f{fmt['format_id']}.%(ext)s",
+                    'subtitle': f"{output_path}.%(ext)s",
+                },
+                'writesubtitles': write_subtitles and ydl_opts.get('writesubtitles', False),
+                'writeautomaticsub': write_subtitles and ydl_opts.get('writeautomaticsub', False),
+            }
+            with yt_dlp.YoutubeDL(stream_opts) as ydl:
+                stream_info = ydl.process_ie_result(
+                    copy.deepcopy(info), download=True)
+                return ydl.prepare_filename(stream_info)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            video_future = executor.submit(download_stream, video_format, True)
+            audio_future = executor.submit(download_stream, audio_format, False)
+            video_file = video_future.result()
+            audio_file = audio_future.result()
+
+        merged_file = f"{output_path}.{selected.get('ext') or 'mkv'}"
+        try:
+            with stage('merge'):
+                subprocess.run([
+                    'ffmpeg', '-y', '-loglevel', 'error',
+                    '-i', video_file, '-i', audio_file,
+                    '-map', '0:v:0', '-map', '1:a:0',
+                    '-c', 'copy', merged_file
+                ], check=True, capture_output=True)
+        finally:
+            self._cleanup_files([video_file, audio_file])
+
+        return selected, merged_file
+
+    def _estimate_size(self, info, quality=None, audio_only=False, fraction=1.0):
+        """
+        Estimate the scratch space a download needs from the sizes in its info dict.
+        Video and audio are downloaded separately and then merged, so that's counted twice.
+        """
+        max_height = None
+        if quality and quality != 'max':
+            max_height = int(self.quality_presets.get(quality, self.quality_presets['medium']))
+
+        video_size = 0
+        audio_size = 0
+        for fmt in info.get('formats') or []:
+            size = fmt.get('filesize') or fmt.get('filesize_approx')
+            if not size:
+                continue
+
+            if fmt.get('vcodec') == 'none':
+                audio_size = max(audio_size, size)
+            elif not audio_only and (max_height is None or (fmt.get('height') or 0) <= max_height):
+                video_size = max(video_size, size)
+
+        estimate = (video_size + audio_size) * 2
+        if not estimate:
+            estimate = info.get('filesize_approx') or info.get('filesize') or SCRATCH_DEFAULT_ESTIMATE
+
+        return int(estimate * fraction)
+
+    def _reserve_scratch(self, size):
+        """Reserve scratch space for a download, returns the job and a base path to download to"""
+        with stage('scratch_wait'):
+            job = self.scratch.reserve(size)
+        return job, job.path / 'download'
+
+    def _get_stored_metadata(self, video_id, provider):
+        """Fetch the stored metadata for a video, returns None if it hasn't been stored"""
+        info_key = self.storage.get_key(video_id, provider, "json")
+        return self.storage.get_json(info_key)
+
+    def _store_metadata(self, info, output_path, video_id, provider):
+        """Save the minimal metadata for a video to storage, returns the metadata and its URL"""
+        minimal_info = self._extract_minimal_info(info)
+        minimal_info_file = f"{output_path}.info.json"
+
+        with open(minimal_info_file, 'w', encoding='utf-8') as f:
+            json.dump(minimal_info, f, ensure_ascii=False, indent=2)
+
+        try:
+            info_key = self.storage.get_key(video_id, provider, "json")
+            info_url = self.storage.upload_file(minimal_info_file, info_key)
+        finally:
+            self._cleanup_files([minimal_info_file])
+
+        return minimal_info, info_url
 
     def _extract_minimal_info(self, info):
         """Extract minimal metadata from video info"""
@@ -57,9 +495,47 @@ class VideoService:
             'id': info.get('id'),
             'title': info.get('title', ''),
             'description': info.get('description', ''),
-            'thumbnail': info.get('thumbnail')
+            'thumbnail': info.get('thumbnail') or self._best_thumbnail(info)
         }
 
+    def _best_thumbnail(self, info):
+        """The thumbnail yt-dlp would pick from an unprocessed info dict's list, the last after sorting"""
+        thumbnails = [thumbnail for thumbnail in info.get('thumbnails') or [] if thumbnail.get('url')]
+        if not thumbnails:
+            return None
+
+        def preference(thumbnail):
+            return tuple(-1 if thumbnail.get(field) is None else thumbnail[field]
+                         for field in ('preference', 'width', 'height'))
+
+        return max(reversed(thumbnails), key=preference)['url']
+
+    def _find_subtitle_track(self, info):
+        """The English WebVTT track in an info dict, preferring uploaded subtitles to automatic captions"""
+        for field in ('subtitles', 'automatic_captions'):
+            for track in (info.get(field) or {}).get(SUBTITLE_LANGUAGE) or []:
+                if track.get('ext') == 'vtt' and (track.get('url') or track.get('data')):
+                    return track
+        return None
+
+    def _download_subtitle_track(self, track, output_file):
+        """Download a single subtitle track to a file"""
+        if track.get('data'):
+            data = track['data'].encode('utf-8')
+        else:
+            ydl_opts = {
+                'quiet': not logger.isEnabledFor(logging.DEBUG),
+                'no_warnings': not logger.isEnabledFor(logging.DEBUG),
+            }
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                request = yt_dlp.networking.Request(track['url'], headers=track.get('http_headers') or {})
+                with ydl.urlopen(request) as response:
+                    data = response.read()
+
+        with open(output_file, 'wb') as f:
+            f.write(data)
+        return output_file
+
     def _find_file_with_extensions(self, base_path, extensions):
         """Find a file with any of the given extensions"""
         for ext in extensions:
@@ -84,6 +560,8 @@ class VideoService:
             provider = self._get_provider(url)
             video_id = self._extract_video_id(url, provider)
 
+            info = self._extract_info(url, provider, video_id)
+
             ydl_opts = {
                 'quiet': True,
                 'no_warnings': True,
@@ -93,7 +571,7 @@ class VideoService:
             }
 
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
+                info = ydl.process_ie_result(info, download=False)
                 formats = info.get('formats', [])
 
                 # Group formats by resolution
@@ -137,48 +615,50 @@ class VideoService:
             logger.error(f"Error getting formats: {str(e)}", exc_info=True)
             return {'success': False, 'error': str(e)}
 
-    def process_video(self, url, quality=None):
-        """Download, process and store video with the given quality"""
+    def process_video(self, url, quality=None, hls=False):
+        """Download, process and store video with the given quality, and optionally an HLS ladder for it"""
+        job = None
         try:
             # If no quality is specified, just get metadata and subtitles
             if quality is None:
                 return self.get_metadata_and_subtitles(url)
 
+            def keys_for(provider, video_id):
+                return [
+                    self.storage.get_key(video_id, provider, "mp4", quality),
+                    self.storage.get_key(video_id, provider, "json"),
+                    self.storage.get_key(video_id, provider, "vtt"),
+                    self.storage.get_key(video_id, provider, "m3u8", variant=quality),
+                ]
+
+            # One listing covers the video and its sibling files
             provider = self._get_provider(url)
             video_id = self._extract_video_id(url, provider)
+            provider, video_id, existing = self._find_stored(provider, video_id, keys_for)
 
-            # Check if video already exists in storage
-            video_key = self.storage.get_key(
-                video_id, provider, "mp4", quality)
-            if self.storage.file_exists(video_key):
-                logger.info(f"Video already exists in storage: {video_key}")
+            video_key = self.storage.get_key(video_id, provider, "mp4", quality)
+            stored = self.storage.resolve(video_key, existing)
+            record_cache_lookup('storage', stored is not None)
+            if stored:
+                return self._stored_video(provider, video_id, quality, hls, stored, existing)
 
-                # Get metadata and subtitle keys
-                info_key = self.storage.get_key(video_id, provider, "json")
-                subtitle_key = self.storage.get_key(video_id, provider, "vtt")
+            info = self._extract_info(url, provider, video_id)
 
-                # Get metadata
-                metadata_url = self.storage.get_public_url(info_key)
-                metadata_file = requests.get(metadata_url)
-                metadata = json.loads(metadata_file.text)
+            # Another URL for the same video may have stored it already, under the site's own ID
+            provider, video_id, canonical_existing = self._canonicalize(info, provider, video_id, keys_for)
+            if canonical_existing is not None:
+                existing = canonical_existing
+                video_key = self.storage.get_key(video_id, provider, "mp4", quality)
+                stored = self.storage.resolve(video_key, existing)
+                if stored:
+                    record_dedupe('download', stored.get('size'))
+                    return self._stored_video(provider, video_id, quality, hls, stored, existing)
 
-                return {
-                    'success': True,
-                    'video_id': video_id,
-                    'provider': provider,
-                    'quality': quality,
-                    'urls': {
-                        'video': self.storage.get_public_url(video_key),
-                        'info': metadata_url,
-                        'subtitle': self.storage.get_public_url(subtitle_key) if self.storage.file_exists(subtitle_key) else None,
-                    },
-                    'metadata': metadata
-                }
-
-            # Prepare download directory
-            os.makedirs(self.download_dir, exist_ok=True)
-            temp_id = str(uuid.uuid4())
-            output_path = Path(self.download_dir) / f"{temp_id}"
+            # Reserve space for the download and the remuxed copy, plus the ladder's segments if it's built,
+            # this waits if the disk is full
+            estimate = self._estimate_size(info, quality)
+            job, output_path = self._reserve_scratch(
+                estimate * (1 + FASTSTART + hls))
 
             # Configure download options based on quality
             format_spec = self.format_specs.get(
@@ -196,158 +676,543 @@ class VideoService:
                 'no_warnings': not logger.isEnabledFor(logging.DEBUG),
             }
 
+            ydl_opts.update(self._get_download_opts(quality))
+
             # Download the video
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                downloaded_file = ydl.prepare_filename(info)
-
-                # Find actual downloaded file
-                if not os.path.exists(downloaded_file):
-                    downloaded_file = self._find_file_with_extensions(
-                        os.path.splitext(downloaded_file)[0],
-                        ['.mp4', '.webm', '.mkv']
-                    )
-
-                # Find subtitle file
-                subtitle_file = self._find_file_with_extensions(
+            info, downloaded_file = self._download(info, ydl_opts, quality, output_path)
+
+            # Find actual downloaded file
+            if not os.path.exists(downloaded_file):
+                downloaded_file = self._find_file_with_extensions(
                     os.path.splitext(downloaded_file)[0],
-                    ['.en.vtt', '.vtt']
+                    ['.mp4', '.webm', '.mkv']
                 )
 
-                # Extract and save minimal metadata
-                minimal_info = self._extract_minimal_info(info)
-                minimal_info_file = f"{os.path.splitext(downloaded_file)[0]}.info.json"
+            # Find subtitle file
+            subtitle_file = self._find_file_with_extensions(
+                os.path.splitext(downloaded_file)[0],
+                ['.en.vtt', '.vtt']
+            )
 
-                with open(minimal_info_file, 'w', encoding='utf-8') as f:
-                    json.dump(minimal_info, f, ensure_ascii=False, indent=2)
+            # Extract and save minimal metadata
+            minimal_info = self._extract_minimal_info(info)
+            minimal_info_file = f"{os.path.splitext(downloaded_file)[0]}.info.json"
 
-                # Upload files to storage
-                video_key = self.storage.get_key(
-                    video_id, provider, "mp4", quality)
-                video_url = self.storage.upload_file(
-                    downloaded_file, video_key)
+            with open(minimal_info_file, 'w', encoding='utf-8') as f:
+                json.dump(minimal_info, f, ensure_ascii=False, indent=2)
 
-                info_key = self.storage.get_key(video_id, provider, "json")
-                info_url = self.storage.upload_file(
-                    minimal_info_file, info_key) if os.path.exists(minimal_info_file) else None
+            # Rewrite the video as an MP4 with its index first, so playback can start before it's all loaded
+            video_file = downloaded_file
+            if FASTSTART:
+                video_file, remux = remux_faststart(
+                    downloaded_file, f"{output_path}.faststart.mp4", preset=TRANSCODE_PRESET)
+                logger.info(f"Remuxed {video_key} for faststart: {remux}")
 
-                subtitle_url = None
-                if subtitle_file:
-                    subtitle_key = self.storage.get_key(
-                        video_id, provider, "vtt")
-                    subtitle_url = self.storage.upload_file(
-                        subtitle_file, subtitle_key)
+            # Upload files to storage, the video is stored by its content so mirrors of it are only stored once
+            video_url = self.storage.store_content(video_file, video_key)
 
-                # Clean up
-                self._cleanup_files(
-                    [downloaded_file, subtitle_file, minimal_info_file])
+            hls_url = self._build_hls(video_file, video_id, provider, quality, output_path) if hls else None
 
-                return {
-                    'success': True,
-                    'video_id': video_id,
-                    'provider': provider,
-                    'quality': quality,
-                    'urls': {
-                        'video': video_url,
-                        'info': info_url,
-                        'subtitle': subtitle_url,
-                    },
-                    'metadata': minimal_info
-                }
+            info_key = self.storage.get_key(video_id, provider, "json")
+            info_url = self.storage.upload_file(
+                minimal_info_file, info_key) if os.path.exists(minimal_info_file) else None
+
+            subtitle_url = None
+            if subtitle_file:
+                subtitle_key = self.storage.get_key(
+                    video_id, provider, "vtt")
+                subtitle_url = self.storage.upload_file(
+                    subtitle_file, subtitle_key)
+
+            # Clean up
+            self._cleanup_files(
+                [downloaded_file, video_file, subtitle_file, minimal_info_file])
+
+            urls = {
+                'video': video_url,
+                'info': info_url,
+                'subtitle': subtitle_url,
+            }
+            if hls_url:
+                urls['hls'] = hls_url
+
+            return {
+                'success': True,
+                'video_id': video_id,
+                'provider': provider,
+                'quality': quality,
+                'urls': urls,
+                'metadata': minimal_info
+            }
 
         except Exception as e:
             logger.error(f"Error processing video: {str(e)}", exc_info=True)
             return {'success': False, 'error': str(e)}
+        finally:
+            if job:
+                job.release()
 
-    def get_metadata_and_subtitles(self, url):
-        """Get metadata and subtitles for a video without downloading the video itself"""
+    def _stored_video(self, provider, video_id, quality, hls, stored, existing):
+        """The response for a video that's already stored, building its HLS ladder first if it's missing"""
+        video_key = self.storage.get_key(video_id, provider, "mp4", quality)
+        info_key = self.storage.get_key(video_id, provider, "json")
+        subtitle_key = self.storage.get_key(video_id, provider, "vtt")
+        hls_key = self.storage.get_key(video_id, provider, "m3u8", variant=quality)
+        logger.info(f"Video already exists in storage: {video_key}")
+
+        hls_url = self.storage.get_public_url(hls_key) if hls_key in existing else None
+        if hls and not hls_url:
+            # Build the ladder from the stored video rather than downloading it again
+            job, output_path = self._reserve_scratch(self.storage.get_size(stored['key']) * 2)
+            try:
+                stored_file = self._fetch_stored(stored['key'], f"{output_path}.mp4")
+                hls_url = self._build_hls(stored_file, video_id, provider, quality, output_path)
+            finally:
+                job.release()
+
+        urls = {
+            'video': self.storage.get_public_url(stored['key']),
+            'info': self.storage.get_public_url(info_key),
+            'subtitle': self.storage.get_public_url(subtitle_key) if subtitle_key in existing else None,
+        }
+        if hls_url:
+            urls['hls'] = hls_url
+
+        return {
+            'success': True,
+            'video_id': video_id,
+            'provider': provider,
+            'quality': quality,
+            'urls': urls,
+            'metadata': self.storage.get_json(info_key)
+        }
+
+    def _fetch_stored(self, key, output_file):
+        """Copy a file from storage to scratch space"""
+        response = self.storage.get_object(key)
+        if response is None:
+            raise FileNotFoundError(f"{key} isn't in storage")
+
+        body = response['Body']
+        try:
+            with open(output_file, 'wb') as f:
+                for chunk in body.iter_chunks(1024 * 1024):
+                    f.write(chunk)
+        finally:
+            body.close()
+        return output_file
+
+    def _build_hls(self, video_file, video_id, provider, quality, output_path):
+        """Build and store the HLS ladder for a quality, reusing renditions stored for other qualities"""
+        with stage('hls'):
+            return build_hls(
+                video_file, self.storage,
+                rendition_prefix=lambda name: self.storage.get_rendition_prefix(video_id, provider, name),
+                master_key=self.storage.get_key(video_id, provider, "m3u8", variant=quality),
+                max_height=int(self.quality_presets[quality]),
+                output_dir=f"{output_path}.hls",
+                segment_seconds=HLS_SEGMENT_SECONDS,
+                workers=HLS_WORKERS,
+                preset=TRANSCODE_PRESET,
+            )
+
+    def process_clip(self, url, start, end, quality=None):
+        """Download and store only the given time range of a video"""
+        job = None
         try:
+            quality = quality or 'medium'
+            variant = f"clip-{int(start * 1000)}-{int(end * 1000)}-{quality}"
+
+            def keys_for(provider, video_id):
+                return [self.storage.get_key(video_id, provider, "mp4", quality, variant=variant)]
+
             provider = self._get_provider(url)
             video_id = self._extract_video_id(url, provider)
+            provider, video_id, existing = self._find_stored(provider, video_id, keys_for)
+            [clip_key] = keys_for(provider, video_id)
 
-            # Check if metadata already exists in storage
-            info_key = self.storage.get_key(video_id, provider, "json")
-            subtitle_key = self.storage.get_key(video_id, provider, "vtt")
-
-            if self.storage.file_exists(info_key) and self.storage.file_exists(subtitle_key):
-                info_url = self.storage.get_public_url(info_key)
-                subtitle_url = self.storage.get_public_url(subtitle_key)
+            stored = self.storage.resolve(clip_key, existing)
+            if stored:
+                logger.info(f"Clip already exists in storage: {clip_key}")
+                return self._partial_result(video_id, provider, 'clip', {
+                    'video': self.storage.get_public_url(stored['key']),
+                }, self._get_stored_metadata(video_id, provider), quality=quality)
 
-                # download the info file
-                info_file = requests.get(info_url)
-                info = json.loads(info_file.text)
+            info = self._extract_info(url, provider, video_id)
 
-                return {
-                    'success': True,
-                    'video_id': video_id,
-                    'provider': provider,
-                    'urls': {
-                        'info': info_url,
-                        'subtitle': subtitle_url,
-                    },
-                    'metadata': info
-                }
+            provider, video_id, canonical_existing = self._canonicalize(info, provider, video_id, keys_for)
+            if canonical_existing is not None:
+                [clip_key] = keys_for(provider, video_id)
+                stored = self.storage.resolve(clip_key, canonical_existing)
+                if stored:
+                    record_dedupe('download', stored.get('size'))
+                    return self._partial_result(video_id, provider, 'clip', {
+                        'video': self.storage.get_public_url(stored['key']),
+                    }, self._get_stored_metadata(video_id, provider), quality=quality)
 
-            # Prepare download directory
-            os.makedirs(self.download_dir, exist_ok=True)
-            temp_id = str(uuid.uuid4())
-            output_path = Path(self.download_dir) / f"{temp_id}"
+            duration = info.get('duration')
+            fraction = min(1.0, (end - start) / duration + 0.05) if duration else 1.0
+            job, output_path = self._reserve_scratch(
+                self._estimate_size(info, quality, fraction=fraction))
 
-            # Configure download options
             ydl_opts = {
-                'skip_download': True,
-                'writesubtitles': True,
-                'writeautomaticsub': True,
-                'subtitleslangs': ['en'],
-                'subtitlesformat': 'vtt',
+                'format': self.format_specs.get(quality, self.format_specs['medium']),
+                'outtmpl': str(output_path) + '.%(ext)s',
+                # Only the fragments covering the range are downloaded
+                'download_ranges': yt_dlp.utils.download_range_func(None, [(start, end)]),
                 'writeinfojson': False,
+                'quiet': not logger.isEnabledFor(logging.DEBUG),
+                'no_warnings': not logger.isEnabledFor(logging.DEBUG),
+            }
+
+            profile = {**self._get_download_profile(quality), 'parallel_streams': False}
+            ydl_opts.update(self._get_download_opts(quality, profile))
+
+            info, downloaded_file = self._download(
+                info, ydl_opts, quality, output_path, profile)
+
+            if not os.path.exists(downloaded_file):
+                downloaded_file = self._find_file_with_extensions(
+                    str(output_path), ['.mp4', '.webm', '.mkv'])
+
+            try:
+                clip_url = self.storage.store_content(downloaded_file, clip_key)
+                metadata, info_url = self._store_metadata(
+                    info, output_path, video_id, provider)
+            finally:
+                self._cleanup_files([downloaded_file])
+
+            return self._partial_result(video_id, provider, 'clip', {
+                'video': clip_url,
+                'info': info_url,
+            }, metadata, quality=quality, start=start, end=end)
+
+        except Exception as e:
+            logger.error(f"Error processing clip: {str(e)}", exc_info=True)
+            return {'success': False, 'error': str(e)}
+        finally:
+            if job:
+                job.release()
+
+    def process_audio(self, url):
+        """Download and store only the audio track of a video"""
+        job = None
+        try:
+            def keys_for(provider, video_id):
+                return [self.storage.get_key(video_id, provider, "m4a")]
+
+            provider = self._get_provider(url)
+            video_id = self._extract_video_id(url, provider)
+            provider, video_id, existing = self._find_stored(provider, video_id, keys_for)
+            [audio_key] = keys_for(provider, video_id)
+
+            stored = self.storage.resolve(audio_key, existing)
+            if stored:
+                logger.info(f"Audio already exists in storage: {audio_key}")
+                return self._partial_result(video_id, provider, 'audio', {
+                    'audio': self.storage.get_public_url(stored['key']),
+                }, self._get_stored_metadata(video_id, provider))
+
+            info = self._extract_info(url, provider, video_id)
+
+            provider, video_id, canonical_existing = self._canonicalize(info, provider, video_id, keys_for)
+            if canonical_existing is not None:
+                [audio_key] = keys_for(provider, video_id)
+                stored = self.storage.resolve(audio_key, canonical_existing)
+                if stored:
+                    record_dedupe('download', stored.get('size'))
+                    return self._partial_result(video_id, provider, 'audio', {
+                        'audio': self.storage.get_public_url(stored['key']),
+                    }, self._get_stored_metadata(video_id, provider))
+            job, output_path = self._reserve_scratch(
+                self._estimate_size(info, audio_only=True))
+
+            ydl_opts = {
+                'format': 'bestaudio[ext=m4a]/bestaudio/best',
                 'outtmpl': str(output_path) + '.%(ext)s',
+                'postprocessors': [{
+                    'key': 'FFmpegExtractAudio',
+                    'preferredcodec': 'm4a',
+                }],
+                'writeinfojson': False,
                 'quiet': not logger.isEnabledFor(logging.DEBUG),
                 'no_warnings': not logger.isEnabledFor(logging.DEBUG),
             }
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                dummy_filename = ydl.prepare_filename(info)
-                base_filename = os.path.splitext(dummy_filename)[0]
+            profile = {**self._get_download_profile('low'), 'parallel_streams': False}
+            ydl_opts.update(self._get_download_opts('low', profile))
 
-                # Extract subtitles
-                ydl.process_info(info)
+            info, _ = self._download(info, ydl_opts, 'low', output_path, profile)
 
-                # Find subtitle file
-                subtitle_file = self._find_file_with_extensions(
-                    base_filename, ['.en.vtt', '.vtt'])
+            audio_file = self._find_file_with_extensions(str(output_path), ['.m4a'])
+            if not audio_file:
+                raise FileNotFoundError("The extracted audio file wasn't found.")
 
-                # Extract and save minimal metadata
-                minimal_info = self._extract_minimal_info(info)
-                minimal_info_file = f"{base_filename}.info.json"
+            try:
+                audio_url = self.storage.store_content(audio_file, audio_key)
+                metadata, info_url = self._store_metadata(
+                    info, output_path, video_id, provider)
+            finally:
+                self._cleanup_files([audio_file])
 
-                with open(minimal_info_file, 'w', encoding='utf-8') as f:
-                    json.dump(minimal_info, f, ensure_ascii=False, indent=2)
+            return self._partial_result(video_id, provider, 'audio', {
+                'audio': audio_url,
+                'info': info_url,
+            }, metadata)
 
-                # Upload files to storage
-                info_url = self.storage.upload_file(
-                    minimal_info_file, info_key) if os.path.exists(minimal_info_file) else None
+        except Exception as e:
+            logger.error(f"Error processing audio: {str(e)}", exc_info=True)
+            return {'success': False, 'error': str(e)}
+        finally:
+            if job:
+                job.release()
 
-                subtitle_url = None
-                if subtitle_file:
-                    subtitle_url = self.storage.upload_file(
-                        subtitle_file, subtitle_key)
+    def process_thumbnails(self, url, timestamps):
+        """Extract and store the nearest keyframe to each timestamp as a JPEG"""
+        job = None
+        try:
+            def keys_for(provider, video_id):
+                return [self.storage.get_key(video_id, provider, "jpg", variant=f"thumb-{int(timestamp * 1000)}")
+                        for timestamp in timestamps]
 
-                # Clean up
-                self._cleanup_files([subtitle_file, minimal_info_file])
+            def stored_urls(provider, video_id, existing, deduped=False):
+                """The URLs of the thumbnails that are stored, directly or through a ref, by timestamp"""
+                urls = {}
+                for timestamp, key in zip(timestamps, keys_for(provider, video_id)):
+                    stored = self.storage.resolve(key, existing)
+                    if stored:
+                        if deduped:
+                            record_dedupe('download', stored.get('size'))
+                        urls[timestamp] = self.storage.get_public_url(stored['key'])
+                return urls
 
-                return {
-                    'success': True,
-                    'video_id': video_id,
-                    'provider': provider,
-                    'urls': {
-                        'info': info_url,
-                        'subtitle': subtitle_url,
-                    },
-                    'metadata': minimal_info
+            provider = self._get_provider(url)
+            video_id = self._extract_video_id(url, provider)
+            provider, video_id, existing = self._find_stored(provider, video_id, keys_for)
+            urls = stored_urls(provider, video_id, existing)
+
+            if any(timestamp not in urls for timestamp in timestamps):
+                info = self._extract_info(url, provider, video_id)
+
+                provider, video_id, canonical_existing = self._canonicalize(info, provider, video_id, keys_for)
+                if canonical_existing is not None:
+                    urls = stored_urls(provider, video_id, canonical_existing, deduped=True)
+                missing = [timestamp for timestamp in dict.fromkeys(timestamps) if timestamp not in urls]
+
+            if urls.keys() >= set(timestamps):
+                metadata = self._get_stored_metadata(video_id, provider)
+            else:
+                thumbnail_keys = dict(zip(timestamps, keys_for(provider, video_id)))
+
+                # Pick a single video stream, ffmpeg seeks in it with range requests
+                ydl_opts = {
+                    'format': 'bestvideo[height<=720]/best[height<=720]/best',
+                    'quiet': True,
+                    'no_warnings': True,
                 }
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    info = ydl.process_ie_result(info, download=False)
+
+                stream = (info.get('requested_formats') or [info])[0]
+                job, output_path = self._reserve_scratch(
+                    len(missing) * THUMBNAIL_ESTIMATE)
+
+                with ThreadPoolExecutor(max_workers=min(4, len(missing))) as executor:
+                    futures = {
+                        timestamp: executor.submit(
+                            self._extract_keyframe, stream, timestamp,
+                            f"{output_path}-{int(timestamp * 1000)}.jpg")
+                        for timestamp in missing
+                    }
+
+                    for timestamp, future in futures.items():
+                        thumbnail_file = future.result()
+                        try:
+                            # Stored by content like the other artifacts, so mirrors share identical frames
+                            urls[timestamp] = self.storage.store_content(
+                                thumbnail_file, thumbnail_keys[timestamp])
+                        finally:
+                            self._cleanup_files([thumbnail_file])
+
+                metadata = self._extract_minimal_info(info)
+
+            return self._partial_result(video_id, provider, 'thumbnail', {
+                'thumbnails': [
+                    {'timestamp': timestamp, 'url': urls[timestamp]}
+                    for timestamp in timestamps
+                ],
+            }, metadata)
+
+        except Exception as e:
+            logger.error(f"Error processing thumbnails: {str(e)}", exc_info=True)
+            return {'success': False, 'error': str(e)}
+        finally:
+            if job:
+                job.release()
+
+    def _extract_keyframe(self, stream, timestamp, output_file):
+        """Use ffmpeg to grab the keyframe at a timestamp without downloading the whole stream"""
+        headers = ''.join(
+            f"{key}: {value}\r\n" for key, value in (stream.get('http_headers') or {}).items())
+
+        command = ['ffmpeg', '-y', '-loglevel', 'error', '-skip_frame', 'nokey',
+                   '-ss', str(timestamp)]
+        if headers:
+            command += ['-headers', headers]
+        command += ['-i', stream['url'], '-frames:v', '1', '-q:v', '2', output_file]
+
+        with stage('keyframe'):
+            subprocess.run(command, check=True, capture_output=True)
+        if not os.path.exists(output_file):
+            raise FileNotFoundError(f"No keyframe found at {timestamp}s.")
+        return output_file
+
+    def _partial_result(self, video_id, provider, mode, urls, metadata, **extra):
+        """Build the response for a partial artifact"""
+        return {
+            'success': True,
+            'video_id': video_id,
+            'provider': provider,
+            'mode': mode,
+            **extra,
+            'urls': urls,
+            'metadata': metadata,
+        }
+
+    def _write_subtitles_processed(self, info, output_path):
+        """Process an info dict with yt-dlp to write its English subtitles, returns the info and the file"""
+        ydl_opts = {
+            'skip_download': True,
+            'writesubtitles': True,
+            'writeautomaticsub': True,
+            'subtitleslangs': [SUBTITLE_LANGUAGE],
+            'subtitlesformat': 'vtt',
+            'writeinfojson': False,
+            'extractor_args': METADATA_EXTRACTOR_ARGS,
+            'ignore_no_formats_error': True,
+            'outtmpl': str(output_path) + '.%(ext)s',
+            'quiet': not logger.isEnabledFor(logging.DEBUG),
+            'no_warnings': not logger.isEnabledFor(logging.DEBUG),
+        }
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            for extractor in self.extractors:
+                ydl.add_info_extractor(extractor())
+            with stage('subtitles'):
+                info = ydl.process_ie_result(info, download=True)
+            base_filename = os.path.splitext(ydl.prepare_filename(info))[0]
+
+        return info, self._find_file_with_extensions(
+            base_filename, [f'.{SUBTITLE_LANGUAGE}.vtt', '.vtt'])
+
+    def _stored_metadata(self, provider, video_id, existing):
+        """
+        The response for a video whose metadata is stored, along with its subtitles or a remembered result
+        that it has none. Returns None if it has to be fetched.
+        """
+        info_key = self.storage.get_key(video_id, provider, "json")
+        subtitle_key = self.storage.get_key(video_id, provider, "vtt")
+        if info_key not in existing:
+            return None
+
+        if subtitle_key not in existing:
+            no_subtitles = self.negative_cache.get(f"{self._get_cache_key(provider, video_id)}:no_subtitles")
+            record_cache_lookup('negative', no_subtitles is not None)
+            if no_subtitles is None:
+                return None
+
+        return {
+            'success': True,
+            'video_id': video_id,
+            'provider': provider,
+            'urls': {
+                'info': self.storage.get_public_url(info_key),
+                'subtitle': self.storage.get_public_url(subtitle_key) if subtitle_key in existing else None,
+            },
+            # Read the info file straight from storage
+            'metadata': self.storage.get_json(info_key)
+        }
+
+    def get_metadata_and_subtitles(self, url):
+        """
+        Get metadata and subtitles for a video without downloading the video itself. Formats aren't
+        resolved and only the English subtitle track is fetched, and videos without one are remembered
+        so later calls are served from storage.
+        """
+        job = None
+        try:
+            def keys_for(provider, video_id):
+                return [self.storage.get_key(video_id, provider, "json"),
+                        self.storage.get_key(video_id, provider, "vtt")]
+
+            # Check if metadata already exists in storage
+            provider = self._get_provider(url)
+            video_id = self._extract_video_id(url, provider)
+            provider, video_id, existing = self._find_stored(provider, video_id, keys_for)
+
+            stored = self._stored_metadata(provider, video_id, existing)
+            record_cache_lookup('storage', stored is not None)
+            if stored:
+                return stored
+
+            info = self._extract_metadata(url, provider, video_id)
+
+            # Another URL for the same video may have stored it already, under the site's own ID
+            provider, video_id, canonical_existing = self._canonicalize(info, provider, video_id, keys_for)
+            if canonical_existing is not None:
+                stored = self._stored_metadata(provider, video_id, canonical_existing)
+                if stored:
+                    return stored
+
+            info_key, subtitle_key = keys_for(provider, video_id)
+            no_subtitles_key = f"{self._get_cache_key(provider, video_id)}:no_subtitles"
+
+            # Only subtitles and metadata are written, so this is a small reservation
+            job, output_path = self._reserve_scratch(SUBTITLE_ESTIMATE)
+
+            if info.get('_type', 'video') == 'video':
+                track = self._find_subtitle_track(info)
+                with stage('subtitles'):
+                    subtitle_file = self._download_subtitle_track(
+                        track, f"{output_path}.{SUBTITLE_LANGUAGE}.vtt") if track else None
+            else:
+                # The extractor handed off to another one, so let yt-dlp resolve it and write the subtitles
+                info, subtitle_file = self._write_subtitles_processed(info, output_path)
+
+            # Extract and save minimal metadata
+            minimal_info = self._extract_minimal_info(info)
+            minimal_info_file = f"{output_path}.info.json"
+
+            with open(minimal_info_file, 'w', encoding='utf-8') as f:
+                json.dump(minimal_info, f, ensure_ascii=False, indent=2)
+
+            # Upload files to storage
+            info_url = self.storage.upload_file(minimal_info_file, info_key)
+
+            subtitle_url = None
+            if subtitle_file:
+                subtitle_url = self.storage.upload_file(
+                    subtitle_file, subtitle_key)
+            else:
+                self.negative_cache.set(no_subtitles_key, True)
+
+            # Clean up
+            self._cleanup_files([subtitle_file, minimal_info_file])
+
+            return {
+                'success': True,
+                'video_id': video_id,
+                'provider': provider,
+                'urls': {
+                    'info': info_url,
+                    'subtitle': subtitle_url,
+                },
+                'metadata': minimal_info
+            }
 
         except Exception as e:
             logger.error(f"Error getting metadata: {str(e)}", exc_info=True)
             return {'success': False, 'error': str(e)}
+        finally:
+            if job:
+                job.release()
@@ -0,0 +1,16 @@
+class ClosingIterator:
+    """Wraps a WSGI response to run a callback once the server is done with it"""
+
+    def __init__(self, iterable, callback):
+        self.iterable = iterable
+        self.callback = callback
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def close(self):
+        try:
+            if hasattr(self.iterable, 'close'):
+                self.iterable.close()
+        finally:
+            self.callback()
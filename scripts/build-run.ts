@@ -80,7 +80,8 @@ async function buildAndRun() {
 
 		// Build Docker image
 		console.log("\nBuilding Docker image...");
-		const buildCommand = `cd packages/${packageName} && docker build -t ${config.slug} .`;
+		// Built from the repository root so services can copy in the shared packages they depend on
+		const buildCommand = `docker build -t ${config.slug} -f packages/${packageName}/Dockerfile .`;
 		const { stdout: buildOutput } = await execAsync(buildCommand);
 		console.log(buildOutput);
 